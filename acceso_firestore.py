@@ -0,0 +1,189 @@
+import os
+import time
+import threading
+from datetime import datetime, timezone
+
+import metricas
+
+try:
+    from google.api_core import exceptions as gexc
+    from google.api_core import retry as greintento
+    from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+except ImportError:  # sin google-api-core solo cuentan los errores de red de Python
+    gexc = greintento = DatetimeWithNanoseconds = None
+
+# =====================================================
+# 🔹 ACCESO A FIRESTORE CON PLAZOS Y CORTACIRCUITOS
+# Cada llamada lleva un plazo (FIRESTORE_PLAZO segundos, reintentos
+# incluidos) y pasa por un cortacircuitos por colección:
+#   cerrado     -> se llama a Firestore normalmente
+#   abierto     -> tras CIRCUITO_FALLOS fallas seguidas no se llama: la app
+#                  va directo al almacén local durante CIRCUITO_ESPERA segundos
+#   semiabierto -> pasada la espera, una sola llamada de prueba decide si
+#                  se vuelve a cerrar o se abre otra vez
+# Solo cuentan como falla los errores del servicio (caído, plazo vencido,
+# 5xx, cuota) y las llamadas más lentas que el plazo; NotFound y demás
+# errores de la petición no abren el circuito.
+# =====================================================
+
+PLAZO = float(os.environ.get('FIRESTORE_PLAZO', 5))
+CIRCUITO_FALLOS = int(os.environ.get('CIRCUITO_FALLOS', 3))
+CIRCUITO_ESPERA = float(os.environ.get('CIRCUITO_ESPERA', 30))
+
+CERRADO, SEMIABIERTO, ABIERTO = 'cerrado', 'semiabierto', 'abierto'
+_CODIGOS = {CERRADO: 0, SEMIABIERTO: 1, ABIERTO: 2}
+
+_FALLAS = (TimeoutError, ConnectionError)
+if gexc is not None:
+    _FALLAS += (gexc.ServerError, gexc.TooManyRequests, gexc.RetryError)
+
+# La función que se etiqueta en las métricas de Firestore es la de la app, no la de esta capa
+metricas.MODULOS_INTERMEDIOS.add(__name__)
+
+
+class CircuitoAbierto(Exception):
+    """Firestore está marcado como caído para esta colección; usar los datos locales."""
+
+
+class Circuito:
+    def __init__(self, coleccion):
+        self.coleccion = coleccion
+        self.estado = CERRADO
+        self.fallos = 0
+        self.abierto_desde = 0.0
+        self.probando = False
+        self._lock = threading.Lock()
+
+    def _cambiar(self, estado, motivo=''):
+        """Llamar con _lock tomado."""
+        if estado == self.estado:
+            return
+        self.estado = estado
+        metricas.contar('firestore_circuito_cambios_total', coleccion=self.coleccion, estado=estado)
+        iconos = {ABIERTO: '🔴', SEMIABIERTO: '🟡', CERRADO: '🟢'}
+        print(f"{iconos[estado]} Circuito de Firestore '{self.coleccion}': {estado}{f' ({motivo})' if motivo else ''}")
+
+    def abierto(self):
+        """True si no se debe intentar Firestore (abierto y aún no toca probar)."""
+        with self._lock:
+            if self.estado == ABIERTO:
+                return time.time() - self.abierto_desde < CIRCUITO_ESPERA
+            return self.estado == SEMIABIERTO and self.probando
+
+    def permitir(self):
+        """Reserva el paso para una llamada; en semiabierto pasa una sola a la vez."""
+        with self._lock:
+            if self.estado == ABIERTO:
+                if time.time() - self.abierto_desde < CIRCUITO_ESPERA:
+                    return False
+                self._cambiar(SEMIABIERTO, 'probando')
+            if self.estado == SEMIABIERTO:
+                if self.probando:
+                    return False
+                self.probando = True
+            return True
+
+    def exito(self):
+        with self._lock:
+            self.fallos = 0
+            self.probando = False
+            self._cambiar(CERRADO)
+
+    def fallo(self, motivo):
+        with self._lock:
+            self.fallos += 1
+            self.probando = False
+            if self.estado == SEMIABIERTO or self.fallos >= CIRCUITO_FALLOS:
+                self.abierto_desde = time.time()
+                self._cambiar(ABIERTO, motivo)
+
+
+_circuitos = {}
+_circuitos_lock = threading.Lock()
+
+
+def circuito(coleccion):
+    with _circuitos_lock:
+        c = _circuitos.get(coleccion)
+        if c is None:
+            c = _circuitos[coleccion] = Circuito(coleccion)
+        return c
+
+
+def disponible(coleccion):
+    """False mientras el circuito de `coleccion` esté abierto."""
+    return not circuito(coleccion).abierto()
+
+
+def _reintento():
+    if greintento is None:
+        return None
+    return greintento.Retry(predicate=greintento.if_transient_error,
+                            initial=0.1, maximum=1.0, multiplier=2.0, timeout=PLAZO)
+
+
+def es_falla_del_servicio(error):
+    return isinstance(error, _FALLAS)
+
+
+def llamar(coleccion, metodo, *args, **kwargs):
+    """
+    metodo(*args, timeout=PLAZO, retry=...) bajo el circuito de `coleccion`.
+    Los stream()/get_all() se devuelven como lista, leída dentro del plazo.
+    Lanza CircuitoAbierto sin llamar si el circuito no deja pasar.
+    """
+    c = circuito(coleccion)
+    if not c.permitir():
+        metricas.contar('firestore_circuito_rechazos_total', coleccion=coleccion)
+        raise CircuitoAbierto(f"Firestore no disponible para '{coleccion}'")
+    kwargs.setdefault('timeout', PLAZO)
+    if greintento is not None:
+        kwargs.setdefault('retry', _reintento())
+    inicio = time.perf_counter()
+    try:
+        resultado = metodo(*args, **kwargs)
+        if _es_iterador(resultado):
+            resultado = list(resultado)
+    except Exception as e:
+        if es_falla_del_servicio(e):
+            c.fallo(type(e).__name__)
+        else:
+            c.exito()
+        raise
+    duracion = time.perf_counter() - inicio
+    if duracion > PLAZO:
+        c.fallo(f"respuesta lenta ({duracion:.1f}s)")
+    else:
+        c.exito()
+    return resultado
+
+
+def _es_iterador(valor):
+    return hasattr(valor, '__next__') and not isinstance(valor, (list, tuple, dict))
+
+
+def version_remota(update_time):
+    """update_time de un documento como texto RFC 3339 (con nanosegundos si los trae)."""
+    if hasattr(update_time, 'rfc3339'):
+        return update_time.rfc3339()
+    return update_time.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def leer_version_remota(texto):
+    """Inverso de version_remota, para write_option(last_update_time=...). ValueError si no es válido."""
+    if DatetimeWithNanoseconds is not None:
+        return DatetimeWithNanoseconds.from_rfc3339(texto)
+    return datetime.strptime(texto, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc)
+
+
+def estados():
+    with _circuitos_lock:
+        return {nombre: c.estado for nombre, c in _circuitos.items()}
+
+
+metricas.definir('firestore_circuito_cambios_total', 'counter', 'Cambios de estado del circuito de Firestore',
+                 ('coleccion', 'estado'))
+metricas.definir('firestore_circuito_rechazos_total', 'counter',
+                 'Llamadas que no se hicieron porque el circuito estaba abierto', ('coleccion',))
+metricas.registrar_medidor('firestore_circuito_estado', 'Estado del circuito (0 cerrado, 1 semiabierto, 2 abierto)',
+                           lambda: {k: _CODIGOS[v] for k, v in estados().items()}, etiqueta='coleccion')
@@ -0,0 +1,326 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+
+# =====================================================
+# 🔹 ALMACÉN LOCAL (modo offline)
+# SQLite en modo WAL: escrituras por registro, búsquedas indexadas por id y
+# correo, y commits atómicos aunque haya varios workers de gunicorn.
+# Los productos.json / usuarios.json se importan la primera vez y se pueden
+# volver a exportar:  python almacen_local.py exportar | importar
+# =====================================================
+
+LOCAL_DB = os.environ.get('LOCAL_DB', 'local.db')
+PRODUCTOS_JSON = 'productos.json'
+USUARIOS_JSON = 'usuarios.json'
+
+_local = threading.local()
+_init_lock = threading.Lock()
+
+
+class VersionDistinta(Exception):
+    """El registro cambió (o se borró) desde la versión que se leyó."""
+
+
+def _conexion():
+    """Una conexión por hilo y por proceso (las conexiones no se comparten tras un fork)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+    conn = sqlite3.connect(LOCAL_DB, timeout=15, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=15000")
+    _local.conn, _local.pid = conn, os.getpid()
+    with _init_lock:
+        _crear_esquema(conn)
+    return conn
+
+
+def _crear_esquema(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS productos (
+            id TEXT PRIMARY KEY,
+            posicion INTEGER NOT NULL,
+            datos TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 1,
+            actualizado REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_productos_posicion ON productos (posicion);
+        CREATE TABLE IF NOT EXISTS usuarios (
+            correo TEXT PRIMARY KEY,
+            datos TEXT NOT NULL,
+            actualizado REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            clave TEXT PRIMARY KEY,
+            valor TEXT
+        );
+        CREATE TABLE IF NOT EXISTS diario (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            coleccion TEXT NOT NULL,
+            doc_id TEXT NOT NULL,
+            operacion TEXT NOT NULL,
+            datos TEXT,
+            base TEXT,
+            momento REAL NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'pendiente',
+            intentos INTEGER NOT NULL DEFAULT 0,
+            ultimo_error TEXT,
+            resuelto REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_diario_estado ON diario (estado, id);
+    """)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        importado = conn.execute("SELECT valor FROM meta WHERE clave = 'importado_json'").fetchone()
+        if not importado:
+            _importar_json(conn)
+            conn.execute("INSERT INTO meta (clave, valor) VALUES ('importado_json', ?)", (str(time.time()),))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+class _Transaccion:
+    """BEGIN IMMEDIATE (o DEFERRED) ... COMMIT/ROLLBACK sobre la conexión del hilo."""
+
+    def __init__(self, modo='IMMEDIATE'):
+        self.modo = modo
+
+    def __enter__(self):
+        self.conn = _conexion()
+        self.conn.execute(f"BEGIN {self.modo}")
+        return self.conn
+
+    def __exit__(self, tipo, valor, tb):
+        self.conn.execute("ROLLBACK" if tipo else "COMMIT")
+        return False
+
+
+def transaccion():
+    return _Transaccion()
+
+
+def lectura():
+    """Transacción solo de lectura: ve una foto consistente sin tomar el lock de escritura."""
+    return _Transaccion('DEFERRED')
+
+
+def _leer_json(ruta):
+    if not os.path.exists(ruta):
+        return []
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, list) else []
+    except Exception as e:
+        print(f"⚠️  Error leyendo {ruta}: {e}")
+        return []
+
+
+def _importar_json(conn):
+    ahora = time.time()
+    for i, p in enumerate(_leer_json(PRODUCTOS_JSON)):
+        if not isinstance(p, dict):
+            continue
+        pid = str(p.get('id', i + 1))
+        p = dict(p, id=pid)
+        conn.execute(
+            "INSERT OR REPLACE INTO productos (id, posicion, datos, actualizado) VALUES (?, ?, ?, ?)",
+            (pid, i, json.dumps(p, ensure_ascii=False), ahora),
+        )
+    for u in _leer_json(USUARIOS_JSON):
+        if not isinstance(u, dict) or not u.get('correo'):
+            continue
+        conn.execute(
+            "INSERT OR REPLACE INTO usuarios (correo, datos, actualizado) VALUES (?, ?, ?)",
+            (u['correo'].strip().lower(), json.dumps(u, ensure_ascii=False), ahora),
+        )
+
+
+# ----------------------------
+# PRODUCTOS
+# ----------------------------
+def _producto_desde_fila(fila):
+    return json.loads(fila['datos'])
+
+
+def listar_productos():
+    filas = _conexion().execute("SELECT datos FROM productos ORDER BY posicion, id").fetchall()
+    return [_producto_desde_fila(f) for f in filas]
+
+
+def obtener_producto(pid):
+    fila = _conexion().execute("SELECT datos FROM productos WHERE id = ?", (str(pid),)).fetchone()
+    return _producto_desde_fila(fila) if fila else None
+
+
+def obtener_producto_con_version(pid):
+    """(producto, versión) leídos juntos, para editar con control de concurrencia; (None, None) si no está."""
+    fila = _conexion().execute("SELECT datos, version FROM productos WHERE id = ?", (str(pid),)).fetchone()
+    return (_producto_desde_fila(fila), fila['version']) if fila else (None, None)
+
+
+def obtener_productos(ids):
+    """Varios productos por id con una sola consulta."""
+    ids = [str(i) for i in ids]
+    if not ids:
+        return []
+    marcas = ','.join('?' * len(ids))
+    filas = _conexion().execute(f"SELECT datos FROM productos WHERE id IN ({marcas})", ids).fetchall()
+    return [_producto_desde_fila(f) for f in filas]
+
+
+def _verificar_version(conn, pid, version):
+    if version is None:
+        return
+    fila = conn.execute("SELECT version FROM productos WHERE id = ?", (pid,)).fetchone()
+    if not fila or fila[0] != int(version):
+        raise VersionDistinta(f"El producto {pid} ya no está en la versión {version}")
+
+
+def _upsert_producto(conn, producto, version=None):
+    p = dict(producto)
+    p.pop('version', None)
+    pid = str(p['id'])
+    _verificar_version(conn, pid, version)
+    conn.execute(
+        """
+        INSERT INTO productos (id, posicion, datos, actualizado)
+        VALUES (?, (SELECT COALESCE(MAX(posicion), -1) + 1 FROM productos), ?, ?)
+        ON CONFLICT(id) DO UPDATE SET datos = excluded.datos, version = version + 1,
+                                      actualizado = excluded.actualizado
+        """,
+        (pid, json.dumps(p, ensure_ascii=False), time.time()),
+    )
+    return conn.execute("SELECT version FROM productos WHERE id = ?", (pid,)).fetchone()[0]
+
+
+def guardar_producto(producto, conn=None, version=None):
+    """
+    Inserta o actualiza un producto. Devuelve la nueva versión. Con `version`,
+    lanza VersionDistinta si el producto guardado no está en esa versión.
+    """
+    if conn is not None:
+        return _upsert_producto(conn, producto, version)
+    with transaccion() as conn:
+        return _upsert_producto(conn, producto, version)
+
+
+def _borrar_producto(conn, pid, version=None):
+    _verificar_version(conn, str(pid), version)
+    return conn.execute("DELETE FROM productos WHERE id = ?", (str(pid),)).rowcount > 0
+
+
+def eliminar_producto(pid, conn=None, version=None):
+    if conn is not None:
+        return _borrar_producto(conn, pid, version)
+    with transaccion() as conn:
+        return _borrar_producto(conn, pid, version)
+
+
+def reemplazar_productos(productos):
+    """Reemplaza todo el catálogo local en una sola transacción."""
+    with transaccion() as conn:
+        conn.execute("DELETE FROM productos")
+        ahora = time.time()
+        for i, p in enumerate(productos):
+            p = dict(p)
+            p.pop('version', None)
+            conn.execute(
+                "INSERT OR REPLACE INTO productos (id, posicion, datos, actualizado) VALUES (?, ?, ?, ?)",
+                (str(p['id']), i, json.dumps(p, ensure_ascii=False), ahora),
+            )
+
+
+# ----------------------------
+# USUARIOS
+# ----------------------------
+def listar_usuarios():
+    filas = _conexion().execute("SELECT datos FROM usuarios ORDER BY rowid").fetchall()
+    return [json.loads(f['datos']) for f in filas]
+
+
+def obtener_usuario(correo):
+    fila = _conexion().execute(
+        "SELECT datos FROM usuarios WHERE correo = ?", ((correo or '').strip().lower(),)
+    ).fetchone()
+    return json.loads(fila['datos']) if fila else None
+
+
+def _upsert_usuario(conn, usuario):
+    correo = (usuario.get('correo') or '').strip().lower()
+    if not correo:
+        raise ValueError("El usuario necesita correo")
+    conn.execute(
+        """
+        INSERT INTO usuarios (correo, datos, actualizado) VALUES (?, ?, ?)
+        ON CONFLICT(correo) DO UPDATE SET datos = excluded.datos, actualizado = excluded.actualizado
+        """,
+        (correo, json.dumps(usuario, ensure_ascii=False), time.time()),
+    )
+
+
+def guardar_usuario(usuario, conn=None):
+    if conn is not None:
+        return _upsert_usuario(conn, usuario)
+    with transaccion() as conn:
+        _upsert_usuario(conn, usuario)
+
+
+def actualizar_usuario(correo, cambios):
+    """Aplica cambios a un usuario dentro de una transacción. Devuelve False si no existe."""
+    correo = (correo or '').strip().lower()
+    with transaccion() as conn:
+        fila = conn.execute("SELECT datos FROM usuarios WHERE correo = ?", (correo,)).fetchone()
+        if not fila:
+            return False
+        u = json.loads(fila['datos'])
+        u.update(cambios)
+        conn.execute(
+            "UPDATE usuarios SET datos = ?, actualizado = ? WHERE correo = ?",
+            (json.dumps(u, ensure_ascii=False), time.time(), correo),
+        )
+        return True
+
+
+# ----------------------------
+# IMPORTAR / EXPORTAR JSON
+# ----------------------------
+def _escribir_json_atomico(ruta, data):
+    tmp = f"{ruta}.tmp-{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, ruta)
+
+
+def exportar_json():
+    productos = listar_productos()
+    _escribir_json_atomico(PRODUCTOS_JSON, productos)
+    _escribir_json_atomico(USUARIOS_JSON, listar_usuarios())
+    print(f"📤 Exportados {len(productos)} productos a {PRODUCTOS_JSON} y usuarios a {USUARIOS_JSON}")
+
+
+def importar_json():
+    """Vuelve a cargar los JSON sobre el almacén (upsert, no borra registros)."""
+    with transaccion() as conn:
+        _importar_json(conn)
+    print(f"📥 Importados {PRODUCTOS_JSON} y {USUARIOS_JSON}")
+
+
+if __name__ == '__main__':
+    accion = sys.argv[1] if len(sys.argv) > 1 else ''
+    if accion == 'exportar':
+        exportar_json()
+    elif accion == 'importar':
+        importar_json()
+    else:
+        print("Uso: python almacen_local.py exportar | importar")
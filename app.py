@@ -1,41 +1,72 @@
+import time
+_INICIO_IMPORT = time.perf_counter()  # para medir el arranque del worker
+
 import os
 import json
 import uuid
-import smtplib
-from firebase_admin import auth
-from email.mime.text import MIMEText
+import shutil
+import math
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from bisect import bisect_right
 from datetime import datetime
 from functools import wraps
 from flask import Flask, render_template, redirect, url_for, request, session, flash, abort
-from flask import jsonify
+from flask import jsonify, send_file, g, Response, stream_with_context
 from flask_bcrypt import Bcrypt
 from werkzeug.utils import secure_filename
+from werkzeug.datastructures import FileStorage
+from markupsafe import Markup
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
 from dotenv import load_dotenv
 load_dotenv()  # Carga variables de .env
 
+import correo
+import almacen_local
+import modelos
+import glb
+import imagenes
+import estaticos
+import fragmentos
+import metricas
+import acceso_firestore
+import diario_offline
+import catalogo_masivo
+import cambios_productos
+from catalogo_indices import construir_indices, filtrar, ordenar, facetas, ORDENES
 
-# Verificamos si se están leyendo las variables de entorno
-print("📧 MAIL_USER:", os.getenv("MAIL_USER"))
-print("🔑 MAIL_PASS:", os.getenv("MAIL_PASS"))
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'clave_secreta_local')  # Importante para sesiones
 
 # -------- Firebase opcional --------
+# db y bucket se conectan al primer uso en cada proceso (ver firebase_config)
 db = None
 bucket = None
 try:
     from firebase_config import db as _db, bucket as _bucket
-    db = _db
+    # Con METRICAS=1 cada llamada queda contada por función (ver metricas)
+    db = metricas.instrumentar_firestore(_db)
     bucket = _bucket
-    print("✅ Firebase disponible")
 except Exception as e:
     print(f"⚠️  Firebase no disponible (modo offline): {e}")
 
+# El diario offline sube con el cliente actual (se lee en cada vuelta)
+diario_offline.configurar(lambda: db)
+
+def _firestore(coleccion):
+    """
+    True si hay que intentar Firestore para `coleccion`: hay conexión y su
+    circuito no está abierto (ver acceso_firestore). Si no, directo a lo local.
+    """
+    return acceso_firestore.disponible(coleccion) and bool(db)
+
 # -------- Config básica --------
 UPLOAD_FOLDER = 'static/modelos_ra'
 ALLOWED_EXTENSIONS = {'glb', 'gltf', 'fbx', 'obj'}
+# Con GLB_CUANTIZAR=1, normales y UVs cuantizadas (KHR_mesh_quantization, con pérdida)
+GLB_CUANTIZAR = os.environ.get('GLB_CUANTIZAR', '0') == '1'
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -44,33 +75,80 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 bcrypt = Bcrypt(app)
 serializer = URLSafeTimedSerializer(app.secret_key)
 
-# -------- Función de envío de correo (smtplib) --------
-MAIL_USER = os.environ.get('MAIL_USER')
-MAIL_PASS = os.environ.get('MAIL_PASS')
-
+# -------- Envío de correo (bandeja de salida en segundo plano) --------
 def enviar_email(destino: str, asunto: str, html_mensaje: str) -> bool:
-    remitente = MAIL_USER
-    if not remitente or not MAIL_PASS:
+    """Encola el correo; el despachador de correo.py lo envía fuera del request."""
+    if not correo.configurado():
         print("⚠️ Mail no configurado: configura MAIL_USER y MAIL_PASS como variables de entorno.")
         return False
-    msg = MIMEText(html_mensaje, 'html', 'utf-8')
-    msg['Subject'] = asunto
-    msg['From'] = remitente
-    msg['To'] = destino
-    try:
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(remitente, MAIL_PASS)
-            server.sendmail(remitente, [destino], msg.as_string())
-        print(f"✅ Correo enviado a {destino}")
+    try:
+        correo_id = correo.encolar(destino, asunto, html_mensaje)
+        print(f"📨 Correo #{correo_id} encolado para {destino}")
         return True
     except Exception as e:
-        print(f"❌ Error enviando correo a {destino}: {e}")
+        print(f"❌ Error encolando correo a {destino}: {e}")
         return False
 
 # -------- Helpers --------
 def allowed_file(filename: str) -> bool:
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def guardar_modelo(archivo, nombre_archivo):
+    """
+    Guarda el modelo subido y genera sus variantes comprimidas una sola vez.
+    Los .glb se validan, se miden y se guardan optimizados; en ese caso
+    devuelve {'medidas': ..., 'stats': ...}. Lanza glb.ModeloInvalido si el
+    archivo está dañado (y no se guarda nada).
+    """
+    ruta = os.path.join(app.config['UPLOAD_FOLDER'], nombre_archivo)
+    info = None
+    if nombre_archivo.lower().endswith('.glb'):
+        datos, info = glb.procesar_glb(archivo.read(), cuantizar=GLB_CUANTIZAR)
+        with open(ruta, 'wb') as f:
+            f.write(datos)
+        stats = info['stats']
+        print(f"📦 Modelo {nombre_archivo}: {stats['bytes_original']} -> {stats['bytes']} bytes")
+    else:
+        archivo.save(ruta)
+    try:
+        modelos.generar_variantes(ruta)
+    except Exception as e:
+        print(f"⚠️ No se pudieron generar variantes de {nombre_archivo}: {e}")
+    return info
+
+def subir_archivo_importado(ruta, campo):
+    """
+    Sube un archivo que nombra una fila de catalogo_masivo. Devuelve (valor
+    para el campo, campos que se completan si están vacíos): los modelos pasan
+    por guardar_modelo; las imágenes van a Storage si hay bucket, si no a
+    UPLOAD_FOLDER.
+    """
+    nombre = secure_filename(os.path.basename(ruta))
+    if campo == 'archivo_ra':
+        if not allowed_file(nombre):
+            raise ValueError(f"extensión no permitida: {nombre}")
+        with open(ruta, 'rb') as f:
+            info = guardar_modelo(FileStorage(stream=f, filename=nombre), nombre)
+        extra = {}
+        _completar_medidas(extra, info)
+        return nombre, extra
+    if bucket:
+        blob = bucket.blob(f"productos/{nombre}")
+        blob.upload_from_filename(ruta)
+        blob.make_public()
+        return blob.public_url, None
+    shutil.copyfile(ruta, os.path.join(app.config['UPLOAD_FOLDER'], nombre))
+    return nombre, None
+
+def _completar_medidas(producto, info_modelo):
+    """Las medidas que el admin dejó vacías se toman de la caja del modelo."""
+    if not info_modelo:
+        return
+    producto['modelo'] = info_modelo['stats']
+    for campo, valor in (info_modelo['medidas'] or {}).items():
+        if producto.get(campo) in (None, '') and valor:
+            producto[campo] = valor
+
 def admin_required(f):
     @wraps(f)
     def _wrap(*args, **kwargs):
@@ -87,19 +165,112 @@ def admin_required(f):
 def _looks_like_bcrypt(s: str) -> bool:
     return isinstance(s, str) and s.startswith("$2")
 
+# bcrypt corre en un pool acotado: si hay más de BCRYPT_COLA_MAX peticiones
+# esperando se rechaza al instante en vez de bloquear el worker.
+BCRYPT_HILOS = int(os.environ.get('BCRYPT_HILOS', os.cpu_count() or 2))
+BCRYPT_COLA_MAX = int(os.environ.get('BCRYPT_COLA_MAX', 16))
+BCRYPT_ESPERA_MAX = float(os.environ.get('BCRYPT_ESPERA_MAX', 5))
+BCRYPT_OBJETIVO_MS = float(os.environ.get('BCRYPT_OBJETIVO_MS', 250))
+
+class ServidorOcupado(Exception):
+    """No hay cupo en el pool de bcrypt (o la espera superó BCRYPT_ESPERA_MAX)."""
+
+_bcrypt_pool = ThreadPoolExecutor(max_workers=BCRYPT_HILOS, thread_name_prefix='bcrypt')
+_bcrypt_cupos = threading.BoundedSemaphore(BCRYPT_HILOS + BCRYPT_COLA_MAX)
+
+def _en_pool_bcrypt(fn, *args):
+    if not _bcrypt_cupos.acquire(blocking=False):
+        raise ServidorOcupado()
+    try:
+        futuro = _bcrypt_pool.submit(fn, *args)
+    except Exception:
+        _bcrypt_cupos.release()
+        raise
+    futuro.add_done_callback(lambda _f: _bcrypt_cupos.release())
+    try:
+        return futuro.result(timeout=BCRYPT_ESPERA_MAX)
+    except FuturesTimeout:
+        raise ServidorOcupado()
+
+def calibrar_bcrypt(objetivo_ms=BCRYPT_OBJETIVO_MS, minimo=10, maximo=15):
+    """
+    Elige el costo de bcrypt para que un hash tarde cerca de objetivo_ms.
+    Mide con costo 8 y extrapola (cada +1 duplica el tiempo).
+    """
+    base = 8
+    tiempos = []
+    for _ in range(3):
+        t0 = time.perf_counter()
+        bcrypt.generate_password_hash('calibracion', base)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    ms = max(min(tiempos), 0.01)
+    rondas = base + round(math.log2(objetivo_ms / ms))
+    return max(minimo, min(maximo, rondas))
+
+def _costo_bcrypt_guardado():
+    """
+    Costo de bcrypt compartido por todos los workers y reinicios: el primero
+    que arranca lo calibra y lo guarda en la tabla meta de local.db, los demás
+    lo leen. Así el costo no cambia con la carga de la CPU en cada arranque.
+    """
+    with almacen_local.transaccion() as conn:
+        fila = conn.execute("SELECT valor FROM meta WHERE clave = 'bcrypt_costo'").fetchone()
+        if fila and fila['valor']:
+            return int(fila['valor'])
+        costo = calibrar_bcrypt()
+        conn.execute("INSERT INTO meta (clave, valor) VALUES ('bcrypt_costo', ?)", (str(costo),))
+        print("🔐 Costo bcrypt calibrado y guardado en local.db")
+        return costo
+
+if os.environ.get('BCRYPT_ROUNDS'):
+    BCRYPT_ROUNDS = int(os.environ['BCRYPT_ROUNDS'])
+else:
+    BCRYPT_ROUNDS = _costo_bcrypt_guardado()
+print(f"🔐 Costo bcrypt: {BCRYPT_ROUNDS}")
+
+def _costo_bcrypt(stored: str):
+    try:
+        return int(stored.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+def necesita_rehash(stored: str) -> bool:
+    """True si la clave está en texto plano o con un costo menor al actual (nunca se baja)."""
+    if not _looks_like_bcrypt(stored):
+        return True
+    costo = _costo_bcrypt(stored)
+    return costo is None or costo < BCRYPT_ROUNDS
+
+def _hash_bcrypt(plain):
+    with metricas.cronometro('bcrypt_segundos', operacion='hash'):
+        return bcrypt.generate_password_hash(plain, BCRYPT_ROUNDS).decode('utf-8')
+
+def hash_password(plain: str) -> str:
+    return _en_pool_bcrypt(_hash_bcrypt, plain)
+
+def _check_bcrypt(stored, plain):
+    try:
+        with metricas.cronometro('bcrypt_segundos', operacion='verificar'):
+            return bcrypt.check_password_hash(stored, plain)
+    except Exception:
+        return False
+
 def verify_password(plain: str, stored: str) -> bool:
     if not stored:
         return False
     if _looks_like_bcrypt(stored):
-        try:
-            return bcrypt.check_password_hash(stored, plain)
-        except Exception:
-            return False
+        return _en_pool_bcrypt(_check_bcrypt, stored, plain)
     return stored == plain
 
+@app.errorhandler(ServidorOcupado)
+def servidor_ocupado(e):
+    flash('El servidor está ocupado. Intenta de nuevo en unos segundos.', 'warning')
+    return redirect(request.url)
+
 # -------- Archivos JSON locales --------
-PRODUCTOS_JSON = 'productos.json'
-USUARIOS_JSON = 'usuarios.json'
+# El modo offline usa almacen_local (SQLite); estos JSON se importan/exportan desde ahí.
+PRODUCTOS_JSON = almacen_local.PRODUCTOS_JSON
+USUARIOS_JSON = almacen_local.USUARIOS_JSON
 
 # -------- Funciones de normalización --------
 def _normalize_product(p, idx):
@@ -127,8 +298,30 @@ def _normalize_product(p, idx):
     prod['fondo']  = to_float_or_none(prod.get('fondo'))
     prod['altura'] = to_float_or_none(prod.get('altura'))
 
-    
-    return prod 
+    # 💬 Los comentarios viven en productos/{id}/comentarios, no en el catálogo
+    prod.pop('comentarios', None)
+    # 🕒 updated_at lo pone Firestore al escribir; no se copia a lo local ni se reescribe
+    prod.pop(cambios_productos.CAMPO, None)
+
+    # ⭐ Calificaciones: el promedio se deriva de los contadores
+    cantidad, suma = _contadores_calificacion(prod)
+    if cantidad:
+        prod['promedio'] = suma / cantidad
+    return prod
+
+def _contadores_calificacion(prod):
+    """(cantidad, suma) desde calif_cantidad/calif_suma o, si aún no se migró, desde el arreglo viejo."""
+    try:
+        cantidad = int(prod.get('calif_cantidad') or 0)
+        suma = float(prod.get('calif_suma') or 0)
+    except (TypeError, ValueError):
+        cantidad, suma = 0, 0.0
+    viejas = prod.get('calificaciones')
+    if isinstance(viejas, list):
+        valores = [v for v in viejas if isinstance(v, (int, float))]
+        cantidad += len(valores)
+        suma += sum(valores)
+    return cantidad, suma
 
 def _normalize_user(u):
     d = dict(u) if isinstance(u, dict) else {}
@@ -140,57 +333,407 @@ def _normalize_user(u):
     d.setdefault('rol', d.get('rol', 'user') or 'user')
     return d
 
+# -------- Archivos estáticos con huella --------
+# Las copias .br/.gz se arman con `python estaticos.py` al desplegar; si faltan,
+# se comprimen en segundo plano para no demorar el import
+estaticos.construir_manifiesto(en_segundo_plano=True)
+
+@app.url_defaults
+def _estatico_con_huella(endpoint, values):
+    """url_for('static', filename='styles.css') -> /static/styles.<huella>.css"""
+    if endpoint == 'static' and 'filename' in values:
+        con_huella = estaticos.url_con_huella(values['filename'])
+        if con_huella:
+            values['filename'] = con_huella
+
+def servir_estatico(filename):
+    """Reemplaza la vista 'static': los nombres con huella se cachean un año."""
+    resuelto = estaticos.resolver(filename)
+    if resuelto is None:
+        return app.send_static_file(filename)
+    nombre, vigente = resuelto
+    huella = estaticos.huella(nombre)
+    ruta, codificacion = estaticos.variante(nombre, request.headers.get('Accept-Encoding'))
+    # Con huella de otro despliegue se entrega el archivo actual, pero sin fijarlo en caché
+    resp = send_file(ruta, mimetype=estaticos.mimetype(nombre), conditional=True,
+                     etag=f"{huella}-{codificacion}" if codificacion else huella,
+                     max_age=31536000 if vigente else None)
+    if codificacion:
+        resp.headers['Content-Encoding'] = codificacion
+    resp.vary.add('Accept-Encoding')
+    resp.cache_control.public = True
+    if vigente:
+        resp.cache_control.immutable = True
+    return resp
+
+app.view_functions['static'] = servir_estatico
+
 # -------- Utilidades de sesión en templates --------
 @app.context_processor
 def inject_cart_totals():
-    carrito = session.get('carrito', [])
-    total_items = sum(int(i.get('cantidad', 1)) for i in carrito)
-    return dict(carrito_cant=total_items, carrito_dist=len(carrito))
+    # Solo hacen falta las cantidades: no se consulta el catálogo
+    carrito = _carrito()
+    return dict(carrito_cant=sum(carrito.values()), carrito_dist=len(carrito))
+
+IMAGEN_POR_DEFECTO = 'logo_empresa.png'
+
+def _url_original(src):
+    src = src or IMAGEN_POR_DEFECTO
+    return src if imagenes.es_remota(src) else url_for('static', filename=src)
+
+def url_imagen(src, ancho=None, formato='jpeg'):
+    """URL de la variante reducida, o del original si no se puede reducir."""
+    src = src or IMAGEN_POR_DEFECTO
+    if ancho is None or not imagenes.disponible():
+        return _url_original(src)
+    try:
+        v = imagenes.huella(src)
+    except (ValueError, OSError):
+        return _url_original(src)
+    return url_for('imagen_responsiva', formato=formato, ancho=ancho, src=src, v=v)
+
+def srcset_imagen(src, formato='jpeg'):
+    """'url 320w, url 640w, ...' o '' si la imagen no admite variantes."""
+    src = src or IMAGEN_POR_DEFECTO
+    if not imagenes.disponible():
+        return ''
+    try:
+        imagenes.huella(src)
+    except (ValueError, OSError):
+        return ''
+    return ', '.join(f"{url_imagen(src, ancho, formato)} {ancho}w" for ancho in imagenes.ANCHOS)
+
+app.jinja_env.globals.update(url_imagen=url_imagen, srcset_imagen=srcset_imagen)
 
 # -------- Cargar/guardar productos --------
 def _leer_local_productos():
-    if os.path.exists(PRODUCTOS_JSON):
-        try:
-            with open(PRODUCTOS_JSON, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            return [_normalize_product(p, i) for i, p in enumerate(data)]
-        except Exception as e:
-            print(f"⚠️  Error leyendo {PRODUCTOS_JSON}: {e}")
+    try:
+        return [_normalize_product(p, i) for i, p in enumerate(almacen_local.listar_productos())]
+    except Exception as e:
+        print(f"⚠️  Error leyendo productos locales: {e}")
     return []
 
-def cargar_productos():
-    cloud = []
+def _leer_cloud_productos():
+    """Lee la colección completa de Firestore. Devuelve None si falla."""
+    if not _firestore('productos'):
+        return None
     try:
-        if db:
-            docs = list(db.collection('productos').stream())
-            for i, d in enumerate(docs):
-                prod = d.to_dict() or {}
-                prod['id'] = str(prod.get('id', d.id))
-                cloud.append(_normalize_product(prod, i))
+        cloud = []
+        docs = acceso_firestore.llamar('productos', db.collection('productos').stream)
+        for i, d in enumerate(docs):
+            prod = d.to_dict() or {}
+            prod['id'] = str(prod.get('id', d.id))
+            cloud.append(_normalize_product(prod, i))
+        return cloud
     except Exception as e:
         print(f"⚠️  Error leyendo productos de Firebase: {e}")
+        return None
 
-    local = _leer_local_productos()
+def _combinar_productos(cloud, local):
+    """
+    Une los productos de Firebase con los locales en O(n).
+    Devuelve (lista en orden: nube primero y luego locales que falten, índice id -> producto).
+    """
     # 🔹 Si Firebase no devolvió nada, usar los locales
     if not cloud and local:
         print("📂 Usando productos locales porque Firebase no devolvió datos.")
-        return local
+        por_id = {}
+        for p in local:
+            por_id.setdefault(p['id'], p)
+        return list(local), por_id
 
-    merged = {p['id']: p for p in cloud}
+    por_id = {p['id']: p for p in cloud}
+    resultado = list(cloud)
     for p in local:
-        if p['id'] not in merged:
-            merged[p['id']] = p
+        if p['id'] not in por_id:
+            por_id[p['id']] = p
+            resultado.append(p)
+    return resultado, por_id
+
+# -------- Catálogo en memoria --------
+# Se llena una sola vez por proceso y se mantiene al día con un listener
+# on_snapshot sobre 'productos'. Si el listener se cae (o no hay Firebase),
+# se vuelve a leer la fuente como mucho cada CATALOGO_MAX_STALE segundos.
+CATALOGO_MAX_STALE = float(os.environ.get('CATALOGO_MAX_STALE', 60))
+
+_catalogo_lock = threading.RLock()
+# Una sola relectura de la fuente a la vez por proceso (ver cargar_productos)
+_recarga_lock = threading.Lock()
+_catalogo = {
+    'cloud': {},        # id -> producto normalizado, en el orden de Firestore
+    'local': [],        # productos de productos.json
+    'productos': None,  # lista combinada que usan las vistas
+    'por_id': {},       # id -> producto de la lista combinada
+    'ids': [],          # ids ordenados, para paginar con cursor
+    'huellas': {},      # id -> huella del contenido, para la caché de fragmentos
+    'version': 0,
+    'actualizado': 0.0,
+}
+_escucha_productos = None
+
+def _huella_producto(producto):
+    crudo = json.dumps(producto, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(crudo.encode('utf-8')).hexdigest()[:16]
+
+def _publicar_catalogo():
+    with _catalogo_lock:
+        anterior, huellas_previas = _catalogo['por_id'], _catalogo['huellas']
+        _catalogo['productos'], _catalogo['por_id'] = _combinar_productos(
+            list(_catalogo['cloud'].values()), _catalogo['local'])
+        # Solo se recalcula la huella de los productos que cambiaron de objeto
+        _catalogo['huellas'] = {
+            pid: huellas_previas[pid] if anterior.get(pid) is p and pid in huellas_previas else _huella_producto(p)
+            for pid, p in _catalogo['por_id'].items()
+        }
+        _catalogo['ids'] = sorted(_catalogo['por_id'])
+        _catalogo['version'] += 1
+        _catalogo['actualizado'] = time.time()
+
+def _recargar_catalogo():
+    """Relee Firestore y el JSON local (modo polling)."""
+    cloud = _leer_cloud_productos()
+    local = _leer_local_productos()
+    with _catalogo_lock:
+        if cloud is not None:
+            _catalogo['cloud'] = {p['id']: p for p in cloud}
+        _catalogo['local'] = local
+        _publicar_catalogo()
+
+def _on_snapshot_productos(docs, changes, read_time):
+    try:
+        with _catalogo_lock:
+            for change in changes:
+                d = change.document
+                if change.type.name == 'REMOVED':
+                    _catalogo['cloud'].pop(str(d.id), None)
+                    continue
+                prod = d.to_dict() or {}
+                prod['id'] = str(prod.get('id', d.id))
+                _catalogo['cloud'][str(d.id)] = _normalize_product(prod, 0)
+            _publicar_catalogo()
+    except Exception as e:
+        print(f"⚠️  Error aplicando cambios del listener de productos: {e}")
+
+def _escucha_activa():
+    return _escucha_productos is not None and getattr(_escucha_productos, 'is_active', False)
+
+def _iniciar_escucha_productos():
+    global _escucha_productos
+    if not _firestore('productos') or _escucha_activa():
+        return
+    try:
+        _escucha_productos = db.collection('productos').on_snapshot(_on_snapshot_productos)
+        print("👂 Listener de productos activo")
+    except Exception as e:
+        _escucha_productos = None
+        print(f"⚠️  No se pudo iniciar el listener de productos: {e}")
+
+def _hace_falta_recargar():
+    viejo = time.time() - _catalogo['actualizado'] > CATALOGO_MAX_STALE
+    return viejo and not _escucha_activa()
+
+def cargar_productos():
+    """
+    Devuelve el catálogo combinado (Firebase + local) desde la memoria del proceso.
+    Solo se vuelve a leer la fuente en la primera llamada o si el listener
+    está caído y los datos superan CATALOGO_MAX_STALE segundos.
+    La lectura se hace fuera de _catalogo_lock y de a un hilo por vez: con el
+    catálogo vacío los demás esperan; con datos viejos siguen usándolos.
+    """
+    with _catalogo_lock:
+        vacio = _catalogo['productos'] is None
+        if not vacio and not _hace_falta_recargar():
+            return list(_catalogo['productos'])
+    if _recarga_lock.acquire(blocking=vacio):
+        try:
+            with _catalogo_lock:
+                pendiente = _catalogo['productos'] is None or _hace_falta_recargar()
+            if pendiente:
+                _recargar_catalogo()
+                _iniciar_escucha_productos()
+        finally:
+            _recarga_lock.release()
+    with _catalogo_lock:
+        return list(_catalogo['productos'])
+
+def _catalogo_fresco():
+    return _catalogo['productos'] is not None and (
+        _escucha_activa() or time.time() - _catalogo['actualizado'] <= CATALOGO_MAX_STALE)
+
+def obtener_producto(pid):
+    """
+    Busca un producto por id.
+    Con el catálogo en memoria al día es una búsqueda O(1); si no, hace una
+    lectura puntual document(id).get() en vez de cargar toda la colección.
+    """
+    pid = str(pid)
+    with _catalogo_lock:
+        if _catalogo_fresco():
+            return _catalogo['por_id'].get(pid)
+
+    if _firestore('productos'):
+        try:
+            doc = acceso_firestore.llamar('productos', db.collection('productos').document(pid).get)
+            if doc.exists:
+                prod = doc.to_dict() or {}
+                prod['id'] = str(prod.get('id', doc.id))
+                return _normalize_product(prod, 0)
+        except Exception as e:
+            print(f"⚠️  Error leyendo producto {pid} de Firebase: {e}")
+
+    with _catalogo_lock:
+        if _catalogo['productos'] is not None:
+            return _catalogo['por_id'].get(pid)
+    return next((p for p in _leer_local_productos() if p['id'] == pid), None)
+
+def huella_producto(producto):
+    """Huella del contenido del producto (la del catálogo si es el mismo objeto)."""
+    pid = str(producto.get('id'))
+    with _catalogo_lock:
+        if _catalogo['por_id'].get(pid) is producto and pid in _catalogo['huellas']:
+            return _catalogo['huellas'][pid]
+    return _huella_producto(producto)
+
+def obtener_productos(ids):
+    """
+    Varios productos por id en una sola consulta: {id: producto}.
+    Usa el catálogo en memoria si está al día; si no, un único get_all()
+    de Firestore (o un SELECT ... IN en el almacén local).
+    """
+    ids = list(dict.fromkeys(str(i) for i in ids))
+    if not ids:
+        return {}
+    with _catalogo_lock:
+        if _catalogo_fresco():
+            por_id = _catalogo['por_id']
+            return {pid: por_id[pid] for pid in ids if pid in por_id}
+
+    if _firestore('productos'):
+        try:
+            col = db.collection('productos')
+            encontrados = {}
+            for doc in acceso_firestore.llamar('productos', db.get_all, [col.document(pid) for pid in ids]):
+                if doc.exists:
+                    prod = doc.to_dict() or {}
+                    prod['id'] = str(prod.get('id', doc.id))
+                    encontrados[doc.id] = _normalize_product(prod, 0)
+            return encontrados
+        except Exception as e:
+            print(f"⚠️  Error leyendo productos de Firebase: {e}")
+
+    with _catalogo_lock:
+        if _catalogo['productos'] is not None:
+            por_id = _catalogo['por_id']
+            return {pid: por_id[pid] for pid in ids if pid in por_id}
+    return {str(p['id']): _normalize_product(p, 0) for p in almacen_local.obtener_productos(ids)}
 
-    resultado = cloud + [p for pid, p in merged.items() if all(pid != c['id'] for c in cloud)]
-    return resultado
+# -------- Filtros, orden y facetas --------
+FILTROS_RANGO = ('precio', 'frente', 'fondo', 'altura', 'promedio')
+
+def _leer_filtros(args):
+    """
+    Lee ?precio_min=&precio_max=&frente_min=...&orden=precio|-precio|calificacion|tamano.
+    Lanza ValueError si algún valor no es válido.
+    """
+    rangos = {}
+    for campo in FILTROS_RANGO:
+        minimo = (args.get(f'{campo}_min') or '').strip()
+        maximo = (args.get(f'{campo}_max') or '').strip()
+        if minimo or maximo:
+            rangos[campo] = (float(minimo) if minimo else None, float(maximo) if maximo else None)
+    orden = (args.get('orden') or '').strip()
+    descendente = orden.startswith('-')
+    orden = orden.lstrip('-')
+    if orden and orden not in ORDENES:
+        raise ValueError(f"orden no válido: {orden}")
+    return rangos, orden, descendente
+
+def _hay_filtros(args):
+    return 'orden' in args or any(f'{c}_min' in args or f'{c}_max' in args for c in FILTROS_RANGO)
+
+def _catalogo_con_indices():
+    """Catálogo e índices ordenados de la misma versión; los índices se reconstruyen solo si cambió."""
+    cargar_productos()
+    with _catalogo_lock:
+        if _catalogo.get('indices_version') != _catalogo['version']:
+            _catalogo['indices'] = construir_indices(_catalogo['productos'])
+            _catalogo['indices_version'] = _catalogo['version']
+        return list(_catalogo['productos']), _catalogo['indices']
+
+def buscar_productos(rangos, orden='', descendente=False, con_facetas=False):
+    """Devuelve (productos filtrados y ordenados, facetas o None)."""
+    productos, indices = _catalogo_con_indices()
+    seleccion = filtrar(indices, rangos)
+    posiciones = ordenar(indices, seleccion, orden, descendente)
+    return [productos[i] for i in posiciones], (facetas(indices, rangos) if con_facetas else None)
+
+def _catalogo_upsert(producto):
+    """Refleja en memoria una escritura del admin sin esperar al listener."""
+    prod = _normalize_product(producto, 0)
+    with _catalogo_lock:
+        if _catalogo['productos'] is None:
+            return
+        _catalogo['cloud'][prod['id']] = prod
+        _publicar_catalogo()
+
+def _catalogo_eliminar(pid):
+    with _catalogo_lock:
+        if _catalogo['productos'] is None:
+            return
+        _catalogo['cloud'].pop(str(pid), None)
+        _catalogo['local'] = [p for p in _catalogo['local'] if p['id'] != str(pid)]
+        _publicar_catalogo()
+
+def _catalogo_recargar_local():
+    local = _leer_local_productos()
+    with _catalogo_lock:
+        if _catalogo['productos'] is None:
+            return
+        _catalogo['local'] = local
+        _publicar_catalogo()
 
 def guardar_productos(productos):
+    """Reemplaza todo el catálogo local (para cambios puntuales usar guardar_producto_local)."""
+    try:
+        almacen_local.reemplazar_productos(productos)
+        _catalogo_recargar_local()
+        return True
+    except Exception as e:
+        print(f"❌ Error guardando productos locales: {e}")
+        return False
+
+def guardar_producto_local(producto, pendiente=False, base=None, version=None):
+    """
+    Guarda un producto en el almacén local. Con `pendiente` el cambio se anota
+    en el diario offline para subirlo cuando vuelva Firebase (`base`: el
+    producto antes de editarlo; sin base es un alta). Con `version`, si el
+    producto local ya no está en esa versión se lanza almacen_local.VersionDistinta.
+    """
+    try:
+        if pendiente:
+            diario_offline.guardar_producto(producto, base, version)
+        else:
+            almacen_local.guardar_producto(producto, version=version)
+        _catalogo_recargar_local()
+        return True
+    except almacen_local.VersionDistinta:
+        raise
+    except Exception as e:
+        print(f"❌ Error guardando producto local {producto.get('id')}: {e}")
+        return False
+
+def eliminar_producto_local(pid, pendiente=False, base=None, version=None):
     try:
-        with open(PRODUCTOS_JSON, 'w', encoding='utf-8') as f:
-            json.dump(productos, f, ensure_ascii=False, indent=2)
+        if pendiente:
+            diario_offline.eliminar_producto(pid, base, version)
+        else:
+            almacen_local.eliminar_producto(pid, version=version)
+        _catalogo_recargar_local()
         return True
+    except almacen_local.VersionDistinta:
+        raise
     except Exception as e:
-        print(f"❌ Error guardando {PRODUCTOS_JSON}: {e}")
+        print(f"❌ Error eliminando producto local {pid}: {e}")
         return False
 
 # -------- Cargar/guardar usuarios --------
@@ -201,8 +744,8 @@ def cargar_usuarios():
     Devuelve una lista de diccionarios de usuarios normalizados.
     """
     try:
-        if db:
-            docs = db.collection('usuarios').stream()
+        if _firestore('usuarios'):
+            docs = acceso_firestore.llamar('usuarios', db.collection('usuarios').stream)
             users = [_normalize_user(d.to_dict()) for d in docs]
             if users:
                 return users
@@ -211,30 +754,38 @@ def cargar_usuarios():
     except Exception as e:
         print(f"⚠️  Error leyendo usuarios de Firebase: {e}")
 
-    # Si Firebase falla o no hay usuarios, cargar desde JSON local
-    if os.path.exists(USUARIOS_JSON):
-        try:
-            with open(USUARIOS_JSON, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            return [_normalize_user(u) for u in data]
-        except Exception as e:
-            print(f"⚠️  Error leyendo {USUARIOS_JSON}: {e}")
+    # Si Firebase falla o no hay usuarios, cargar desde el almacén local
+    try:
+        return [_normalize_user(u) for u in almacen_local.listar_usuarios()]
+    except Exception as e:
+        print(f"⚠️  Error leyendo usuarios locales: {e}")
 
     return []
 
 
-def guardar_usuario_local(nuevo):
+def buscar_usuario_local(correo):
+    """Búsqueda indexada por correo en el almacén local."""
+    try:
+        u = almacen_local.obtener_usuario(correo)
+        return _normalize_user(u) if u else None
+    except Exception as e:
+        print(f"⚠️  Error leyendo usuario local {correo}: {e}")
+        return None
+
+
+def guardar_usuario_local(nuevo, pendiente=False):
     """
-    Guarda un nuevo usuario en el JSON local.
+    Guarda (o actualiza) un usuario en el almacén local. Con `pendiente` el
+    alta queda en el diario offline para subirla a Firebase.
     """
-    usuarios = cargar_usuarios()
-    usuarios.append(_normalize_user(nuevo))
     try:
-        with open(USUARIOS_JSON, 'w', encoding='utf-8') as f:
-            json.dump(usuarios, f, ensure_ascii=False, indent=2)
+        if pendiente:
+            diario_offline.guardar_usuario(_normalize_user(nuevo))
+        else:
+            almacen_local.guardar_usuario(_normalize_user(nuevo))
         return True
     except Exception as e:
-        print(f"❌ Error guardando {USUARIOS_JSON}: {e}")
+        print(f"❌ Error guardando usuario local: {e}")
         return False
 
 
@@ -256,14 +807,31 @@ from flask import session, redirect, url_for, flash
     #return decorated_function
 
 
+# -------- Fragmentos cacheados --------
+# Las partes que no dependen del usuario se renderizan una vez por versión
+# del producto; saludo, carrito y mensajes flash se siguen renderizando por petición.
+def tarjeta_html(producto):
+    clave = ('tarjeta', str(producto['id']), huella_producto(producto))
+    return fragmentos.obtener(clave, lambda: Markup(render_template('tarjeta_producto.html', producto=producto)))
+
+def info_producto_html(producto):
+    clave = ('detalle', str(producto['id']), huella_producto(producto))
+    return fragmentos.obtener(clave, lambda: Markup(render_template('detalle_producto_info.html', producto=producto)))
+
 # -------- Rutas --------
 @app.route('/')
 def index():
-    productos = cargar_productos()
-    productos = [_normalize_product(p, i) for i, p in enumerate(productos)]
+    try:
+        rangos, orden, descendente = _leer_filtros(request.args)
+    except ValueError:
+        flash('Filtros no válidos, se muestran todos los productos.', 'warning')
+        rangos, orden, descendente = {}, '', False
+    productos, facetas_catalogo = buscar_productos(rangos, orden, descendente, con_facetas=True)
     carrito_cant = len(session.get('carrito', []))  # Contar elementos del carrito
     rol = session.get('rol', 'user')  # Por defecto 'user' si no hay sesión
-    return render_template('index.html', productos=productos, carrito_cant=carrito_cant, rol=rol)
+    tarjetas = [tarjeta_html(p) for p in productos]
+    return render_template('index.html', tarjetas=tarjetas, carrito_cant=carrito_cant, rol=rol,
+                           facetas=facetas_catalogo, filtros=request.args)
 
 @app.route('/ver_modelo/<nombre_archivo>')
 def ver_modelo(nombre_archivo):
@@ -274,6 +842,55 @@ def ver_modelo(nombre_archivo):
     rol = session.get('rol', 'user')
     return render_template('visor_modelo.html', nombre_archivo=nombre_archivo, carrito_cant=carrito_cant, rol=rol)
 
+@app.route('/modelos/<nombre_archivo>')
+def servir_modelo(nombre_archivo):
+    """
+    Entrega el modelo con ETag por contenido (304 si no cambió), soporte de
+    Range y variante .br/.gz según Accept-Encoding.
+    """
+    nombre = secure_filename(nombre_archivo)
+    ruta = os.path.join(app.config['UPLOAD_FOLDER'], nombre)
+    if not nombre or not os.path.isfile(ruta):
+        abort(404)
+
+    etag = modelos.etag(ruta)
+    archivo, codificacion = ruta, None
+    # Los rangos se sirven sobre el archivo sin comprimir
+    if not request.range:
+        if not modelos.variantes_vigentes(ruta):
+            try:
+                modelos.generar_variantes(ruta)
+            except Exception as e:
+                print(f"⚠️ No se pudieron generar variantes de {nombre}: {e}")
+        archivo, codificacion = modelos.elegir_variante(ruta, request.headers.get('Accept-Encoding'))
+
+    resp = send_file(archivo, mimetype=modelos.mimetype(nombre), conditional=True,
+                     etag=f"{etag}-{codificacion}" if codificacion else etag)
+    if codificacion:
+        resp.headers['Content-Encoding'] = codificacion
+    resp.vary.add('Accept-Encoding')
+    # Siempre se revalida: si no cambió, la respuesta es un 304 sin cuerpo
+    resp.cache_control.public = True
+    resp.cache_control.no_cache = True
+    return resp
+
+@app.route('/imagenes/<formato>/<int:ancho>')
+def imagen_responsiva(formato, ancho):
+    """Imagen reducida (?src= archivo de /static o URL de Firebase Storage)."""
+    src = request.args.get('src', '')
+    try:
+        ruta = imagenes.variante(src, ancho, formato)
+    except (ValueError, OSError):
+        abort(404)
+    except imagenes.ImagenNoDisponible as e:
+        print(f"⚠️ Imagen sin variante, se sirve el original: {e}")
+        return redirect(_url_original(src))
+    # La URL lleva la huella del original (v=), así que nunca cambia de contenido
+    resp = send_file(ruta, mimetype=imagenes.mimetype(formato), conditional=True, max_age=31536000)
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
 # -------- Páginas informativas --------
 @app.route("/conocenos")
 def conocenos():
@@ -303,12 +920,13 @@ def escribenos():
 # ✅ Nueva ruta Detalles de producto
 @app.route('/producto/<id_producto>')
 def detalle_producto(id_producto):
-    productos = cargar_productos()
-    producto = next((p for p in productos if str(p.get('id')) == str(id_producto)), None)
+    producto = obtener_producto(id_producto)
     if not producto:
         flash("Producto no encontrado", "danger")
         return redirect(url_for('index'))
-    return render_template("detalle_producto.html", producto=producto)
+    comentarios, siguiente = leer_comentarios(producto['id'], antes_de=request.args.get('comentarios_antes', ''))
+    return render_template("detalle_producto.html", producto=producto, info_producto=info_producto_html(producto),
+                           comentarios=comentarios, comentarios_siguiente=siguiente)
 
 
 # -------- Calificaciones --------
@@ -316,7 +934,7 @@ def detalle_producto(id_producto):
 def calificar(id):
     try:
         # ⚠️ Verificamos que Firebase esté disponible
-        if not db:
+        if not _firestore('productos'):
             flash("⚠️ Base de datos no disponible. Inténtalo más tarde.", "warning")
             return redirect(url_for("index"))
 
@@ -326,28 +944,22 @@ def calificar(id):
             flash("La calificación debe ser entre 1 y 5 ⭐", "error")
             return redirect(url_for("index"))
 
-        # 🔹 Buscar producto en Firebase
+        # 🔹 Sumar la calificación con contadores atómicos (sin leer el documento).
+        # update() falla con NotFound si el producto no existe.
+        from firebase_admin import firestore
+        from google.api_core.exceptions import NotFound
         producto_ref = db.collection("productos").document(id)
-        producto = producto_ref.get()
-
-        if not producto.exists:
+        try:
+            acceso_firestore.llamar('productos', producto_ref.update, {
+                "calif_cantidad": firestore.Increment(1),
+                "calif_suma": firestore.Increment(rating),
+                f"calif_estrellas.{rating}": firestore.Increment(1),
+                cambios_productos.CAMPO: firestore.SERVER_TIMESTAMP,
+            })
+        except NotFound:
             flash("Producto no encontrado", "error")
             return redirect(url_for("index"))
 
-        producto_data = producto.to_dict() or {}
-
-        # 🔹 Recuperar calificaciones anteriores como lista
-        calificaciones = list(producto_data.get("calificaciones", []))
-        calificaciones.append(rating)
-
-        promedio = sum(calificaciones) / len(calificaciones)
-
-        # 🔹 Guardar en Firebase
-        producto_ref.update({
-            "calificaciones": calificaciones,
-            "promedio": promedio
-        })
-
         flash("⭐ ¡Gracias por tu calificación!", "success")
         return redirect(url_for("index"))
 
@@ -357,6 +969,48 @@ def calificar(id):
 
 
 # -------- Comentarios --------
+COMENTARIOS_POR_PAGINA = int(os.environ.get('COMENTARIOS_POR_PAGINA', 10))
+
+def _cursor_comentario(c):
+    return f"{c.get('fecha', '')}|{c.get('id', '')}"
+
+def _comentarios_locales(pid):
+    """Comentarios embebidos en el producto local (modo offline / datos sin migrar)."""
+    try:
+        p = almacen_local.obtener_producto(pid) or {}
+    except Exception:
+        return []
+    return [dict(c, id=str(k)) for k, c in enumerate(p.get('comentarios') or [])]
+
+def leer_comentarios(pid, limite=COMENTARIOS_POR_PAGINA, antes_de=''):
+    """
+    Una página de comentarios, del más nuevo al más viejo.
+    antes_de es el cursor "fecha|id" devuelto por la página anterior.
+    Devuelve (comentarios, cursor_siguiente o None).
+    """
+    pid = str(pid)
+    fecha_cursor, _, id_cursor = antes_de.partition('|')
+    if _firestore('comentarios'):
+        try:
+            from firebase_admin import firestore
+            q = (db.collection('productos').document(pid).collection('comentarios')
+                 .order_by('fecha', direction=firestore.Query.DESCENDING)
+                 .order_by('__name__', direction=firestore.Query.DESCENDING))
+            if antes_de:
+                q = q.start_after({'fecha': fecha_cursor, '__name__': id_cursor})
+            docs = acceso_firestore.llamar('comentarios', q.limit(limite + 1).stream)
+            comentarios = [dict(d.to_dict() or {}, id=d.id) for d in docs[:limite]]
+            siguiente = _cursor_comentario(comentarios[-1]) if len(docs) > limite else None
+            return comentarios, siguiente
+        except Exception as e:
+            print(f"⚠️ Error leyendo comentarios de {pid}: {e}")
+
+    comentarios = sorted(_comentarios_locales(pid), key=_cursor_comentario, reverse=True)
+    if antes_de:
+        comentarios = [c for c in comentarios if _cursor_comentario(c) < antes_de]
+    siguiente = _cursor_comentario(comentarios[limite - 1]) if len(comentarios) > limite else None
+    return comentarios[:limite], siguiente
+
 @app.route('/comentar/<id>', methods=['POST'])
 def comentar(id):
     try:
@@ -366,7 +1020,7 @@ def comentar(id):
             return redirect(url_for("login"))
 
         # ⚠️ Verificamos que Firebase esté disponible
-        if not db:
+        if not _firestore('comentarios'):
             flash("⚠️ Base de datos no disponible. Inténtalo más tarde.", "warning")
             return redirect(url_for("index"))
 
@@ -374,57 +1028,168 @@ def comentar(id):
         comentario = (request.form.get("comentario") or "").strip()
         if not comentario:
             flash("El comentario no puede estar vacío.", "error")
-            return redirect(url_for("index"))
-
-        usuario = session.get("usuario")
-
-        # 🔹 Buscar producto en Firebase
-        producto_ref = db.collection("productos").document(id)
-        producto = producto_ref.get()
+            return redirect(url_for("detalle_producto", id_producto=id))
 
-        if not producto.exists:
+        if not obtener_producto(id):
             flash("Producto no encontrado", "error")
             return redirect(url_for("index"))
 
-        producto_data = producto.to_dict() or {}
-
-        # 🔹 Recuperar comentarios anteriores como lista
-        comentarios = list(producto_data.get("comentarios", []))
-
-        # 🔹 Agregar nuevo comentario
-        nuevo_comentario = {
-            "usuario": usuario,
+        # 🔹 Un solo add() en la subcolección, sin reescribir el producto
+        comentarios_ref = db.collection("productos").document(id).collection("comentarios")
+        acceso_firestore.llamar('comentarios', comentarios_ref.add, {
+            "usuario": session.get("usuario"),
             "texto": comentario,
             "fecha": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        comentarios.append(nuevo_comentario)
-
-        # 🔹 Guardar en Firebase
-        producto_ref.update({
-            "comentarios": comentarios
         })
 
         flash("💬 ¡Gracias por tu comentario!", "success")
-        return redirect(url_for("index"))
+        return redirect(url_for("detalle_producto", id_producto=id))
 
     except Exception as e:
         flash(f"Error en comentario: {e}", "error")
         return redirect(url_for("index"))
 
+# -------- API para Flutter --------
+API_LIMITE_MAX = int(os.environ.get('API_LIMITE_MAX', 100))
+CAMPOS_PRODUCTO = ('id', 'nombre', 'descripcion', 'precio', 'imagen', 'archivo_ra',
+                   'frente', 'fondo', 'altura', 'promedio', 'calif_cantidad', 'calif_estrellas')
+# Campos que no se guardan en el documento: select() pide de qué se calculan
+CAMPOS_FUENTE = {'promedio': ('calif_cantidad', 'calif_suma', 'calificaciones')}
+
+def _campos_a_leer(campos):
+    """Campos del documento que hacen falta para proyectar `campos` después de normalizar."""
+    leer = []
+    for c in campos:
+        for fuente in CAMPOS_FUENTE.get(c, (c,)):
+            if fuente != 'id' and fuente not in leer:
+                leer.append(fuente)
+    return leer or ['__name__']
+
+def _proyectar(prod, campos):
+    if not campos:
+        return prod
+    return {c: prod.get(c) for c in campos}
+
+def _pagina_productos(limite, despues_de='', campos=None):
+    """
+    Devuelve (productos, siguiente_cursor) ordenados por id.
+    Usa el catálogo en memoria si está al día; si no, una consulta paginada
+    a Firestore con order_by/start_after/limit y select() de los campos pedidos.
+    """
+    with _catalogo_lock:
+        if _catalogo_fresco():
+            ids = _catalogo['ids']
+            inicio = bisect_right(ids, despues_de) if despues_de else 0
+            pagina = ids[inicio:inicio + limite]
+            siguiente = pagina[-1] if inicio + limite < len(ids) else None
+            return [_proyectar(_catalogo['por_id'][i], campos) for i in pagina], siguiente
+
+    if _firestore('productos'):
+        try:
+            q = db.collection('productos').order_by('__name__')
+            if campos:
+                q = q.select(_campos_a_leer(campos))
+            if despues_de:
+                q = q.start_after({'__name__': despues_de})
+            docs = acceso_firestore.llamar('productos', q.limit(limite + 1).stream)
+            productos = []
+            for d in docs[:limite]:
+                prod = d.to_dict() or {}
+                prod['id'] = str(d.id)
+                productos.append(_proyectar(_normalize_product(prod, 0), campos))
+            siguiente = productos[-1]['id'] if len(docs) > limite else None
+            return productos, siguiente
+        except Exception as e:
+            print(f"⚠️  Error paginando productos en Firebase: {e}")
 
+    locales = sorted(cargar_productos(), key=lambda p: p['id'])
+    if despues_de:
+        locales = [p for p in locales if p['id'] > despues_de]
+    siguiente = locales[limite - 1]['id'] if len(locales) > limite else None
+    return [_proyectar(p, campos) for p in locales[:limite]], siguiente
+
+def _api_cambios_productos(args):
+    """
+    ?since=<token>&limit=: lo que cambió desde el token (ver cambios_productos).
+    Sin Firestore no hay marcas de tiempo del servidor: 503 y la app conserva lo que tiene.
+    """
+    try:
+        limite = max(1, min(int(args.get('limit', API_LIMITE_MAX)), API_LIMITE_MAX))
+    except ValueError:
+        return jsonify({"error": "limit debe ser un número"}), 400
+    if not _firestore('productos'):
+        return jsonify({"error": "Sincronización no disponible, reintenta más tarde"}), 503
+    try:
+        productos, eliminados, token, mas = cambios_productos.cambios_desde(db, args.get('since', ''), limite)
+    except cambios_productos.TokenInvalido as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"⚠️  Error leyendo cambios de productos en Firebase: {e}")
+        return jsonify({"error": "Sincronización no disponible, reintenta más tarde"}), 503
+    productos = [_normalize_product(dict(datos, id=pid), 0) for pid, datos in productos]
+    return jsonify({"productos": productos, "eliminados": eliminados, "token": token, "mas": mas}), 200
 
-# -------- API para Flutter --------
 @app.route('/api/productos')
 def api_productos():
+    """
+    Sin parámetros devuelve el catálogo completo (compatibilidad con la app).
+    Con ?limit=&start_after=&fields= devuelve una página:
+    {"productos": [...], "siguiente": <cursor o null>}.
+    Con filtros (?precio_min=...&orden=...) devuelve
+    {"productos": [...], "total": n, "facetas": {...}} paginado con limit/offset.
+    Con ?since=<token> devuelve solo los cambios:
+    {"productos": [...], "eliminados": [ids], "token": ..., "mas": bool}.
+    """
     try:
-        productos = cargar_productos()
-        return jsonify(productos), 200
+        args = request.args
+        if 'since' in args:
+            return _api_cambios_productos(args)
+        if not _hay_filtros(args) and not any(k in args for k in ('limit', 'start_after', 'fields')):
+            productos = cargar_productos()
+            return jsonify(productos), 200
+
+        try:
+            limite = int(args.get('limit', API_LIMITE_MAX))
+        except ValueError:
+            return jsonify({"error": "limit debe ser un número"}), 400
+        limite = max(1, min(limite, API_LIMITE_MAX))
+
+        campos = [c.strip() for c in args.get('fields', '').split(',') if c.strip()]
+        invalidos = [c for c in campos if c not in CAMPOS_PRODUCTO]
+        if invalidos:
+            return jsonify({"error": f"Campos no válidos: {', '.join(invalidos)}"}), 400
+        if campos and 'id' not in campos:
+            campos.insert(0, 'id')
+
+        if _hay_filtros(args):
+            try:
+                rangos, orden, descendente = _leer_filtros(args)
+                offset = max(0, int(args.get('offset', 0)))
+            except ValueError as e:
+                return jsonify({"error": f"Filtros no válidos: {e}"}), 400
+            productos, facetas_catalogo = buscar_productos(rangos, orden, descendente, con_facetas=True)
+            pagina = [_proyectar(p, campos) for p in productos[offset:offset + limite]]
+            return jsonify({"productos": pagina, "total": len(productos), "facetas": facetas_catalogo}), 200
+
+        productos, siguiente = _pagina_productos(limite, args.get('start_after', ''), campos)
+        return jsonify({"productos": productos, "siguiente": siguiente}), 200
     except Exception as e:
         print(f"❌ Error en /api/productos: {e}")
         return jsonify({"error": "No se pudieron obtener los productos"}), 500
 
 
 
+@app.route('/api/productos/<id_producto>/comentarios')
+def api_comentarios(id_producto):
+    try:
+        limite = max(1, min(int(request.args.get('limit', COMENTARIOS_POR_PAGINA)), API_LIMITE_MAX))
+    except ValueError:
+        return jsonify({"error": "limit debe ser un número"}), 400
+    comentarios, siguiente = leer_comentarios(id_producto, limite, request.args.get('antes', ''))
+    return jsonify({"comentarios": comentarios, "siguiente": siguiente}), 200
+
+
+
 # -------- Auth --------
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -440,9 +1205,9 @@ def login():
 
         # 🔹 Intentar Firebase primero
         try:
-            if db:
+            if _firestore('usuarios'):
                 doc_ref = db.collection('usuarios').document(correo)
-                doc = doc_ref.get()
+                doc = acceso_firestore.llamar('usuarios', doc_ref.get)
                 if doc.exists:
                     u = _normalize_user(doc.to_dict())
                     stored = u.get('clave', '')
@@ -450,38 +1215,33 @@ def login():
                     nombre = u.get('nombre', correo)
                     if verify_password(clave, stored):
                         ok = True
-                        # 🔹 Auto-encriptar si no está en bcrypt
-                        if not _looks_like_bcrypt(stored):
+                        # 🔹 Auto-encriptar si no está en bcrypt o cambió el costo
+                        if necesita_rehash(stored):
                             try:
-                                hashed = bcrypt.generate_password_hash(clave).decode('utf-8')
-                                doc_ref.update({'clave': hashed})
+                                hashed = hash_password(clave)
+                                acceso_firestore.llamar('usuarios', doc_ref.update, {'clave': hashed})
                             except Exception as _e:
                                 print(f"⚠️ No se pudo auto-encriptar en Firebase: {_e}")
+        except ServidorOcupado:
+            raise
         except Exception as e:
             print(f"⚠️ Error Firebase login: {e}")
 
-        # 🔹 Si falla Firebase, intentar JSON local
+        # 🔹 Si falla Firebase, intentar el almacén local
         if not ok:
-            usuarios = cargar_usuarios()
-            for u in usuarios:
-                if u.get('correo','').lower() == correo:
-                    stored = u.get('clave','')
-                    rol = u.get('rol', 'user')
-                    nombre = u.get('nombre', correo)
-                    if verify_password(clave, stored):
-                        ok = True
-                        # 🔹 Auto-encriptar local si no es bcrypt
-                        if not _looks_like_bcrypt(stored):
-                            try:
-                                for uu in usuarios:
-                                    if uu.get('correo','').lower() == correo:
-                                        uu['clave'] = bcrypt.generate_password_hash(clave).decode('utf-8')
-                                        break
-                                with open(USUARIOS_JSON, 'w', encoding='utf-8') as f:
-                                    json.dump(usuarios, f, ensure_ascii=False, indent=2)
-                            except Exception as _e:
-                                print(f"⚠️ No se pudo auto-encriptar localmente: {_e}")
-                        break
+            u = buscar_usuario_local(correo)
+            if u:
+                stored = u.get('clave','')
+                rol = u.get('rol', 'user')
+                nombre = u.get('nombre', correo)
+                if verify_password(clave, stored):
+                    ok = True
+                    # 🔹 Auto-encriptar local si no es bcrypt o cambió el costo
+                    if necesita_rehash(stored):
+                        try:
+                            almacen_local.actualizar_usuario(correo, {'clave': hash_password(clave)})
+                        except Exception as _e:
+                            print(f"⚠️ No se pudo auto-encriptar localmente: {_e}")
 
         if ok:
             # 🔹 Guardamos usuario y rol en la sesión
@@ -529,41 +1289,38 @@ def registro_usuario():
         # Verificar si ya existe en Firebase
         existe_en_firebase = False
         try:
-            if db:
-                doc_ref = db.collection('usuarios').document(correo)
-                doc = doc_ref.get()
+            if _firestore('usuarios'):
+                doc = acceso_firestore.llamar('usuarios', db.collection('usuarios').document(correo).get)
                 if doc.exists:
                     existe_en_firebase = True
         except Exception as e:
             print(f"⚠️ Error verificando Firebase: {e}")
 
-        # Verificar en archivo local si no existe en Firebase
-        existentes = cargar_usuarios() if not existe_en_firebase else []
-        for u in existentes:
-            if u.get('correo','').lower() == correo:
-                flash('El correo ya está registrado.', 'warning')
-                return redirect(url_for('registro_usuario'))
+        # Verificar en el almacén local si no existe en Firebase
+        if not existe_en_firebase and buscar_usuario_local(correo):
+            flash('El correo ya está registrado.', 'warning')
+            return redirect(url_for('registro_usuario'))
 
         if existe_en_firebase:
             flash('El correo ya está registrado.', 'warning')
             return redirect(url_for('registro_usuario'))
 
         # Encriptar contraseña
-        hashed = bcrypt.generate_password_hash(clave).decode('utf-8')
+        hashed = hash_password(clave)
         nuevo_usuario = {'nombre': nombre, 'correo': correo, 'clave': hashed, 'rol': rol}
 
         creado = False
         # Intentar guardar en Firebase
         try:
-            if db:
-                db.collection('usuarios').document(correo).set(nuevo_usuario)
+            if _firestore('usuarios'):
+                acceso_firestore.llamar('usuarios', db.collection('usuarios').document(correo).set, nuevo_usuario)
                 creado = True
         except Exception as e:
             print(f"⚠️ Error registrando en Firebase: {e}")
 
         # Si falla Firebase, guardar localmente
         if not creado:
-            creado = guardar_usuario_local(nuevo_usuario)
+            creado = guardar_usuario_local(nuevo_usuario, pendiente=True)
 
         if creado:
             flash('Usuario registrado correctamente. Inicia sesión.', 'success')
@@ -575,57 +1332,90 @@ def registro_usuario():
     return render_template('registro.html')
 
 # -------- Carrito --------
+# En la sesión solo se guarda {id: cantidad}; nombres y precios se buscan
+# en el catálogo al mostrarlo, así la cookie queda chica y el precio es el actual.
+def _carrito():
+    """Carrito de la sesión como {id: cantidad}. Convierte el formato viejo (lista de productos)."""
+    carrito = session.get('carrito') or {}
+    if isinstance(carrito, list):
+        convertido = {}
+        for item in carrito:
+            if not isinstance(item, dict) or item.get('id') is None:
+                continue
+            try:
+                cantidad = max(int(item.get('cantidad', 1)), 1)
+            except (TypeError, ValueError):
+                cantidad = 1
+            pid = str(item['id'])
+            convertido[pid] = convertido.get(pid, 0) + cantidad
+        session['carrito'] = carrito = convertido
+    return dict(carrito)
+
+def _guardar_carrito(carrito):
+    session['carrito'] = carrito
+    session.modified = True
+
+def _items_carrito(carrito):
+    """
+    Resuelve el carrito con una sola búsqueda en el catálogo.
+    Devuelve (items, total); los productos que ya no existen se quitan.
+    """
+    productos = obtener_productos(carrito.keys())
+    items, total = [], 0.0
+    for pid, cantidad in carrito.items():
+        prod = productos.get(pid)
+        if not prod:
+            continue
+        precio = float(prod.get('precio') or 0)
+        items.append({
+            'id': pid,
+            'nombre': prod.get('nombre', ''),
+            'precio': precio,
+            'imagen': prod.get('imagen', ''),
+            'cantidad': cantidad,
+            'subtotal': precio * cantidad,
+        })
+        total += precio * cantidad
+    if len(items) != len(carrito):
+        _guardar_carrito({i['id']: i['cantidad'] for i in items})
+    return items, total
+
 @app.route('/agregar_al_carrito/<id_producto>')
 def agregar_al_carrito(id_producto):
     if not session.get('usuario'):
         flash('Inicia sesión para usar el carrito.', 'warning')
         return redirect(url_for('login'))
 
-    productos = cargar_productos()
-    prod = next((p for p in productos if str(p.get('id',''))==str(id_producto)), None)
+    prod = obtener_producto(id_producto)
     if not prod:
         flash('Producto no encontrado.', 'danger')
         return redirect(url_for('index'))
 
-    carrito = session.get('carrito', [])
-    found = False
-    for item in carrito:
-        if str(item['id']) == str(prod['id']):
-            item['cantidad'] = int(item.get('cantidad',1)) + 1
-            found = True
-            break
-    if not found:
-        prod_copy = dict(prod)
-        prod_copy['cantidad'] = 1
-        carrito.append(prod_copy)
-
-    session['carrito'] = carrito
-    session.modified = True
+    carrito = _carrito()
+    pid = str(prod['id'])
+    carrito[pid] = carrito.get(pid, 0) + 1
+    _guardar_carrito(carrito)
     flash('Producto agregado al carrito.', 'success')
     return redirect(url_for('index'))
 
 @app.route('/carrito/aumentar/<id_producto>')
 def carrito_aumentar(id_producto):
-    carrito = session.get('carrito', [])
-    for item in carrito:
-        if str(item['id']) == str(id_producto):
-            item['cantidad'] = int(item.get('cantidad',1)) + 1
-            break
-    session['carrito'] = carrito
-    session.modified = True
+    carrito = _carrito()
+    pid = str(id_producto)
+    if pid in carrito:
+        carrito[pid] += 1
+        _guardar_carrito(carrito)
     return redirect(url_for('mostrar_carrito'))
 
 @app.route('/carrito/disminuir/<id_producto>')
 def carrito_disminuir(id_producto):
-    carrito = session.get('carrito', [])
-    for item in carrito:
-        if str(item['id']) == str(id_producto):
-            item['cantidad'] = int(item.get('cantidad',1)) - 1
-            if item['cantidad'] <= 0:
-                carrito.remove(item)
-            break
-    session['carrito'] = carrito
-    session.modified = True
+    carrito = _carrito()
+    pid = str(id_producto)
+    if pid in carrito:
+        carrito[pid] -= 1
+        if carrito[pid] <= 0:
+            del carrito[pid]
+        _guardar_carrito(carrito)
     return redirect(url_for('mostrar_carrito'))
 
 @app.route('/carrito')
@@ -633,23 +1423,20 @@ def mostrar_carrito():
     if not session.get('usuario'):
         flash('Inicia sesión para ver el carrito.', 'warning')
         return redirect(url_for('login'))
-    carrito = session.get('carrito', [])
-    total = sum(float(p.get('precio',0))*int(p.get('cantidad',1)) for p in carrito)
+    carrito, total = _items_carrito(_carrito())
     return render_template('carrito.html', carrito=carrito, total=total)
 
 @app.route('/carrito/eliminar/<id_producto>', methods=['POST'])
 def eliminar_del_carrito(id_producto):
-    carrito = session.get('carrito', [])
-    carrito = [item for item in carrito if str(item['id']) != str(id_producto)]
-    session['carrito'] = carrito
-    session.modified = True
+    carrito = _carrito()
+    carrito.pop(str(id_producto), None)
+    _guardar_carrito(carrito)
     flash('Producto eliminado.', 'info')
     return redirect(url_for('mostrar_carrito'))
 
 @app.route('/carrito/vaciar', methods=['POST'])
 def vaciar_carrito():
-    session['carrito'] = []
-    session.modified = True
+    _guardar_carrito({})
     flash('Carrito vaciado.', 'info')
     return redirect(url_for('mostrar_carrito'))
 
@@ -659,14 +1446,15 @@ def finalizar_compra():
         flash('Inicia sesión para finalizar la compra.', 'warning')
         return redirect(url_for('login'))
 
-    carrito = session.get('carrito', [])
-    if not carrito:
+    # Precios actuales del catálogo, no los que había al agregar
+    items, total = _items_carrito(_carrito())
+    if not items:
         flash('El carrito está vacío.', 'info')
         return redirect(url_for('index'))
 
     # Aquí podrías enviar los datos a Firebase, email o generar PDF
-    session['carrito'] = []  # Vaciar carrito al finalizar
-    flash('Compra finalizada correctamente. Gracias por tu compra!', 'success')
+    _guardar_carrito({})  # Vaciar carrito al finalizar
+    flash(f'Compra finalizada correctamente por ${total:.2f}. Gracias por tu compra!', 'success')
     return redirect(url_for('index'))
 
 
@@ -677,6 +1465,55 @@ def admin():
     productos = cargar_productos()
     return render_template('admin.html', productos=productos)
 
+@app.route('/admin/fragmentos')
+@admin_required
+def admin_fragmentos():
+    """Aciertos, fallos y memoria de la caché de fragmentos."""
+    return jsonify(fragmentos.estadisticas())
+
+
+# -------- Métricas --------
+# Solo se miden las peticiones con METRICAS=1; apagadas no se registra ningún hook
+def _metricas_inicio():
+    g.metricas_inicio = time.perf_counter()
+
+def _metricas_fin(resp):
+    inicio = g.pop('metricas_inicio', None)
+    if inicio is not None:
+        metricas.observar('http_peticion_segundos', time.perf_counter() - inicio,
+                          ruta=request.endpoint or 'sin_ruta', metodo=request.method, estado=resp.status_code)
+    return resp
+
+def _metricas_error(error):
+    # Por si la respuesta no llegó a armarse y after_request no corrió
+    inicio = g.pop('metricas_inicio', None)
+    if inicio is not None and error is not None:
+        metricas.observar('http_peticion_segundos', time.perf_counter() - inicio,
+                          ruta=request.endpoint or 'sin_ruta', metodo=request.method, estado=500)
+
+if metricas.HABILITADO:
+    app.before_request(_metricas_inicio)
+    app.after_request(_metricas_fin)
+    app.teardown_request(_metricas_error)
+    metricas.registrar_medidor('app_importacion_segundos', 'Tiempo de importación de la app',
+                               lambda: TIEMPO_IMPORT_MS / 1000)
+    metricas.registrar_medidor('catalogo_productos', 'Productos en el catálogo en memoria',
+                               lambda: len(_catalogo['productos']) if _catalogo['productos'] is not None else None)
+    metricas.registrar_medidor('catalogo_version', 'Versión del catálogo en memoria', lambda: _catalogo['version'])
+    metricas.registrar_medidor('catalogo_listener_activo', 'Listener on_snapshot de productos activo (1/0)',
+                               lambda: int(_escucha_activa()))
+    metricas.registrar_medidor('fragmentos', 'Estado de la caché de fragmentos HTML', lambda: {
+        k: v for k, v in fragmentos.estadisticas().items() if isinstance(v, (int, float))}, etiqueta='dato')
+
+@app.route('/metrics')
+def metrics():
+    """Métricas en formato Prometheus, para un admin logueado o con el token de METRICAS_TOKEN."""
+    if not metricas.HABILITADO:
+        abort(404)
+    if session.get('rol') != 'admin' and not metricas.autorizado(request.headers.get('Authorization')):
+        abort(403)
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 
 @app.route('/admin/nuevo', methods=['GET','POST'])
 @admin_required
@@ -717,9 +1554,14 @@ def nuevo_producto():
             return redirect(url_for('nuevo_producto'))
 
         nombre_archivo_ra = ''
+        info_modelo = None
         if archivo_ra and allowed_file(archivo_ra.filename):
             nombre_archivo_ra = secure_filename(archivo_ra.filename)
-            archivo_ra.save(os.path.join(app.config['UPLOAD_FOLDER'], nombre_archivo_ra))
+            try:
+                info_modelo = guardar_modelo(archivo_ra, nombre_archivo_ra)
+            except glb.ModeloInvalido as e:
+                flash(f'El archivo 3D no es válido: {e}', 'danger')
+                return redirect(url_for('nuevo_producto'))
 
         new_id = str(uuid.uuid4())
         nuevo = {
@@ -733,22 +1575,24 @@ def nuevo_producto():
             'fondo': fondo,
             'altura': altura
         }
+        _completar_medidas(nuevo, info_modelo)
+        imagenes.precalentar(imagen)
 
         # Guardar en Firebase primero
         ok_cloud = False
-        if db:
+        if _firestore('productos'):
             try:
-                db.collection('productos').document(new_id).set(nuevo)
+                acceso_firestore.llamar('productos', db.collection('productos').document(new_id).set,
+                                        cambios_productos.con_marca(nuevo))
                 ok_cloud = True
+                _catalogo_upsert(nuevo)
                 print(f"✅ Producto guardado en Firebase: {nombre}")
             except Exception as e:
                 print(f"❌ Error guardando en Firebase: {e}")
 
         # Si Firebase falla, guardar en local
         if not ok_cloud:
-            productos = cargar_productos()
-            productos.append(nuevo)
-            guardar_productos(productos)
+            guardar_producto_local(nuevo, pendiente=True)
             flash('Producto guardado localmente (Firebase no disponible).', 'warning')
             return redirect(url_for('admin'))
 
@@ -758,11 +1602,49 @@ def nuevo_producto():
     return render_template('nuevo_producto.html')
 
 
-@app.route('/admin/editar/<int:indice>', methods=['GET','POST'])
+def _leer_producto_admin(pid):
+    """
+    Un solo producto para editar o borrar, con la versión que se leyó:
+    'nube:<update_time>' si viene de Firestore, 'local:<n>' si viene del
+    almacén local o '' si solo está en el catálogo en memoria.
+    Devuelve (None, '') si no existe.
+    """
+    if _firestore('productos'):
+        try:
+            doc = acceso_firestore.llamar('productos', db.collection('productos').document(pid).get)
+            if doc.exists:
+                prod = doc.to_dict() or {}
+                prod['id'] = str(prod.get('id', doc.id))
+                return _normalize_product(prod, 0), 'nube:' + acceso_firestore.version_remota(doc.update_time)
+        except Exception as e:
+            print(f"⚠️  Error leyendo producto {pid} de Firebase: {e}")
+    try:
+        p, version = almacen_local.obtener_producto_con_version(pid)
+        if p:
+            return _normalize_product(p, 0), f"local:{version}"
+    except Exception as e:
+        print(f"⚠️  Error leyendo producto local {pid}: {e}")
+    prod = obtener_producto(pid)
+    return (dict(prod), '') if prod else (None, '')
+
+def _conflicto_producto(pid, mensaje):
+    """409 con el producto como está ahora, para que el admin revise y vuelva a intentar."""
+    producto, version = _leer_producto_admin(pid)
+    if producto is None:
+        flash('El producto fue eliminado mientras lo editabas.', 'warning')
+        return render_template('admin.html', productos=cargar_productos()), 409
+    flash(mensaje, 'warning')
+    return render_template('editar_producto.html', producto=producto, version=version), 409
+
+# Las rutas de edición van por id y leen/escriben solo ese documento. El
+# formulario lleva la versión leída y la escritura se hace con esa
+# precondición (update_time en Firestore, versión en el almacén local):
+# si el producto cambió entretanto se responde 409 en vez de pisarlo.
+@app.route('/admin/editar/<pid>', methods=['GET','POST'])
 @admin_required
-def editar_producto(indice):
-    productos = cargar_productos()
-    if not (0 <= indice < len(productos)):
+def editar_producto(pid):
+    producto, version = _leer_producto_admin(pid)
+    if producto is None:
         flash('Producto no encontrado.', 'danger')
         return redirect(url_for('admin'))
 
@@ -775,14 +1657,18 @@ def editar_producto(indice):
         fondo = request.form.get('fondo')
         altura = request.form.get('altura')
         archivo_ra = request.files.get('archivo_ra')
+        origen, _, leida = request.form.get('version', '').partition(':')
 
         try:
             precio = float(precio)
         except:
             flash('Precio inválido.', 'danger')
-            return redirect(url_for('editar_producto', indice=indice))
+            return redirect(url_for('editar_producto', pid=pid))
 
-        productos[indice].update({
+        # Solo los campos del formulario: 'version', 'promedio' y los
+        # contadores de calificación no se reescriben. Pasan por la misma
+        # normalización que el alta y la importación (medidas a float o None)
+        formulario = {
             'nombre': nombre,
             'descripcion': descripcion,
             'precio': precio,
@@ -790,67 +1676,161 @@ def editar_producto(indice):
             'frente': frente,
             'fondo': fondo,
             'altura': altura
-
-        })
+        }
+        normalizado = _normalize_product(dict(producto, **formulario), 0)
+        cambios = {campo: normalizado[campo] for campo in formulario}
 
         if archivo_ra and allowed_file(archivo_ra.filename):
             nombre_archivo_ra = secure_filename(archivo_ra.filename)
-            archivo_ra.save(os.path.join(app.config['UPLOAD_FOLDER'], nombre_archivo_ra))
-            productos[indice]['archivo_ra'] = nombre_archivo_ra
-
-        # Guardar en Firebase primero
+            try:
+                info_modelo = guardar_modelo(archivo_ra, nombre_archivo_ra)
+            except glb.ModeloInvalido as e:
+                flash(f'El archivo 3D no es válido: {e}', 'danger')
+                return redirect(url_for('editar_producto', pid=pid))
+            cambios['archivo_ra'] = nombre_archivo_ra
+            _completar_medidas(cambios, info_modelo)
+        imagenes.precalentar(imagen)
+        editado = dict(producto, **cambios)
+        conflicto = 'El producto cambió mientras lo editabas: revisa los datos actuales y vuelve a guardar.'
+
+        # Guardar en Firebase primero, con la update_time que vio el admin
         ok_cloud = False
-        if db:
+        if origen == 'nube' and _firestore('productos'):
+            from google.api_core.exceptions import FailedPrecondition, NotFound
             try:
-                pid = str(productos[indice]['id'])
-                db.collection('productos').document(pid).set(productos[indice], merge=True)
+                opcion = db.write_option(last_update_time=acceso_firestore.leer_version_remota(leida))
+                acceso_firestore.llamar('productos', db.collection('productos').document(pid).update,
+                                        cambios_productos.con_marca(cambios), option=opcion)
                 ok_cloud = True
+                _catalogo_upsert(editado)
                 print(f"✅ Producto actualizado en Firebase: {pid}")
+            except (FailedPrecondition, NotFound, ValueError):
+                return _conflicto_producto(pid, conflicto)
             except Exception as e:
                 print(f"❌ Error actualizando en Firebase: {e}")
 
-        # Si Firebase falla, guardar local
+        # Si Firebase falla (o el producto solo está en local), guardar local
         if not ok_cloud:
-            guardar_productos(productos)
-            flash('Producto actualizado localmente (Firebase no disponible).', 'warning')
+            try:
+                guardar_producto_local(editado, pendiente=True, base=producto,
+                                       version=int(leida) if origen == 'local' else None)
+            except (almacen_local.VersionDistinta, ValueError):
+                return _conflicto_producto(pid, conflicto)
+            flash('Producto actualizado localmente (se sube a Firebase cuando esté disponible).', 'warning')
             return redirect(url_for('admin'))
 
         flash('Producto actualizado correctamente ✅', 'success')
         return redirect(url_for('admin'))
 
-    return render_template('editar_producto.html', producto=productos[indice], indice=indice)
+    return render_template('editar_producto.html', producto=producto, version=version)
 
 
-@app.route('/admin/eliminar/<int:indice>', methods=['POST'])
+@app.route('/admin/eliminar/<pid>', methods=['POST'])
 @admin_required
-def eliminar_producto(indice):
-    productos = cargar_productos()
-    if 0 <= indice < len(productos):
-        pid = str(productos[indice]['id'])
-        producto_nombre = productos[indice]['nombre']
-        productos.pop(indice)
+def eliminar_producto(pid):
+    producto, actual = _leer_producto_admin(pid)
+    if producto is None:
+        flash('Producto no encontrado.', 'danger')
+        return redirect(url_for('admin'))
+    # Desde la lista no viaja versión: se borra el documento tal como se acaba de leer
+    origen, _, leida = (request.form.get('version') or actual).partition(':')
+    conflicto = 'El producto cambió desde que lo viste y no se eliminó: revisa los datos actuales.'
+
+    # Eliminar en Firebase primero
+    ok_cloud = False
+    if origen == 'nube' and _firestore('productos'):
+        from google.api_core.exceptions import FailedPrecondition, NotFound
+        try:
+            opcion = db.write_option(last_update_time=acceso_firestore.leer_version_remota(leida))
+            # El borrado deja lápida en productos_borrados para la sincronización incremental
+            cambios_productos.eliminar(db, pid, option=opcion)
+            ok_cloud = True
+            _catalogo_eliminar(pid)
+            print(f"✅ Producto eliminado de Firebase: {producto['nombre']}")
+        except (FailedPrecondition, NotFound, ValueError):
+            return _conflicto_producto(pid, conflicto)
+        except Exception as e:
+            print(f"❌ Error eliminando en Firebase: {e}")
 
-        # Eliminar en Firebase primero
-        ok_cloud = False
-        if db:
-            try:
-                db.collection('productos').document(pid).delete()
-                ok_cloud = True
-                print(f"✅ Producto eliminado de Firebase: {producto_nombre}")
-            except Exception as e:
-                print(f"❌ Error eliminando en Firebase: {e}")
+    # Si Firebase falla, eliminar solo en local
+    if not ok_cloud:
+        try:
+            eliminar_producto_local(pid, pendiente=True, base=producto,
+                                    version=int(leida) if origen == 'local' else None)
+        except (almacen_local.VersionDistinta, ValueError):
+            return _conflicto_producto(pid, conflicto)
+        flash('Producto eliminado localmente (se sube a Firebase cuando esté disponible).', 'warning')
+        return redirect(url_for('admin'))
 
-        # Si Firebase falla, guardar lista local
-        if not ok_cloud:
-            guardar_productos(productos)
-            flash('Producto eliminado localmente (Firebase no disponible).', 'warning')
-            return redirect(url_for('admin'))
+    # Si Firebase fue exitoso, actualizar local también
+    eliminar_producto_local(pid)
+    flash('Producto eliminado correctamente ✅', 'success')
+    return redirect(url_for('admin'))
 
-        # Si Firebase fue exitoso, actualizar local también
-        guardar_productos(productos)
-        flash('Producto eliminado correctamente ✅', 'success')
 
-    return redirect(url_for('admin'))
+# -------- Importar / exportar catálogo --------
+def _catalogo_importado():
+    # Sin listener, la próxima lectura del catálogo vuelve a Firestore
+    with _catalogo_lock:
+        _catalogo['actualizado'] = 0.0
+
+
+@app.route('/admin/importar', methods=['GET','POST'])
+@admin_required
+def importar_productos():
+    """
+    CSV o JSONL de productos, por lotes y retomable (ver catalogo_masivo).
+    La importación corre en un hilo, fuera del timeout del request; la página
+    sigue su avance con ?archivo=<huella>, que se lee de local.db y sirve
+    desde cualquier worker.
+    """
+    if request.method == 'GET':
+        h = request.args.get('archivo', '')
+        resumen = catalogo_masivo.leer_avance(h) if h else {}
+        return render_template('importar.html', resumen=resumen or None,
+                               en_curso=catalogo_masivo.en_curso(resumen))
+
+    archivo = request.files.get('archivo')
+    try:
+        formato = catalogo_masivo.formato_de(archivo.filename if archivo else '')
+    except ValueError as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('importar_productos'))
+    if not _firestore('productos'):
+        flash('Firebase no está disponible; intenta más tarde (la importación retoma donde quedó).', 'warning')
+        return redirect(url_for('importar_productos'))
+
+    os.makedirs(catalogo_masivo.CARPETA_SUBIDAS, exist_ok=True)
+    ruta = os.path.join(catalogo_masivo.CARPETA_SUBIDAS, f"{uuid.uuid4().hex}.{formato}")
+    archivo.save(ruta)
+    desde_cero = request.form.get('desde_cero') == '1'
+    try:
+        h = catalogo_masivo.importar_en_segundo_plano(ruta, formato, _normalize_product, db, desde_cero=desde_cero,
+                                                     al_terminar=_catalogo_importado)
+    except catalogo_masivo.ImportacionEnCurso as e:
+        flash('Ese archivo ya se está importando; abajo se ve cómo va.', 'info')
+        return redirect(url_for('importar_productos', archivo=e.huella))
+
+    if not desde_cero and catalogo_masivo.leer_avance(h).get('completa'):
+        flash('Este archivo ya se importó completo. Marca "desde cero" para repetirlo.', 'info')
+    return redirect(url_for('importar_productos', archivo=h))
+
+
+@app.route('/admin/exportar.<formato>')
+@admin_required
+def exportar_productos(formato):
+    """Descarga el catálogo en CSV o JSONL, generado de a una línea."""
+    if formato not in ('csv', 'jsonl'):
+        abort(404)
+    if _firestore('productos'):
+        productos = catalogo_masivo.productos_remotos(db)
+    else:
+        productos = cargar_productos()
+    tipos = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+    nombre = f"productos-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{formato}"
+    return Response(stream_with_context(catalogo_masivo.exportar_lineas(productos, formato)),
+                    mimetype=tipos[formato],
+                    headers={'Content-Disposition': f'attachment; filename="{nombre}"'})
 
 
 @app.route('/admin/nuevo_admin', methods=['GET','POST'])
@@ -865,15 +1845,19 @@ def nuevo_admin():
             flash('Todos los campos son obligatorios.', 'warning')
             return redirect(url_for('nuevo_admin'))
 
-        # Verificar si ya existe
-        usuarios = cargar_usuarios()
-        for u in usuarios:
-            if u.get('correo','').lower() == correo:
-                flash('El correo ya está registrado.', 'warning')
-                return redirect(url_for('nuevo_admin'))
+        # Verificar si ya existe (documento en Firebase o registro local)
+        existe = buscar_usuario_local(correo) is not None
+        if not existe and _firestore('usuarios'):
+            try:
+                existe = acceso_firestore.llamar('usuarios', db.collection('usuarios').document(correo).get).exists
+            except Exception as e:
+                print(f"⚠️ Error verificando Firebase: {e}")
+        if existe:
+            flash('El correo ya está registrado.', 'warning')
+            return redirect(url_for('nuevo_admin'))
 
         # Encriptar contraseña
-        hashed = bcrypt.generate_password_hash(clave).decode('utf-8')
+        hashed = hash_password(clave)
 
         # Crear usuario admin
         nuevo = {
@@ -885,9 +1869,9 @@ def nuevo_admin():
 
         # Guardar en Firebase primero
         ok_cloud = False
-        if db:
+        if _firestore('usuarios'):
             try:
-                db.collection('usuarios').document(correo).set(nuevo)
+                acceso_firestore.llamar('usuarios', db.collection('usuarios').document(correo).set, nuevo)
                 ok_cloud = True
                 print(f"✅ Nuevo admin guardado en Firebase: {correo}")
             except Exception as e:
@@ -895,7 +1879,7 @@ def nuevo_admin():
 
         # Si Firebase falla, guardar local
         if not ok_cloud:
-            guardar_usuario_local(nuevo)
+            guardar_usuario_local(nuevo, pendiente=True)
             flash('Administrador creado localmente (Firebase no disponible).', 'warning')
             return redirect(url_for('admin'))
 
@@ -911,11 +1895,10 @@ def recuperar():
         correo = request.form["correo"].strip().lower()
         try:
             # Verificamos si el correo existe (Firebase o local)
-            usuarios = cargar_usuarios()
-            user_exists = any(u.get("correo") == correo for u in usuarios)
-            if db:
+            user_exists = buscar_usuario_local(correo) is not None
+            if _firestore('usuarios'):
                 try:
-                    doc = db.collection("usuarios").document(correo).get()
+                    doc = acceso_firestore.llamar('usuarios', db.collection("usuarios").document(correo).get)
                     user_exists = user_exists or doc.exists
                 except Exception as e:
                     print(f"⚠️ Error comprobando usuario en Firebase: {e}")
@@ -973,29 +1956,20 @@ def reset_password(token):
             flash("Las contraseñas no coinciden.", "danger")
             return redirect(request.url)
 
-        hashed = bcrypt.generate_password_hash(nueva_password).decode("utf-8")
+        hashed = hash_password(nueva_password)
 
         try:
-            if db:
+            if _firestore('usuarios'):
                 doc_ref = db.collection("usuarios").document(correo)
-                if doc_ref.get().exists:
-                    doc_ref.update({"clave": hashed})
+                if acceso_firestore.llamar('usuarios', doc_ref.get).exists:
+                    acceso_firestore.llamar('usuarios', doc_ref.update, {"clave": hashed})
                 else:
                     flash("El usuario no existe.", "danger")
                     return redirect(url_for("recuperar"))
             else:
-                usuarios = cargar_usuarios()
-                found = False
-                for u in usuarios:
-                    if u.get("correo") == correo:
-                        u["clave"] = hashed
-                        found = True
-                        break
-                if not found:
+                if not almacen_local.actualizar_usuario(correo, {"clave": hashed}):
                     flash("El usuario no existe.", "danger")
                     return redirect(url_for("recuperar"))
-                with open(USUARIOS_JSON, "w", encoding="utf-8") as f:
-                    json.dump(usuarios, f, ensure_ascii=False, indent=2)
 
             flash("Tu contraseña ha sido restablecida con éxito. Ahora puedes iniciar sesión.", "success")
             return redirect(url_for("login"))
@@ -1007,6 +1981,44 @@ def reset_password(token):
 
     return render_template("reset_password.html", token=token)
 
+# -------- Arranque --------
+def calentar():
+    """
+    Deja el worker listo antes de recibir tráfico: abre la conexión a
+    Firestore, carga el catálogo con sus índices y arranca el listener.
+    Devuelve los milisegundos que tardó.
+    """
+    inicio = time.perf_counter()
+    try:
+        cargar_productos()
+        _catalogo_con_indices()
+    except Exception as e:
+        print(f"⚠️  Calentamiento incompleto: {e}")
+    # Sube lo que haya quedado en el diario offline de una corrida anterior
+    diario_offline.iniciar_reenvio()
+    # Y manda los correos que quedaron en la cola (worker caído o reiniciado)
+    correo.iniciar_despachador()
+    ms = (time.perf_counter() - inicio) * 1000
+    print(f"🔥 Worker {os.getpid()} calentado en {ms:.0f} ms")
+    return ms
+
+def cerrar():
+    """Corta el listener de productos al terminar el worker."""
+    global _escucha_productos
+    with _recarga_lock:
+        if _escucha_productos is not None:
+            try:
+                _escucha_productos.unsubscribe()
+            except Exception as e:
+                print(f"⚠️  Error cerrando el listener de productos: {e}")
+            _escucha_productos = None
+
+TIEMPO_IMPORT_MS = (time.perf_counter() - _INICIO_IMPORT) * 1000
+print(f"⏱️  app importada en {TIEMPO_IMPORT_MS:.0f} ms (pid {os.getpid()})")
+
+if os.environ.get('CALENTAR_AL_INICIAR') == '1':
+    calentar()
+
 # -------- Run --------
 if __name__=='__main__':
     port = int(os.environ.get('PORT', 5000))
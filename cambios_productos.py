@@ -0,0 +1,102 @@
+import base64
+
+import acceso_firestore
+
+try:
+    from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+except ImportError:  # sin las librerías de Google no hay Firestore al que escribir
+    SERVER_TIMESTAMP = None
+
+# =====================================================
+# 🔹 SINCRONIZACIÓN INCREMENTAL DEL CATÁLOGO (app Flutter)
+# Cada escritura de un producto en Firestore pone `updated_at` con la hora
+# del servidor, y cada baja deja una lápida en productos_borrados/{id}
+# con su propio `updated_at`. Así se puede pedir solo lo que cambió:
+#   GET /api/productos?since=            -> todo, más un token
+#   GET /api/productos?since=<token>     -> altas/ediciones y bajas posteriores
+# Las dos colecciones se leen ordenadas por (updated_at, id) desde el
+# token, con el índice de un solo campo que Firestore crea solo; un
+# catálogo sin cambios cuesta una lectura por colección.
+# Los productos anteriores a esto no tienen `updated_at`: marcarlos una vez con
+#   python migraciones.py marcas
+# =====================================================
+
+CAMPO = 'updated_at'
+BORRADOS = 'productos_borrados'
+
+
+class TokenInvalido(ValueError):
+    """El token de ?since= no es uno que haya dado el servidor."""
+
+
+def con_marca(datos):
+    """Copia de `datos` con updated_at = hora del servidor al confirmar la escritura."""
+    return dict(datos, **{CAMPO: SERVER_TIMESTAMP})
+
+
+def anotar_borrado(db, lote, pid):
+    """Agrega al lote la lápida de `pid` (va en el mismo commit que el delete)."""
+    lote.set(db.collection(BORRADOS).document(str(pid)), {CAMPO: SERVER_TIMESTAMP})
+
+
+def eliminar(db, pid, option=None):
+    """Borra productos/{pid} y deja su lápida en una sola escritura atómica."""
+    lote = db.batch()
+    lote.delete(db.collection('productos').document(str(pid)), option=option)
+    anotar_borrado(db, lote, pid)
+    acceso_firestore.llamar('productos', lote.commit)
+
+
+# ----------------------------
+# TOKENS
+# ----------------------------
+def token(momento, pid):
+    """Posición (updated_at, id) como texto opaco para la URL."""
+    crudo = f"{acceso_firestore.version_remota(momento)}|{pid}".encode('utf-8')
+    return base64.urlsafe_b64encode(crudo).decode('ascii').rstrip('=')
+
+
+def leer_token(texto):
+    """(updated_at, id) del token; None si está vacío. TokenInvalido si no se entiende."""
+    if not texto:
+        return None
+    try:
+        crudo = base64.urlsafe_b64decode(texto + '=' * (-len(texto) % 4)).decode('utf-8')
+        momento, separador, pid = crudo.partition('|')
+        if not separador or not pid:
+            raise ValueError('sin id')
+        return acceso_firestore.leer_version_remota(momento), pid
+    except ValueError as e:
+        raise TokenInvalido("Token no válido") from e
+
+
+# ----------------------------
+# CONSULTA
+# ----------------------------
+def cambios_desde(db, texto, limite):
+    """
+    Lo escrito y borrado después del token `texto` ('' = desde el principio),
+    como mucho `limite` entradas en orden de updated_at.
+    Devuelve (productos [(id, datos)], eliminados [id], token nuevo, hay_mas).
+    Si no hubo cambios, el token nuevo es el mismo.
+    """
+    cursor = leer_token(texto)
+    encontrados = []
+    for coleccion, borrado in (('productos', False), (BORRADOS, True)):
+        q = db.collection(coleccion).order_by(CAMPO).order_by('__name__')
+        if cursor is not None:
+            q = q.start_after({CAMPO: cursor[0], '__name__': cursor[1]})
+        for d in acceso_firestore.llamar('productos', q.limit(limite + 1).stream):
+            datos = d.to_dict() or {}
+            momento = datos.pop(CAMPO, None)
+            if momento is None:
+                # updated_at en null: Firestore lo ordena primero, pero no da un token
+                continue
+            encontrados.append((momento, str(d.id), borrado, datos))
+    # Una sola posición para las dos colecciones: se corta la mezcla, no cada consulta
+    encontrados.sort(key=lambda e: (e[0], e[1], e[2]))
+    pagina = encontrados[:limite]
+    productos = [(pid, datos) for _, pid, borrado, datos in pagina if not borrado]
+    eliminados = [pid for _, pid, borrado, _ in pagina if borrado]
+    nuevo = token(pagina[-1][0], pagina[-1][1]) if pagina else texto
+    return productos, eliminados, nuevo, len(encontrados) > limite
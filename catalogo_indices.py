@@ -0,0 +1,116 @@
+from bisect import bisect_left, bisect_right
+
+# =====================================================
+# 🔹 ÍNDICES ORDENADOS DEL CATÁLOGO
+# Se construyen una vez por versión del catálogo y permiten filtrar por
+# rangos, ordenar y contar facetas con bisect, sin recorrer los productos
+# en cada request.
+# =====================================================
+
+CAMPOS_RANGO = ('precio', 'frente', 'fondo', 'altura', 'promedio', 'volumen')
+
+# Criterio de orden público -> campo indexado
+ORDENES = {
+    'precio': 'precio',
+    'calificacion': 'promedio',
+    'tamano': 'volumen',
+}
+
+# Límites inferiores de cada intervalo del histograma (el último queda abierto)
+LIMITES_FACETAS = {
+    'precio': [0, 50, 100, 200, 500],
+    'frente': [0, 50, 100, 150, 200],
+    'fondo': [0, 30, 60, 90],
+    'altura': [0, 50, 100, 150, 200],
+    'promedio': [1, 2, 3, 4, 5],
+}
+
+
+def _valor(prod, campo):
+    if campo == 'volumen':
+        medidas = [prod.get('frente'), prod.get('fondo'), prod.get('altura')]
+        if any(m is None for m in medidas):
+            return None
+        return medidas[0] * medidas[1] * medidas[2]
+    v = prod.get(campo)
+    return float(v) if isinstance(v, (int, float)) else None
+
+
+def construir_indices(productos):
+    """
+    Para cada campo guarda los valores ordenados y, en paralelo, la posición
+    del producto en la lista. Los productos sin valor no entran en el índice.
+    """
+    indices = {'n': len(productos), 'campos': {}, 'valores': {}}
+    for campo in CAMPOS_RANGO:
+        valores_por_pos = [_valor(p, campo) for p in productos]
+        pares = sorted((v, pos) for pos, v in enumerate(valores_por_pos) if v is not None)
+        indices['campos'][campo] = ([v for v, _ in pares], [pos for _, pos in pares])
+        indices['valores'][campo] = valores_por_pos
+    return indices
+
+
+def _rango(indices, campo, minimo, maximo):
+    valores, posiciones = indices['campos'][campo]
+    i = bisect_left(valores, minimo) if minimo is not None else 0
+    j = bisect_right(valores, maximo) if maximo is not None else len(valores)
+    return posiciones[i:j]
+
+
+def filtrar(indices, rangos, excluir=None):
+    """
+    rangos: {campo: (min, max)} con None para un extremo abierto.
+    Devuelve el conjunto de posiciones que cumplen todos los rangos,
+    o None si no hay filtros (todo el catálogo).
+    """
+    seleccion = None
+    # Empezar por el rango más estrecho reduce el tamaño de las intersecciones
+    candidatos = sorted(
+        (_rango(indices, c, lo, hi) for c, (lo, hi) in rangos.items() if c != excluir),
+        key=len,
+    )
+    for posiciones in candidatos:
+        seleccion = set(posiciones) if seleccion is None else seleccion.intersection(posiciones)
+        if not seleccion:
+            break
+    return seleccion
+
+
+def ordenar(indices, seleccion, orden=None, descendente=False):
+    """Devuelve las posiciones seleccionadas en el orden pedido."""
+    if not orden:
+        todas = range(indices['n'])
+        return [i for i in todas if seleccion is None or i in seleccion]
+
+    _, posiciones = indices['campos'][ORDENES[orden]]
+    recorrido = reversed(posiciones) if descendente else posiciones
+    resultado = [i for i in recorrido if seleccion is None or i in seleccion]
+    # Los productos sin ese dato van al final, en su orden original
+    con_valor = set(posiciones)
+    resultado.extend(i for i in range(indices['n'])
+                     if i not in con_valor and (seleccion is None or i in seleccion))
+    return resultado
+
+
+def facetas(indices, rangos):
+    """
+    Histograma por campo: cuántos productos caen en cada intervalo.
+    Cada faceta se calcula con los filtros de los demás campos, para que
+    el usuario vea cuántos resultados obtendría al cambiar ese rango.
+    """
+    resultado = {}
+    for campo, limites in LIMITES_FACETAS.items():
+        seleccion = filtrar(indices, rangos, excluir=campo)
+        valores, posiciones = indices['campos'][campo]
+        cubetas = []
+        for k, desde in enumerate(limites):
+            hasta = limites[k + 1] if k + 1 < len(limites) else None
+            i = bisect_left(valores, desde)
+            j = bisect_left(valores, hasta) if hasta is not None else len(valores)
+            if seleccion is None:
+                cantidad = j - i
+            else:
+                cantidad = sum(1 for pos in posiciones[i:j] if pos in seleccion)
+            cubetas.append({'desde': desde, 'hasta': hasta, 'cantidad': cantidad})
+        resultado[campo] = cubetas
+    return resultado
@@ -0,0 +1,414 @@
+import io
+import os
+import csv
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import almacen_local
+import acceso_firestore
+import cambios_productos
+
+# =====================================================
+# 🔹 IMPORTACIÓN / EXPORTACIÓN MASIVA DE PRODUCTOS (CSV o JSONL)
+# Los archivos se leen y se escriben fila por fila, sin cargarlos enteros:
+#   - cada fila se valida y se normaliza con _normalize_product
+#   - se escribe en Firestore en WriteBatch de LOTE productos (set con
+#     merge: no se tocan las calificaciones de los que ya existen)
+#   - las imágenes y modelos que la fila nombra como archivos de la
+#     carpeta de archivos se suben con un pool de ARCHIVOS_HILOS hilos
+#     antes de confirmar cada lote
+#   - tras cada lote se guarda hasta qué fila se llegó (tabla meta de
+#     local.db, por hash del archivo): si la importación se corta, al
+#     volver a correrla con el mismo archivo sigue desde ahí
+#   python catalogo_masivo.py importar productos.csv --archivos ./fotos
+#   python catalogo_masivo.py exportar catalogo.jsonl
+# En la app: /admin/importar (corre en un hilo del worker y la página
+# muestra el avance) y /admin/exportar.csv | .jsonl
+# =====================================================
+
+LOTE = int(os.environ.get('IMPORTAR_LOTE', 400))
+ARCHIVOS_HILOS = int(os.environ.get('IMPORTAR_HILOS', 8))
+PAGINA_EXPORTAR = 500
+# Errores que se devuelven con detalle; el resto solo se cuenta
+ERRORES_MAX = 200
+# Donde quedan los archivos subidos desde la app mientras se importan
+CARPETA_SUBIDAS = os.environ.get('IMPORTAR_CARPETA', 'importaciones')
+# Una importación "en curso" que no avanza hace este tiempo se da por muerta
+# (el worker se reinició) y se puede volver a lanzar
+SIN_AVANCE_MAX = 120
+
+FORMATOS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+COLUMNAS = ('id', 'nombre', 'descripcion', 'precio', 'imagen', 'archivo_ra', 'frente', 'fondo', 'altura')
+CAMPOS_NUMERICOS = ('precio', 'frente', 'fondo', 'altura')
+CAMPOS_ARCHIVO = ('imagen', 'archivo_ra')
+# Derivados y contadores: una importación no los pisa
+CAMPOS_NO_IMPORTABLES = ('version', 'promedio', 'comentarios', cambios_productos.CAMPO,
+                         'calif_cantidad', 'calif_suma', 'calif_estrellas', 'calificaciones')
+
+
+class FilaInvalida(ValueError):
+    """La fila no se puede importar; el mensaje dice por qué."""
+
+
+class ImportacionEnCurso(RuntimeError):
+    """Ese archivo ya se está importando; `huella` sirve para seguir su avance."""
+
+    def __init__(self, huella_archivo):
+        super().__init__("Ese archivo ya se está importando")
+        self.huella = huella_archivo
+
+
+def formato_de(nombre_archivo):
+    """'csv' o 'jsonl' según la extensión. ValueError si no es ninguno."""
+    formato = FORMATOS.get(os.path.splitext(nombre_archivo or '')[1].lower())
+    if formato is None:
+        raise ValueError("El archivo debe ser .csv o .jsonl")
+    return formato
+
+
+# ----------------------------
+# LECTURA Y VALIDACIÓN
+# ----------------------------
+def leer_filas(texto, formato):
+    """(número de fila, dict o FilaInvalida), de a una, desde un archivo de texto."""
+    if formato == 'csv':
+        for n, fila in enumerate(csv.DictReader(texto), start=1):
+            yield n, {k.strip(): v.strip() for k, v in fila.items()
+                      if k and isinstance(v, str) and v.strip()}
+        return
+    for n, linea in enumerate(texto, start=1):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError as e:
+            yield n, FilaInvalida(f"JSON inválido: {e}")
+            continue
+        yield n, fila if isinstance(fila, dict) else FilaInvalida("la línea no es un objeto JSON")
+
+
+def id_estable(fila):
+    """Id para filas sin 'id': depende solo del contenido, así reimportar no duplica."""
+    crudo = json.dumps(fila, sort_keys=True, ensure_ascii=False, default=str)
+    return 'imp-' + hashlib.sha1(crudo.encode('utf-8')).hexdigest()[:20]
+
+
+def id_valido(pid):
+    """Firestore no acepta ids con '/', '.', '..', '__...__' ni de más de 1500 bytes."""
+    return (bool(pid) and '/' not in pid and pid not in ('.', '..')
+            and not (pid.startswith('__') and pid.endswith('__')) and len(pid.encode('utf-8')) <= 1500)
+
+
+def validar(fila, n, normalizar):
+    """Producto listo para Firestore a partir de una fila. Lanza FilaInvalida."""
+    if isinstance(fila, FilaInvalida):
+        raise fila
+    fila = {k: v for k, v in fila.items() if k not in CAMPOS_NO_IMPORTABLES}
+    if not str(fila.get('nombre') or '').strip():
+        raise FilaInvalida("falta 'nombre'")
+    for campo in CAMPOS_NUMERICOS:
+        valor = fila.get(campo)
+        if valor in (None, ''):
+            continue
+        try:
+            float(valor)
+        except (TypeError, ValueError):
+            raise FilaInvalida(f"'{campo}' no es un número: {valor!r}")
+    if not str(fila.get('id') or '').strip():
+        fila['id'] = id_estable(fila)
+    producto = normalizar(fila, n - 1)
+    if not id_valido(producto['id']):
+        raise FilaInvalida(f"id no válido para Firestore: {producto['id']!r}")
+    for campo in CAMPOS_NO_IMPORTABLES:
+        producto.pop(campo, None)
+    return producto
+
+
+# ----------------------------
+# ARCHIVOS REFERENCIADOS
+# ----------------------------
+def _subir_archivos(productos, carpeta, subir):
+    """
+    Sube en paralelo los archivos de `carpeta` que nombran los productos.
+    subir(ruta, campo) devuelve (valor para el campo, campos extra que se
+    completan si están vacíos). Devuelve los productos que fallaron como
+    [(n, producto, motivo)]; a los demás les deja los valores nuevos.
+    """
+    rutas = {}
+    for _, p in productos:
+        for campo in CAMPOS_ARCHIVO:
+            valor = str(p.get(campo) or '')
+            if not valor or '://' in valor:
+                continue
+            ruta = os.path.join(carpeta, valor)
+            if os.path.isfile(ruta):
+                rutas[(ruta, campo)] = None
+    if not rutas:
+        return []
+
+    def _una(clave):
+        try:
+            return clave, subir(*clave), None
+        except Exception as e:
+            return clave, None, e
+
+    with ThreadPoolExecutor(max_workers=min(ARCHIVOS_HILOS, len(rutas))) as pool:
+        for clave, resultado, error in pool.map(_una, list(rutas)):
+            rutas[clave] = error if error is not None else resultado
+
+    fallidos = []
+    for n, p in productos:
+        motivo = None
+        for campo in CAMPOS_ARCHIVO:
+            resultado = rutas.get((os.path.join(carpeta, str(p.get(campo) or '')), campo))
+            if resultado is None:
+                continue
+            if isinstance(resultado, Exception):
+                motivo = f"no se pudo subir {p[campo]}: {resultado}"
+                break
+            valor, extra = resultado
+            p[campo] = valor
+            for k, v in (extra or {}).items():
+                if p.get(k) in (None, ''):
+                    p[k] = v
+        if motivo:
+            fallidos.append((n, p, motivo))
+    return fallidos
+
+
+# ----------------------------
+# AVANCE (para retomar)
+# ----------------------------
+def huella(binario):
+    """sha256 del archivo, leído de a 1 MB; deja el archivo al principio."""
+    h = hashlib.sha256()
+    binario.seek(0)
+    for bloque in iter(lambda: binario.read(1 << 20), b''):
+        h.update(bloque)
+    binario.seek(0)
+    return h.hexdigest()
+
+
+def leer_avance(huella_archivo):
+    with almacen_local.lectura() as conn:
+        fila = conn.execute("SELECT valor FROM meta WHERE clave = ?", (f"importacion:{huella_archivo}",)).fetchone()
+    return json.loads(fila['valor']) if fila and fila['valor'] else {}
+
+
+def _guardar_avance(huella_archivo, avance):
+    avance = dict(avance, actualizado=time.time())
+    with almacen_local.transaccion() as conn:
+        conn.execute(
+            "INSERT INTO meta (clave, valor) VALUES (?, ?) ON CONFLICT(clave) DO UPDATE SET valor = excluded.valor",
+            (f"importacion:{huella_archivo}", json.dumps(avance)),
+        )
+
+
+def en_curso(avance):
+    """True si otra corrida de ese archivo sigue avanzando (en este u otro worker)."""
+    return avance.get('estado') == 'en_curso' and time.time() - avance.get('actualizado', 0) < SIN_AVANCE_MAX
+
+
+# ----------------------------
+# IMPORTAR
+# ----------------------------
+CAMPOS_AVANCE = ('importados', 'errores', 'detalle_errores', 'fila', 'completa', 'estado')
+
+
+def _escribir_lote(db, productos):
+    col = db.collection('productos')
+    lote = db.batch()
+    for _, p in productos:
+        lote.set(col.document(str(p['id'])), cambios_productos.con_marca(p), merge=True)
+    acceso_firestore.llamar('productos', lote.commit)
+
+
+def importar(binario, formato, normalizar, db, carpeta=None, subir=None, desde_cero=False, al_avanzar=None):
+    """
+    Importa productos desde un archivo abierto en binario (con seek).
+    `normalizar` es _normalize_product; `carpeta` y `subir` (ver
+    _subir_archivos) son opcionales. Devuelve el resumen:
+    {'importados', 'errores', 'detalle_errores', 'fila', 'desde', 'completa', 'ya_importado', 'estado'}.
+    Los errores de Firestore se propagan; lo confirmado hasta el último lote
+    queda en el avance (con estado 'cortada') y la próxima corrida sigue desde ahí.
+    """
+    if not db:
+        raise RuntimeError("Firebase no está disponible")
+    h = huella(binario)
+    avance = {} if desde_cero else leer_avance(h)
+    if avance.get('completa'):
+        return dict(avance, desde=avance['fila'], ya_importado=True)
+    desde = avance.get('fila', 0)
+    resumen = {'importados': avance.get('importados', 0), 'errores': avance.get('errores', 0),
+               'detalle_errores': [tuple(e) for e in avance.get('detalle_errores', [])],
+               'fila': desde, 'desde': desde, 'completa': False, 'ya_importado': False, 'estado': 'en_curso'}
+
+    def _error(n, motivo):
+        resumen['errores'] += 1
+        if len(resumen['detalle_errores']) < ERRORES_MAX:
+            resumen['detalle_errores'].append((n, motivo))
+
+    def _confirmar(productos, hasta):
+        if productos and carpeta and subir:
+            fallidos = _subir_archivos(productos, carpeta, subir)
+            for n, _, motivo in fallidos:
+                _error(n, motivo)
+            malos = {n for n, _, _ in fallidos}
+            productos = [(n, p) for n, p in productos if n not in malos]
+        if productos:
+            _escribir_lote(db, productos)
+        resumen['importados'] += len(productos)
+        resumen['fila'] = hasta
+        _guardar_avance(h, {k: resumen[k] for k in CAMPOS_AVANCE})
+        if al_avanzar:
+            al_avanzar(resumen)
+
+    texto = io.TextIOWrapper(binario, encoding='utf-8-sig', newline='')
+    try:
+        lote, ultima = [], desde
+        for n, fila in leer_filas(texto, formato):
+            if n <= desde:
+                continue
+            ultima = n
+            try:
+                lote.append((n, validar(fila, n, normalizar)))
+            except FilaInvalida as e:
+                _error(n, str(e))
+            if len(lote) >= LOTE:
+                _confirmar(lote, ultima)
+                lote = []
+        resumen['completa'] = True
+        resumen['estado'] = 'completa'
+        _confirmar(lote, ultima)
+    except Exception as e:
+        # Queda lo confirmado hasta el último lote; se retoma desde ahí
+        _guardar_avance(h, dict(leer_avance(h), estado='cortada', error=str(e)))
+        raise
+    finally:
+        # El archivo es del que llamó: no se cierra junto con el envoltorio de texto
+        texto.detach()
+    return resumen
+
+
+def importar_en_segundo_plano(ruta, formato, normalizar, db, desde_cero=False, al_terminar=None):
+    """
+    Lanza importar() sobre el archivo `ruta` en un hilo y devuelve su huella,
+    con la que se sigue el avance (leer_avance). El archivo se borra al
+    terminar. Lanza ImportacionEnCurso si ese archivo ya se está importando.
+    """
+    with open(ruta, 'rb') as f:
+        h = huella(f)
+    avance = leer_avance(h)
+    if en_curso(avance):
+        os.remove(ruta)
+        raise ImportacionEnCurso(h)
+    if not avance.get('completa') or desde_cero:
+        # Marca de inicio: la página de avance ya la ve y otro envío no la duplica
+        _guardar_avance(h, dict({} if desde_cero else avance, estado='en_curso', error=None))
+
+    def _correr():
+        try:
+            with open(ruta, 'rb') as f:
+                importar(f, formato, normalizar, db, desde_cero=desde_cero)
+        except Exception as e:
+            print(f"❌ Importación interrumpida: {e}")
+        finally:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+            if al_terminar:
+                al_terminar()
+
+    threading.Thread(target=_correr, name=f"importar-{h[:8]}", daemon=True).start()
+    return h
+
+
+# ----------------------------
+# EXPORTAR
+# ----------------------------
+def productos_remotos(db):
+    """Todos los productos de Firestore de a PAGINA_EXPORTAR, sin leer la colección de una vez."""
+    q = db.collection('productos').order_by('__name__')
+    ultimo = None
+    while True:
+        pagina = q.start_after({'__name__': ultimo}) if ultimo else q
+        docs = acceso_firestore.llamar('productos', pagina.limit(PAGINA_EXPORTAR).stream)
+        for d in docs:
+            prod = d.to_dict() or {}
+            prod['id'] = str(prod.get('id', d.id))
+            yield prod
+        if len(docs) < PAGINA_EXPORTAR:
+            return
+        ultimo = docs[-1].id
+
+
+def exportar_lineas(productos, formato):
+    """El archivo de exportación de a una línea (str). CSV con COLUMNAS; JSONL con el documento completo."""
+    if formato == 'jsonl':
+        for p in productos:
+            p = {k: v for k, v in p.items() if k not in ('version', 'promedio', cambios_productos.CAMPO)}
+            yield json.dumps(p, ensure_ascii=False, default=str) + '\n'
+        return
+    buf = io.StringIO()
+    escritor = csv.DictWriter(buf, COLUMNAS, extrasaction='ignore')
+    escritor.writeheader()
+    yield buf.getvalue()
+    for p in productos:
+        buf.seek(0)
+        buf.truncate()
+        escritor.writerow({k: '' if p.get(k) is None else p.get(k) for k in COLUMNAS})
+        yield buf.getvalue()
+
+
+# ----------------------------
+# LÍNEA DE COMANDOS
+# ----------------------------
+def _main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Importa o exporta productos en CSV o JSONL")
+    sub = parser.add_subparsers(dest='accion', required=True)
+    imp = sub.add_parser('importar', help="carga productos en Firestore")
+    imp.add_argument('archivo')
+    imp.add_argument('--archivos', help="carpeta con las imágenes y modelos que nombran las filas")
+    imp.add_argument('--desde-cero', action='store_true', help="ignora el avance guardado de este archivo")
+    exp = sub.add_parser('exportar', help="descarga los productos de Firestore")
+    exp.add_argument('archivo', help="destino .csv o .jsonl")
+    args = parser.parse_args()
+
+    # Igual que sync.py: la normalización y las subidas son las de la app
+    import app
+
+    if args.accion == 'exportar':
+        formato = formato_de(args.archivo)
+        total = 0
+        with open(args.archivo, 'w', encoding='utf-8', newline='') as salida:
+            for linea in exportar_lineas(productos_remotos(app.db), formato):
+                salida.write(linea)
+                total += 1
+        if formato == 'csv':
+            total -= 1  # encabezado
+        print(f"📤 {total} productos exportados a {args.archivo}")
+        return
+
+    def _progreso(r):
+        print(f"  … fila {r['fila']}: {r['importados']} importados, {r['errores']} con errores")
+
+    with open(args.archivo, 'rb') as f:
+        resumen = importar(f, formato_de(args.archivo), app._normalize_product, app.db,
+                           carpeta=args.archivos, subir=app.subir_archivo_importado,
+                           desde_cero=args.desde_cero, al_avanzar=_progreso)
+    if resumen['ya_importado']:
+        print(f"✅ {args.archivo} ya estaba importado ({resumen['importados']} productos). Usa --desde-cero para repetir.")
+        return
+    for n, motivo in resumen['detalle_errores']:
+        print(f"  ⚠️ fila {n}: {motivo}")
+    desde = f" (retomado desde la fila {resumen['desde']})" if resumen['desde'] else ''
+    print(f"📥 {resumen['importados']} productos importados, {resumen['errores']} filas con errores{desde}")
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,258 @@
+import os
+import time
+import sqlite3
+import smtplib
+import threading
+from email.mime.text import MIMEText
+
+import metricas
+
+# =====================================================
+# 🔹 BANDEJA DE SALIDA DE CORREO
+# Los requests solo encolan en SQLite; un hilo por proceso envía los
+# mensajes reutilizando una conexión SMTP autenticada, con reintentos y
+# backoff exponencial. El estado de cada envío queda registrado.
+# =====================================================
+
+CONFIG = {
+    'host': os.environ.get('MAIL_HOST', 'smtp.gmail.com'),
+    'puerto': int(os.environ.get('MAIL_PORT', 465)),
+    'ssl': os.environ.get('MAIL_SSL', '1') == '1',
+    'usuario': os.environ.get('MAIL_USER'),
+    'clave': os.environ.get('MAIL_PASS'),
+    'cola_db': os.environ.get('MAIL_COLA_DB', 'correo_cola.db'),
+    'intentos_max': int(os.environ.get('MAIL_INTENTOS_MAX', 5)),
+    'backoff_base': float(os.environ.get('MAIL_BACKOFF_BASE', 5)),
+    'backoff_max': float(os.environ.get('MAIL_BACKOFF_MAX', 600)),
+    'conexion_ociosa': float(os.environ.get('MAIL_CONEXION_OCIOSA', 60)),
+    'timeout': float(os.environ.get('MAIL_TIMEOUT', 15)),
+}
+
+# Un envío que quedó "enviando" más de esto (proceso caído) vuelve a la cola
+RECLAMO_EXPIRA = 300
+
+_despertar = threading.Event()
+_hilo = None
+_hilo_pid = None
+_hilo_lock = threading.Lock()
+
+
+def configurado() -> bool:
+    return bool(CONFIG['usuario']) and (bool(CONFIG['clave']) or CONFIG['host'] != 'smtp.gmail.com')
+
+
+def _conectar_db():
+    conn = sqlite3.connect(CONFIG['cola_db'], timeout=10, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS correos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            destino TEXT NOT NULL,
+            asunto TEXT NOT NULL,
+            html TEXT NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'pendiente',
+            intentos INTEGER NOT NULL DEFAULT 0,
+            proximo_intento REAL NOT NULL,
+            reclamado REAL,
+            ultimo_error TEXT,
+            creado REAL NOT NULL,
+            enviado REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_correos_cola ON correos (estado, proximo_intento)")
+    return conn
+
+
+def encolar(destino: str, asunto: str, html_mensaje: str) -> int:
+    """Guarda el mensaje en la cola y despierta al despachador. Devuelve el id."""
+    ahora = time.time()
+    conn = _conectar_db()
+    try:
+        cur = conn.execute(
+            "INSERT INTO correos (destino, asunto, html, proximo_intento, creado) VALUES (?, ?, ?, ?, ?)",
+            (destino, asunto, html_mensaje, ahora, ahora),
+        )
+        correo_id = cur.lastrowid
+    finally:
+        conn.close()
+    iniciar_despachador()
+    _despertar.set()
+    return correo_id
+
+
+def estado(correo_id: int):
+    """Devuelve el registro de un envío como dict (o None)."""
+    conn = _conectar_db()
+    conn.row_factory = sqlite3.Row
+    try:
+        fila = conn.execute("SELECT * FROM correos WHERE id = ?", (correo_id,)).fetchone()
+        return dict(fila) if fila else None
+    finally:
+        conn.close()
+
+
+def _reclamar(conn):
+    """Toma el siguiente mensaje vencido. Con varios workers, solo uno lo gana."""
+    ahora = time.time()
+    conn.execute(
+        "UPDATE correos SET estado = 'pendiente' WHERE estado = 'enviando' AND reclamado < ?",
+        (ahora - RECLAMO_EXPIRA,),
+    )
+    fila = conn.execute(
+        "SELECT id, destino, asunto, html, intentos FROM correos "
+        "WHERE estado = 'pendiente' AND proximo_intento <= ? ORDER BY proximo_intento LIMIT 1",
+        (ahora,),
+    ).fetchone()
+    if not fila:
+        return None
+    cur = conn.execute(
+        "UPDATE correos SET estado = 'enviando', reclamado = ? WHERE id = ? AND estado = 'pendiente'",
+        (ahora, fila[0]),
+    )
+    return fila if cur.rowcount == 1 else _reclamar(conn)
+
+
+def _proxima_espera(conn):
+    fila = conn.execute(
+        "SELECT MIN(proximo_intento) FROM correos WHERE estado = 'pendiente'"
+    ).fetchone()
+    if not fila or fila[0] is None:
+        return None
+    return max(0.0, fila[0] - time.time())
+
+
+class _ConexionSMTP:
+    """Una conexión SMTP autenticada que se reutiliza entre envíos."""
+
+    def __init__(self):
+        self.server = None
+        self.ultimo_uso = 0.0
+
+    def obtener(self):
+        if self.server is not None:
+            try:
+                if self.server.noop()[0] == 250:
+                    return self.server
+            except Exception:
+                pass
+            self.cerrar()
+        if CONFIG['ssl']:
+            server = smtplib.SMTP_SSL(CONFIG['host'], CONFIG['puerto'], timeout=CONFIG['timeout'])
+        else:
+            server = smtplib.SMTP(CONFIG['host'], CONFIG['puerto'], timeout=CONFIG['timeout'])
+        if CONFIG['clave']:
+            server.login(CONFIG['usuario'], CONFIG['clave'])
+        self.server = server
+        return server
+
+    def cerrar(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+        self.server = None
+
+    def cerrar_si_ociosa(self):
+        if self.server is not None and time.time() - self.ultimo_uso > CONFIG['conexion_ociosa']:
+            self.cerrar()
+
+
+def _enviar(conexion, destino, asunto, html_mensaje):
+    msg = MIMEText(html_mensaje, 'html', 'utf-8')
+    msg['Subject'] = asunto
+    msg['From'] = CONFIG['usuario']
+    msg['To'] = destino
+    server = conexion.obtener()
+    try:
+        server.sendmail(CONFIG['usuario'], [destino], msg.as_string())
+    except (smtplib.SMTPServerDisconnected, ConnectionError):
+        # La conexión se cayó entre el NOOP y el envío: un reintento inmediato.
+        # Timeouts y respuestas del servidor van al backoff de la bandeja: el
+        # mensaje pudo haber llegado y reintentarlo ya lo duplicaría
+        conexion.cerrar()
+        conexion.obtener().sendmail(CONFIG['usuario'], [destino], msg.as_string())
+    conexion.ultimo_uso = time.time()
+
+
+def _rechazo_permanente(error):
+    """True si el servidor rechazó el mensaje con un 5xx: reintentarlo no cambia nada."""
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        # Credenciales mal configuradas: no es culpa del mensaje, se reintenta
+        return False
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return bool(error.recipients) and all(500 <= codigo < 600 for codigo, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+
+
+def procesar_pendientes(conexion=None, conn=None):
+    """Envía todo lo vencido. Devuelve cuántos mensajes se intentaron."""
+    propia = conn is None
+    conn = conn or _conectar_db()
+    conexion = conexion or _ConexionSMTP()
+    procesados = 0
+    try:
+        while True:
+            fila = _reclamar(conn)
+            if not fila:
+                break
+            correo_id, destino, asunto, html_mensaje, intentos = fila
+            procesados += 1
+            inicio = time.perf_counter()
+            try:
+                _enviar(conexion, destino, asunto, html_mensaje)
+                metricas.observar('smtp_envio_segundos', time.perf_counter() - inicio, resultado='ok')
+                conn.execute(
+                    "UPDATE correos SET estado = 'enviado', intentos = ?, enviado = ?, ultimo_error = NULL WHERE id = ?",
+                    (intentos + 1, time.time(), correo_id),
+                )
+                print(f"✅ Correo enviado a {destino}")
+            except Exception as e:
+                metricas.observar('smtp_envio_segundos', time.perf_counter() - inicio, resultado='error')
+                conexion.cerrar()
+                intentos += 1
+                if _rechazo_permanente(e):
+                    nuevo_estado, espera = 'fallido', 0
+                    print(f"❌ Correo a {destino} rechazado por el servidor: {e}")
+                elif intentos >= CONFIG['intentos_max']:
+                    nuevo_estado, espera = 'fallido', 0
+                    print(f"❌ Correo a {destino} descartado tras {intentos} intentos: {e}")
+                else:
+                    nuevo_estado = 'pendiente'
+                    espera = min(CONFIG['backoff_max'], CONFIG['backoff_base'] * 2 ** (intentos - 1))
+                    print(f"⚠️ Error enviando correo a {destino} (reintento en {espera:.0f}s): {e}")
+                conn.execute(
+                    "UPDATE correos SET estado = ?, intentos = ?, proximo_intento = ?, ultimo_error = ? WHERE id = ?",
+                    (nuevo_estado, intentos, time.time() + espera, str(e), correo_id),
+                )
+    finally:
+        if propia:
+            conn.close()
+    return procesados
+
+
+def _bucle():
+    conn = _conectar_db()
+    conexion = _ConexionSMTP()
+    while True:
+        try:
+            procesar_pendientes(conexion, conn)
+            espera = _proxima_espera(conn)
+        except Exception as e:
+            print(f"⚠️ Error en el despachador de correo: {e}")
+            espera = CONFIG['backoff_base']
+        conexion.cerrar_si_ociosa()
+        limite = CONFIG['conexion_ociosa'] if espera is None else min(espera, CONFIG['conexion_ociosa'])
+        _despertar.wait(timeout=limite)
+        _despertar.clear()
+
+
+def iniciar_despachador():
+    """Arranca el hilo de envío una vez por proceso (también tras un fork)."""
+    global _hilo, _hilo_pid
+    with _hilo_lock:
+        if _hilo is not None and _hilo_pid == os.getpid() and _hilo.is_alive():
+            return
+        _hilo = threading.Thread(target=_bucle, name='correo-despachador', daemon=True)
+        _hilo_pid = os.getpid()
+        _hilo.start()
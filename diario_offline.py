@@ -0,0 +1,417 @@
+import os
+import sys
+import json
+import time
+import threading
+
+import metricas
+import almacen_local
+import acceso_firestore
+import cambios_productos
+
+# =====================================================
+# 🔹 DIARIO DE CAMBIOS OFFLINE (write-behind)
+# Cuando Firebase no está, las altas, ediciones y bajas de productos y las
+# altas de usuarios se guardan en el almacén local y, en la misma
+# transacción, se anotan en la tabla `diario` con el momento del cambio.
+# Un hilo por proceso las sube cuando Firestore vuelve:
+#   - junta los cambios pendientes de cada documento en una sola operación
+#   - lee el estado remoto con get_all, de a LOTE documentos
+#   - escribe en un WriteBatch con precondiciones (create, o la
+#     update_time que se acaba de leer), así un reenvío repetido no duplica
+# Si el documento remoto se modificó después del cambio local y en los
+# mismos campos, la entrada queda en 'conflicto' y no se pisa.
+#   python diario_offline.py                  # estado y conflictos
+#   python diario_offline.py reenviar         # sube lo pendiente ahora
+#   python diario_offline.py reintentar <id>  # el cambio local gana
+# =====================================================
+
+INTERVALO = float(os.environ.get('DIARIO_INTERVALO', 15))
+ESPERA_MAX = float(os.environ.get('DIARIO_ESPERA_MAX', 300))
+# Documentos por get_all y por WriteBatch (Firestore admite hasta 500 escrituras)
+LOTE = 200
+# Con varios workers uno solo reenvía; el turno vence si el proceso muere
+TURNO = 60
+
+CREAR, ACTUALIZAR, ELIMINAR = 'crear', 'actualizar', 'eliminar'
+
+# Derivados y contadores: ni se suben desde el diario ni cuentan como conflicto
+CAMPOS_IGNORADOS = ('version', 'promedio', 'comentarios', cambios_productos.CAMPO,
+                    'calif_cantidad', 'calif_suma', 'calif_estrellas', 'calificaciones')
+
+_hilo = None
+_hilo_pid = None
+_hilo_lock = threading.Lock()
+_obtener_db = None
+
+
+def _limpiar(datos):
+    return {k: v for k, v in (datos or {}).items() if k not in CAMPOS_IGNORADOS}
+
+
+def _json(valor):
+    return None if valor is None else json.dumps(valor, ensure_ascii=False)
+
+
+def _anotar(conn, coleccion, doc_id, operacion, datos=None, base=None):
+    conn.execute(
+        "INSERT INTO diario (coleccion, doc_id, operacion, datos, base, momento) VALUES (?, ?, ?, ?, ?, ?)",
+        (coleccion, str(doc_id), operacion, _json(datos), _json(base), time.time()),
+    )
+
+
+# ----------------------------
+# ESCRITURAS OFFLINE
+# ----------------------------
+def guardar_producto(producto, base=None, version=None):
+    """
+    Guarda el producto en el almacén local y anota el cambio. Sin `base` es
+    un alta; con `base` (el producto antes de editarlo) solo se anotan los
+    campos que cambiaron. `version`: la versión local esperada (ver
+    almacen_local.guardar_producto). Devuelve la nueva versión local.
+    """
+    datos = _limpiar(producto)
+    with almacen_local.transaccion() as conn:
+        version = almacen_local.guardar_producto(producto, conn, version)
+        if base is None:
+            _anotar(conn, 'productos', datos['id'], CREAR, datos)
+        else:
+            base = _limpiar(base)
+            cambios = {k: v for k, v in datos.items() if base.get(k) != v}
+            if cambios:
+                _anotar(conn, 'productos', datos['id'], ACTUALIZAR, cambios, {k: base.get(k) for k in cambios})
+    _avisar()
+    return version
+
+
+def eliminar_producto(pid, base=None, version=None):
+    """Borra el producto del almacén local y anota la baja. `base`: el producto que se borró."""
+    with almacen_local.transaccion() as conn:
+        borrado = almacen_local.eliminar_producto(pid, conn, version)
+        _anotar(conn, 'productos', pid, ELIMINAR, base=_limpiar(base) if base else None)
+    _avisar()
+    return borrado
+
+
+def guardar_usuario(usuario):
+    """Alta de un usuario en el almacén local, anotada para subirla a Firestore."""
+    correo = (usuario.get('correo') or '').strip().lower()
+    with almacen_local.transaccion() as conn:
+        almacen_local.guardar_usuario(usuario, conn)
+        _anotar(conn, 'usuarios', correo, CREAR, dict(usuario, correo=correo))
+    _avisar()
+
+
+# ----------------------------
+# REENVÍO
+# ----------------------------
+def _combinar(entradas):
+    """
+    Una sola operación con todos los cambios pendientes de un documento.
+    `base` conserva, por campo, el valor remoto más viejo que se conoce.
+    """
+    if entradas[-1]['operacion'] == ELIMINAR:
+        operacion = None if entradas[0]['operacion'] == CREAR else ELIMINAR
+    elif any(e['operacion'] == CREAR for e in entradas):
+        operacion = CREAR
+    else:
+        operacion = ACTUALIZAR
+    datos, base = {}, {}
+    for e in entradas:
+        if e['operacion'] == CREAR:
+            datos = json.loads(e['datos'])
+        elif e['datos']:
+            datos.update(json.loads(e['datos']))
+        for k, v in json.loads(e['base'] or '{}').items():
+            base.setdefault(k, v)
+    return {
+        'ids': [e['id'] for e in entradas],
+        'coleccion': entradas[0]['coleccion'],
+        'doc_id': entradas[0]['doc_id'],
+        'operacion': operacion,
+        'datos': datos,
+        'base': base or None,
+        'momento': entradas[0]['momento'],
+    }
+
+
+def _operaciones_pendientes():
+    """{colección: [operación combinada]} en el orden en que se anotaron."""
+    with almacen_local.lectura() as conn:
+        filas = conn.execute(
+            "SELECT id, coleccion, doc_id, operacion, datos, base, momento FROM diario "
+            "WHERE estado = 'pendiente' ORDER BY id"
+        ).fetchall()
+    por_doc = {}
+    for fila in filas:
+        por_doc.setdefault((fila['coleccion'], fila['doc_id']), []).append(fila)
+    por_coleccion = {}
+    for (coleccion, _), entradas in por_doc.items():
+        por_coleccion.setdefault(coleccion, []).append(_combinar(entradas))
+    return por_coleccion
+
+
+def _decidir(db, lote, ref, op, remoto):
+    """
+    Agrega la escritura de `op` al lote. Devuelve None si se escribió, o
+    (estado, motivo) si no hace falta escribir ('aplicado') o no se debe ('conflicto').
+    """
+    existe = remoto is not None and remoto.exists
+    actual = (remoto.to_dict() or {}) if existe else {}
+    posterior = existe and remoto.update_time is not None and remoto.update_time.timestamp() > op['momento']
+    datos, base = op['datos'], op['base'] or {}
+    # Los productos llevan updated_at y dejan lápida al borrarse (sincronización incremental)
+    es_producto = op['coleccion'] == 'productos'
+    marcar = cambios_productos.con_marca if es_producto else dict
+
+    if op['operacion'] == CREAR:
+        if not existe:
+            lote.create(ref, marcar(datos))
+            return None
+        if all(actual.get(k) == v for k, v in datos.items()):
+            return 'aplicado', None
+        return 'conflicto', "ya existe en Firestore con otros datos"
+
+    if op['operacion'] == ACTUALIZAR:
+        if not existe:
+            return 'conflicto', "se eliminó en Firestore"
+        if all(actual.get(k) == v for k, v in datos.items()):
+            return 'aplicado', None
+        if posterior:
+            choques = [k for k in datos if actual.get(k) != base.get(k) and actual.get(k) != datos[k]]
+            if choques:
+                return 'conflicto', f"cambió en Firestore: {', '.join(choques)}"
+        lote.update(ref, marcar(datos), option=db.write_option(last_update_time=remoto.update_time))
+        return None
+
+    # ELIMINAR
+    if not existe:
+        return 'aplicado', None
+    if posterior:
+        choques = [k for k, v in _limpiar(actual).items() if v != base.get(k)] if base else ['documento']
+        if choques:
+            return 'conflicto', f"cambió en Firestore después de borrarlo: {', '.join(choques)}"
+    lote.delete(ref, option=db.write_option(last_update_time=remoto.update_time))
+    if es_producto:
+        cambios_productos.anotar_borrado(db, lote, op['doc_id'])
+    return None
+
+
+def _aplicar_lote(db, coleccion, ops):
+    """
+    Escribe `ops` en un solo WriteBatch. Devuelve [(op, estado, motivo)].
+    Si el lote falla por una precondición, se reintenta documento por documento.
+    Los errores del servicio (caído, plazo vencido, circuito abierto) se propagan.
+    """
+    col = db.collection(coleccion)
+    refs = [col.document(op['doc_id']) for op in ops]
+    remotos = {d.id: d for d in acceso_firestore.llamar(coleccion, db.get_all, refs)}
+    lote = db.batch()
+    resultados, escritas = [], []
+    for ref, op in zip(refs, ops):
+        decision = _decidir(db, lote, ref, op, remotos.get(op['doc_id']))
+        if decision is None:
+            escritas.append(op)
+        else:
+            resultados.append((op, *decision))
+    if not escritas:
+        return resultados
+    try:
+        acceso_firestore.llamar(coleccion, lote.commit)
+    except acceso_firestore.CircuitoAbierto:
+        raise
+    except Exception as e:
+        if acceso_firestore.es_falla_del_servicio(e):
+            raise
+        if len(ops) == 1:
+            return resultados + [(ops[0], 'conflicto', str(e))]
+        # Alguien escribió entre la lectura y el commit: uno por uno, releyendo
+        for op in escritas:
+            resultados.extend(_aplicar_lote(db, coleccion, [op]))
+        return resultados
+    return resultados + [(op, 'aplicado', None) for op in escritas]
+
+
+def _marcar(resultados):
+    ahora = time.time()
+    with almacen_local.transaccion() as conn:
+        for op, estado, motivo in resultados:
+            marcas = ','.join('?' * len(op['ids']))
+            conn.execute(
+                f"UPDATE diario SET estado = ?, ultimo_error = ?, resuelto = ?, intentos = intentos + 1 "
+                f"WHERE id IN ({marcas}) AND estado = 'pendiente'",
+                (estado, motivo, ahora, *op['ids']),
+            )
+    for op, estado, motivo in resultados:
+        metricas.contar('diario_entradas_total', len(op['ids']), coleccion=op['coleccion'], resultado=estado)
+        if estado == 'conflicto':
+            print(f"⚠️ Conflicto al subir {op['coleccion']}/{op['doc_id']} ({op['operacion']}): {motivo}")
+
+
+def _anotar_fallo(ops, error):
+    """El reenvío de `ops` no llegó a Firestore: siguen pendientes, con un intento más."""
+    motivo = f"{type(error).__name__}: {error}"
+    with almacen_local.transaccion() as conn:
+        for op in ops:
+            marcas = ','.join('?' * len(op['ids']))
+            conn.execute(
+                f"UPDATE diario SET intentos = intentos + 1, ultimo_error = ? "
+                f"WHERE id IN ({marcas}) AND estado = 'pendiente'",
+                (motivo, *op['ids']),
+            )
+
+
+def _tomar_turno():
+    """True si este proceso puede reenviar (renueva el turno si ya lo tenía)."""
+    ahora, yo = time.time(), str(os.getpid())
+    with almacen_local.transaccion() as conn:
+        fila = conn.execute("SELECT valor FROM meta WHERE clave = 'diario_turno'").fetchone()
+        if fila and fila['valor']:
+            pid, _, vence = fila['valor'].partition(':')
+            if pid != yo and float(vence or 0) > ahora:
+                return False
+        conn.execute(
+            "INSERT INTO meta (clave, valor) VALUES ('diario_turno', ?) "
+            "ON CONFLICT(clave) DO UPDATE SET valor = excluded.valor",
+            (f"{yo}:{ahora + TURNO}",),
+        )
+    return True
+
+
+def _soltar_turno():
+    with almacen_local.transaccion() as conn:
+        conn.execute("UPDATE meta SET valor = '' WHERE clave = 'diario_turno' AND valor LIKE ?",
+                     (f"{os.getpid()}:%",))
+
+
+def reenviar(db):
+    """
+    Sube los cambios pendientes a Firestore. Devuelve cuántas entradas quedaron
+    en cada estado, o None si no hay Firestore u otro proceso tiene el turno.
+    Los errores del servicio se propagan: el lote que falló suma un intento y
+    queda pendiente para otra vuelta (los lotes anteriores ya quedan marcados).
+    """
+    if not db or not _tomar_turno():
+        return None
+    totales = {'aplicado': 0, 'conflicto': 0, 'descartado': 0}
+
+    def _registrar(resultados):
+        if not resultados:
+            return
+        _marcar(resultados)
+        for op, estado, _ in resultados:
+            totales[estado] += len(op['ids'])
+
+    try:
+        for coleccion, ops in _operaciones_pendientes().items():
+            # Creado y borrado sin conexión: no hay nada que subir
+            _registrar([(op, 'descartado', None) for op in ops if op['operacion'] is None])
+            ops = [op for op in ops if op['operacion'] is not None]
+            for i in range(0, len(ops), LOTE):
+                if i and not _tomar_turno():
+                    break
+                try:
+                    resultados = _aplicar_lote(db, coleccion, ops[i:i + LOTE])
+                except acceso_firestore.CircuitoAbierto:
+                    # No se llegó a llamar a Firestore: no cuenta como intento
+                    raise
+                except Exception as e:
+                    _anotar_fallo(ops[i:i + LOTE], e)
+                    raise
+                _registrar(resultados)
+    finally:
+        _soltar_turno()
+    return totales
+
+
+def pendientes():
+    with almacen_local.lectura() as conn:
+        return conn.execute("SELECT COUNT(*) FROM diario WHERE estado = 'pendiente'").fetchone()[0]
+
+
+def _bucle():
+    espera = INTERVALO
+    while True:
+        time.sleep(espera)
+        try:
+            if not pendientes():
+                espera = INTERVALO
+                continue
+            totales = reenviar(_obtener_db())
+            if totales:
+                print(f"🔁 Diario offline: {totales['aplicado']} cambios subidos a Firestore, "
+                      f"{totales['conflicto']} en conflicto")
+            espera = INTERVALO
+        except Exception as e:
+            espera = min(ESPERA_MAX, espera * 2)
+            print(f"⏳ Diario offline sin subir ({type(e).__name__}); reintento en {espera:.0f}s")
+
+
+def configurar(obtener_db):
+    """La app indica de dónde sacar el cliente de Firestore; no arranca ningún hilo."""
+    global _obtener_db
+    _obtener_db = obtener_db
+
+
+def iniciar_reenvio():
+    """Arranca el hilo de reenvío una vez por proceso (también tras un fork)."""
+    global _hilo, _hilo_pid
+    if _obtener_db is None:
+        return
+    with _hilo_lock:
+        if _hilo is not None and _hilo_pid == os.getpid() and _hilo.is_alive():
+            return
+        _hilo = threading.Thread(target=_bucle, name='diario-reenvio', daemon=True)
+        _hilo_pid = os.getpid()
+        _hilo.start()
+
+
+def _avisar():
+    # Fuera de la app (scripts) no hay cliente configurado: se reenvía a mano
+    iniciar_reenvio()
+
+
+metricas.definir('diario_entradas_total', 'counter', 'Cambios offline resueltos al reenviar',
+                 ('coleccion', 'resultado'))
+metricas.registrar_medidor('diario_pendientes', 'Cambios offline que faltan subir a Firestore', pendientes)
+
+
+# ----------------------------
+# LÍNEA DE COMANDOS
+# ----------------------------
+def _mostrar_estado():
+    with almacen_local.lectura() as conn:
+        cuentas = conn.execute("SELECT estado, COUNT(*) FROM diario GROUP BY estado").fetchall()
+        conflictos = conn.execute(
+            "SELECT id, coleccion, doc_id, operacion, ultimo_error FROM diario WHERE estado = 'conflicto' ORDER BY id"
+        ).fetchall()
+    print("📒 Diario offline: " + (', '.join(f"{e} {n}" for e, n in cuentas) or 'vacío'))
+    for c in conflictos:
+        print(f"  #{c['id']} {c['coleccion']}/{c['doc_id']} {c['operacion']}: {c['ultimo_error']}")
+
+
+def reintentar(entrada_id):
+    """
+    Vuelve a poner una entrada en conflicto como pendiente, fechada ahora: al
+    reenviarla pisa las ediciones remotas (un alta sobre un documento que ya
+    existe sigue en conflicto).
+    """
+    with almacen_local.transaccion() as conn:
+        return conn.execute(
+            "UPDATE diario SET estado = 'pendiente', momento = ?, ultimo_error = NULL "
+            "WHERE id = ? AND estado = 'conflicto'",
+            (time.time(), int(entrada_id)),
+        ).rowcount > 0
+
+
+if __name__ == '__main__':
+    accion = sys.argv[1] if len(sys.argv) > 1 else 'estado'
+    if accion == 'reenviar':
+        from firebase_config import db
+        print(reenviar(db))
+    elif accion == 'reintentar' and len(sys.argv) > 2:
+        print("✅ Entrada pendiente otra vez" if reintentar(sys.argv[2]) else "⚠️ No hay un conflicto con ese id")
+    elif accion == 'estado':
+        _mostrar_estado()
+    else:
+        print("Uso: python diario_offline.py [estado | reenviar | reintentar <id>]")
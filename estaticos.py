@@ -0,0 +1,186 @@
+import os
+import re
+import json
+import gzip
+import hashlib
+import threading
+import mimetypes
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se genera .gz
+    brotli = None
+
+# =====================================================
+# 🔹 ARCHIVOS ESTÁTICOS CON HUELLA
+# Cada archivo de static/ tiene una huella y url_for('static', ...) genera
+# rutas como styles.3f2a9c1b7e4d.css, que se sirven con caché de un año.
+# Los archivos de texto tienen además copias .gz/.br en CACHE_DIR.
+#   python estaticos.py      # arma el manifiesto y las copias comprimidas (build)
+# Al importar la app se lee el manifiesto guardado y solo se rehashean los
+# archivos cuyo tamaño o fecha cambió; las copias que falten se comprimen
+# en un hilo aparte (mientras tanto se sirve el archivo sin comprimir).
+# =====================================================
+
+CARPETA_STATIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         os.environ.get('ESTATICOS_CACHE', 'cache_estaticos'))
+# Los modelos subidos cambian en caliente y tienen su propia ruta (/modelos)
+EXCLUIDOS = ('modelos_ra/',)
+EXTENSIONES_TEXTO = {'.js', '.css', '.svg', '.json', '.txt', '.html', '.map', '.xml'}
+LARGO_HUELLA = 12
+MANIFIESTO = os.path.join(CACHE_DIR, 'manifiesto.json')
+_PATRON_HUELLA = re.compile(r'^(?P<base>.+)\.(?P<huella>[0-9a-f]{%d})(?P<ext>\.[^./]+)?$' % LARGO_HUELLA)
+
+_manifiesto = {}
+_lock = threading.Lock()
+
+
+def _hash_archivo(ruta):
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 16), b''):
+            h.update(bloque)
+    return h.hexdigest()[:LARGO_HUELLA]
+
+
+def con_huella(nombre, huella):
+    """'css/styles.css' -> 'css/styles.<huella>.css'"""
+    base, ext = os.path.splitext(nombre)
+    return f"{base}.{huella}{ext}"
+
+
+def _escribir_atomico(destino, datos):
+    tmp = f"{destino}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, 'wb') as f:
+        f.write(datos)
+    os.replace(tmp, destino)
+
+
+def _comprimidos(nombre, huella):
+    """Rutas de las copias comprimidas: el nombre lleva la huella, así se reutilizan entre despliegues."""
+    plano = con_huella(nombre, huella).replace('/', '__')
+    return {'br': os.path.join(CACHE_DIR, plano + '.br'), 'gzip': os.path.join(CACHE_DIR, plano + '.gz')}
+
+
+def _precomprimir(ruta, nombre, huella):
+    destinos = _comprimidos(nombre, huella)
+    if all(os.path.exists(d) for c, d in destinos.items() if c != 'br' or brotli is not None):
+        return
+    with open(ruta, 'rb') as f:
+        crudo = f.read()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    candidatos = {'gzip': lambda: gzip.compress(crudo, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        candidatos['br'] = lambda: brotli.compress(crudo, quality=11)
+    for codificacion, comprimir in candidatos.items():
+        if not os.path.exists(destinos[codificacion]):
+            datos = comprimir()
+            # Si casi no achica, no vale la pena servirlo comprimido
+            if len(datos) < len(crudo) * 0.9:
+                _escribir_atomico(destinos[codificacion], datos)
+
+
+def _leer_guardado():
+    """{nombre: [huella, tamaño, mtime_ns]} de la última corrida, o {}."""
+    try:
+        with open(MANIFIESTO, encoding='utf-8') as f:
+            guardado = json.load(f)
+        return guardado if isinstance(guardado, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _precomprimir_todos(textos):
+    for ruta, nombre, huella in textos:
+        try:
+            _precomprimir(ruta, nombre, huella)
+        except OSError as e:
+            print(f"⚠️ No se pudo precomprimir {nombre}: {e}")
+
+
+def construir_manifiesto(precomprimir=True, en_segundo_plano=False):
+    """
+    Deja listo el manifiesto {ruta relativa: huella}. Reutiliza las huellas
+    guardadas de los archivos que no cambiaron. Con en_segundo_plano las
+    copias comprimidas que falten se generan en un hilo.
+    """
+    guardado = _leer_guardado()
+    nuevo, datos, textos = {}, {}, []
+    for raiz, _, archivos in os.walk(CARPETA_STATIC):
+        for archivo in archivos:
+            ruta = os.path.join(raiz, archivo)
+            nombre = os.path.relpath(ruta, CARPETA_STATIC).replace(os.sep, '/')
+            if nombre.startswith(EXCLUIDOS) or '.tmp-' in archivo:
+                continue
+            st = os.stat(ruta)
+            previo = guardado.get(nombre)
+            if isinstance(previo, list) and previo[1:] == [st.st_size, st.st_mtime_ns]:
+                huella = previo[0]
+            else:
+                huella = _hash_archivo(ruta)
+            nuevo[nombre] = huella
+            datos[nombre] = [huella, st.st_size, st.st_mtime_ns]
+            if os.path.splitext(archivo)[1].lower() in EXTENSIONES_TEXTO:
+                textos.append((ruta, nombre, huella))
+    with _lock:
+        _manifiesto.clear()
+        _manifiesto.update(nuevo)
+    if datos != guardado:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            _escribir_atomico(MANIFIESTO, json.dumps(datos, sort_keys=True).encode('utf-8'))
+        except OSError as e:
+            print(f"⚠️ No se pudo guardar el manifiesto de estáticos: {e}")
+    if precomprimir and en_segundo_plano:
+        threading.Thread(target=_precomprimir_todos, args=(textos,), name='estaticos-precomprimir',
+                         daemon=True).start()
+    elif precomprimir:
+        _precomprimir_todos(textos)
+    return nuevo
+
+
+def url_con_huella(nombre):
+    """Nombre con huella para url_for, o None si el archivo no está en el manifiesto."""
+    huella = _manifiesto.get(nombre)
+    return con_huella(nombre, huella) if huella else None
+
+
+def huella(nombre):
+    return _manifiesto.get(nombre)
+
+
+def resolver(pedido):
+    """
+    'styles.3f2a9c1b7e4d.css' -> ('styles.css', vigente). vigente es False si
+    la huella es de otro despliegue. Devuelve None si el nombre no lleva
+    huella o no es un archivo conocido.
+    """
+    m = _PATRON_HUELLA.match(pedido)
+    if not m:
+        return None
+    nombre = m.group('base') + (m.group('ext') or '')
+    actual = _manifiesto.get(nombre)
+    if actual is None:
+        return None
+    return nombre, m.group('huella') == actual
+
+
+def variante(nombre, accept_encoding):
+    """(ruta a servir, content-encoding o None) según lo que acepte el cliente."""
+    aceptadas = {p.split(';')[0].strip().lower() for p in (accept_encoding or '').split(',')}
+    actual = _manifiesto.get(nombre)
+    if actual and os.path.splitext(nombre)[1].lower() in EXTENSIONES_TEXTO:
+        for codificacion, ruta in _comprimidos(nombre, actual).items():
+            if codificacion in aceptadas and os.path.exists(ruta):
+                return ruta, codificacion
+    return os.path.join(CARPETA_STATIC, nombre), None
+
+
+def mimetype(nombre):
+    return mimetypes.guess_type(nombre)[0] or 'application/octet-stream'
+
+
+if __name__ == '__main__':
+    manifiesto = construir_manifiesto()
+    print(f"🧾 {len(manifiesto)} archivos con huella; copias comprimidas en {CACHE_DIR}")
@@ -1,57 +1,144 @@
-import firebase_admin
-from firebase_admin import credentials, firestore, storage, auth
 import os
-import tempfile
 import json
+import tempfile
+import threading
+
+# =====================================================
+# 🔹 CONEXIÓN A FIREBASE (perezosa y segura con fork)
+# Importar este módulo no conecta nada. get_db() / get_bucket() crean los
+# clientes la primera vez que se usan en cada proceso, así cada worker de
+# gunicorn abre sus propios canales gRPC después del fork.
+# `db` y `bucket` siguen existiendo: se comportan como los clientes reales
+# (también en `if db:`) y los crean al primer uso.
+# Con FIRESTORE_EN_MEMORIA=1 get_db() devuelve el Firestore simulado de
+# firestore_memoria (pruebas de carga, sin credenciales ni red).
+# =====================================================
+
+CREDENCIAL_LOCAL = "rojasgabriela-bffec-firebase-adminsdk-fbsvc-0456a7442f.json"
+BUCKET_LOCAL = "rojasgabriela-bffec.appspot.com"
+
+_lock = threading.Lock()
+_estado = {'pid': None, 'app': None, 'db': None, 'bucket': None, 'sin_credenciales': False}
 
-db = None
-bucket = None
 
-try:
+def _credencial():
+    """(credencial, bucket, origen) según el entorno, o (None, None, None) sin credenciales."""
+    from firebase_admin import credentials
+
     # ----------------------------
     # 🔹 PRODUCCIÓN (Heroku)
     # ----------------------------
     firebase_key_json = os.environ.get("FIREBASE_CONFIG")  # ✅ cambiado aquí
     storage_bucket = os.environ.get("FIREBASE_STORAGE_BUCKET")
-
     if firebase_key_json and storage_bucket:
-        try:
-            # Si viene como string JSON bien formateado
-            if firebase_key_json.strip().startswith("{"):
-                cred_dict = json.loads(firebase_key_json)
-                cred = credentials.Certificate(cred_dict)
-            else:
-                # Si vino como texto escapado, lo guardamos en archivo temporal
-                with tempfile.NamedTemporaryFile(mode="w+", delete=False) as cred_file:
-                    cred_file.write(firebase_key_json)
-                    cred_file.flush()
-                    cred = credentials.Certificate(cred_file.name)
-
-            firebase_admin.initialize_app(cred, {"storageBucket": storage_bucket})
-            db = firestore.client()
-            bucket = storage.bucket()
-            print("✅ Firebase inicializado en producción")
-        except Exception as e:
-            print(f"❌ Error usando FIREBASE_CONFIG: {e}")
+        # Si viene como string JSON bien formateado
+        if firebase_key_json.strip().startswith("{"):
+            return credentials.Certificate(json.loads(firebase_key_json)), storage_bucket, "producción"
+        # Si vino como texto escapado, lo guardamos en archivo temporal
+        with tempfile.NamedTemporaryFile(mode="w+", delete=False) as cred_file:
+            cred_file.write(firebase_key_json)
+            cred_file.flush()
+            return credentials.Certificate(cred_file.name), storage_bucket, "producción"
 
     # ----------------------------
     # 🔹 DESARROLLO (local)
     # ----------------------------
-    elif os.path.exists("rojasgabriela-bffec-firebase-adminsdk-fbsvc-0456a7442f.json"):
-        cred = credentials.Certificate("rojasgabriela-bffec-firebase-adminsdk-fbsvc-0456a7442f.json")
-        firebase_admin.initialize_app(cred, {"storageBucket": "rojasgabriela-bffec.appspot.com"})
-        db = firestore.client()
-        bucket = storage.bucket()
-        print("✅ Firebase inicializado desde archivo local (desarrollo)")
+    if os.path.exists(CREDENCIAL_LOCAL):
+        return credentials.Certificate(CREDENCIAL_LOCAL), BUCKET_LOCAL, "archivo local (desarrollo)"
 
     # ----------------------------
     # 🔹 MODO OFFLINE
     # ----------------------------
-    else:
-        print("⚠️ No se encontraron credenciales. Modo offline activado.")
+    return None, None, None
+
+
+def _app():
+    """App de firebase_admin del proceso actual (o None en modo offline). Llamar con _lock tomado."""
+    pid = os.getpid()
+    if _estado['pid'] != pid:
+        # Proceso nuevo (primer uso o después de un fork): no se heredan clientes
+        _estado.update(pid=pid, db=None, bucket=None)
+    if _estado['app'] is not None or _estado['sin_credenciales']:
+        return _estado['app']
+
+    import firebase_admin
+    try:
+        _estado['app'] = firebase_admin.get_app()
+        return _estado['app']
+    except ValueError:
+        pass
+    try:
+        cred, storage_bucket, origen = _credencial()
+        if cred is None:
+            _estado['sin_credenciales'] = True
+            print("⚠️ No se encontraron credenciales. Modo offline activado.")
+            return None
+        _estado['app'] = firebase_admin.initialize_app(cred, {"storageBucket": storage_bucket})
+        print(f"✅ Firebase inicializado ({origen})")
+    except Exception as e:
+        _estado['sin_credenciales'] = True
+        print(f"❌ Error inicializando Firebase: {e}")
+    return _estado['app']
+
+
+def get_db():
+    """Cliente de Firestore de este proceso, o None si Firebase no está disponible."""
+    if os.environ.get('FIRESTORE_EN_MEMORIA') == '1':
+        import firestore_memoria
+        return firestore_memoria.cliente()
+    if _estado['pid'] == os.getpid() and _estado['db'] is not None:
+        return _estado['db']
+    with _lock:
+        app = _app()
+        if app is None:
+            return None
+        if _estado['db'] is None:
+            from google.cloud import firestore
+            # Cliente propio del proceso: el que cachea firebase_admin en la app no sirve tras un fork
+            try:
+                _estado['db'] = firestore.Client(project=app.project_id,
+                                                 credentials=app.credential.get_credential())
+            except Exception as e:
+                print(f"❌ Error creando el cliente de Firestore: {e}")
+        return _estado['db']
+
+
+def get_bucket():
+    """Bucket de Storage de este proceso, o None si Firebase no está disponible."""
+    if _estado['pid'] == os.getpid() and _estado['bucket'] is not None:
+        return _estado['bucket']
+    with _lock:
+        app = _app()
+        if app is None:
+            return None
+        if _estado['bucket'] is None:
+            from google.cloud import storage
+            try:
+                cliente = storage.Client(project=app.project_id, credentials=app.credential.get_credential())
+                _estado['bucket'] = cliente.bucket(app.options.get('storageBucket'))
+            except Exception as e:
+                print(f"❌ Error creando el cliente de Storage: {e}")
+        return _estado['bucket']
+
 
-except Exception as e:
-    print(f"❌ Error inicializando Firebase: {e}")
+class _Perezoso:
+    """Se comporta como el cliente que devuelve `fabrica`, pero lo crea recién al usarlo."""
+
+    def __init__(self, fabrica):
+        self._fabrica = fabrica
+
+    def __bool__(self):
+        return self._fabrica() is not None
+
+    def __getattr__(self, nombre):
+        real = self._fabrica()
+        if real is None:
+            raise RuntimeError("Firebase no está disponible")
+        return getattr(real, nombre)
+
+
+db = _Perezoso(get_db)
+bucket = _Perezoso(get_bucket)
 
 
 # =====================================================
@@ -123,6 +210,8 @@ def registrar_usuario(nombre, correo, clave, rol="user"):
         return None
 
     try:
+        from firebase_admin import auth
+
         # Crear usuario en Authentication
         user = auth.create_user(
             email=correo,
@@ -163,6 +252,7 @@ def obtener_usuarios():
 def eliminar_usuario(uid):
     """Elimina un usuario de Authentication y Firestore"""
     try:
+        from firebase_admin import auth
         auth.delete_user(uid)
         db.collection("usuarios").document(uid).delete()
         print(f"✅ Usuario {uid} eliminado")
@@ -0,0 +1,509 @@
+import os
+import copy
+import json
+import time
+import uuid
+import threading
+from enum import Enum
+from datetime import datetime, timezone
+
+try:
+    from google.cloud.firestore_v1 import transforms
+    from google.api_core.exceptions import (NotFound, AlreadyExists, FailedPrecondition,
+                                            ServiceUnavailable, DeadlineExceeded)
+except ImportError:  # sin las librerías de Google se usan excepciones propias
+    transforms = None
+
+    class ServiceUnavailable(Exception):
+        pass
+
+    class DeadlineExceeded(Exception):
+        pass
+
+    class NotFound(Exception):
+        pass
+
+    class AlreadyExists(Exception):
+        pass
+
+    class FailedPrecondition(Exception):
+        pass
+
+# =====================================================
+# 🔹 FIRESTORE EN MEMORIA (pruebas de carga y desarrollo)
+# Imita la parte del cliente de Firestore que usa la app: documentos,
+# subcolecciones, consultas con order_by/where/start_after/limit/select,
+# get_all, WriteBatch, Increment/DELETE_FIELD/SERVER_TIMESTAMP y on_snapshot. Cada llamada
+# "de red" espera LATENCIA_MS para que el servidor se comporte como con
+# Firestore real (hilos bloqueados en I/O, no en CPU). Respeta timeout=
+# (DeadlineExceeded si la latencia lo supera) y con `cliente.caido = True`
+# responde ServiceUnavailable, para probar los cortacircuitos.
+#   FIRESTORE_EN_MEMORIA=1 FIRESTORE_MEMORIA_LATENCIA_MS=20 gunicorn -c gunicorn.conf.py app:app
+# Los datos viven en el proceso: cada worker tiene su propia copia, cargada
+# de FIRESTORE_MEMORIA_SEMILLA (JSON {colección: [documentos con "id"]} o
+# una lista de productos; ver probar_carga.py).
+# =====================================================
+
+LATENCIA_MS = float(os.environ.get('FIRESTORE_MEMORIA_LATENCIA_MS', 20))
+SEMILLA = os.environ.get('FIRESTORE_MEMORIA_SEMILLA', '')
+
+_lock = threading.Lock()
+_estado = {'pid': None, 'cliente': None}
+
+
+class TipoCambio(Enum):
+    ADDED = 1
+    MODIFIED = 2
+    REMOVED = 3
+
+
+class Cambio:
+    def __init__(self, tipo, documento):
+        self.type = tipo
+        self.document = documento
+
+
+def _ahora():
+    return datetime.now(timezone.utc)
+
+
+def _es(valor, nombre):
+    return transforms is not None and valor is getattr(transforms, nombre)
+
+
+def _aplicar_valor(datos, campo, valor, ahora=None):
+    """datos[campo] = valor, resolviendo DELETE_FIELD, SERVER_TIMESTAMP (hora del commit) e Increment."""
+    if _es(valor, 'DELETE_FIELD'):
+        datos.pop(campo, None)
+    elif _es(valor, 'SERVER_TIMESTAMP'):
+        datos[campo] = ahora or _ahora()
+    elif transforms is not None and isinstance(valor, transforms.Increment):
+        previo = datos.get(campo)
+        datos[campo] = (previo if isinstance(previo, (int, float)) else 0) + valor.value
+    else:
+        datos[campo] = copy.deepcopy(valor)
+
+
+def _aplicar_ruta(datos, ruta, valor, ahora=None):
+    """Como _aplicar_valor pero con rutas 'a.b' (update() y set(merge=True))."""
+    partes = ruta.split('.')
+    for parte in partes[:-1]:
+        if not isinstance(datos.get(parte), dict):
+            datos[parte] = {}
+        datos = datos[parte]
+    _aplicar_valor(datos, partes[-1], valor, ahora)
+
+
+def _tiene_ruta(datos, ruta):
+    for parte in ruta.split('.'):
+        if not isinstance(datos, dict) or parte not in datos:
+            return False
+        datos = datos[parte]
+    return True
+
+
+def _leer_ruta(datos, ruta):
+    for parte in ruta.split('.'):
+        if not isinstance(datos, dict) or parte not in datos:
+            return None
+        datos = datos[parte]
+    return datos
+
+
+# ----------------------------
+# INSTANTÁNEAS
+# ----------------------------
+class Documento:
+    """Equivale a DocumentSnapshot."""
+
+    def __init__(self, referencia, datos, creado=None, actualizado=None):
+        self.reference = referencia
+        self.id = referencia.id
+        self._datos = datos
+        self.create_time = creado
+        self.update_time = actualizado
+        self.read_time = _ahora()
+
+    @property
+    def exists(self):
+        return self._datos is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._datos) if self._datos is not None else None
+
+    def get(self, campo):
+        return copy.deepcopy(_leer_ruta(self._datos or {}, campo))
+
+
+class _Escucha:
+    """Equivale al Watch que devuelve on_snapshot()."""
+
+    def __init__(self, almacen, ruta, callback):
+        self._almacen = almacen
+        self._ruta = ruta
+        self._callback = callback
+        self.is_active = True
+
+    def notificar(self, cambios):
+        if not self.is_active or not cambios:
+            return
+        try:
+            self._callback([c.document for c in cambios], cambios, _ahora())
+        except Exception as e:
+            print(f"⚠️ Error en el callback de on_snapshot: {e}")
+
+    def unsubscribe(self):
+        self.is_active = False
+        self._almacen.quitar_escucha(self)
+
+
+# ----------------------------
+# ALMACÉN
+# ----------------------------
+class _Almacen:
+    """Documentos por ruta completa: ('productos', 'abc', 'comentarios', 'x') -> (datos, creado, actualizado)."""
+
+    def __init__(self):
+        self.docs = {}
+        self.escuchas = []
+        self.lock = threading.RLock()
+
+    def hijos(self, ruta_coleccion):
+        n = len(ruta_coleccion)
+        with self.lock:
+            return [(ruta, valor) for ruta, valor in self.docs.items()
+                    if len(ruta) == n + 1 and ruta[:n] == ruta_coleccion]
+
+    def escribir(self, cliente, operaciones):
+        """Aplica [(tipo, ruta, datos, opciones)] de forma atómica y avisa a los listeners."""
+        ahora = _ahora()
+        cambios = []
+        with self.lock:
+            for tipo, ruta, datos, opciones in operaciones:
+                self._verificar(tipo, ruta, opciones)
+            for tipo, ruta, datos, opciones in operaciones:
+                previo = self.docs.get(ruta)
+                if tipo == 'delete':
+                    if previo is not None:
+                        del self.docs[ruta]
+                        cambios.append((ruta, TipoCambio.REMOVED, None, previo[1], ahora))
+                    continue
+                if tipo == 'set' and not opciones.get('merge'):
+                    nuevos = {}
+                else:
+                    nuevos = copy.deepcopy(previo[0]) if previo else {}
+                con_rutas = tipo == 'update' or opciones.get('merge')
+                for campo, valor in datos.items():
+                    (_aplicar_ruta if con_rutas else _aplicar_valor)(nuevos, campo, valor, ahora)
+                creado = previo[1] if previo else ahora
+                self.docs[ruta] = (nuevos, creado, ahora)
+                cambios.append((ruta, TipoCambio.MODIFIED if previo else TipoCambio.ADDED, nuevos, creado, ahora))
+            escuchas = list(self.escuchas)
+        for escucha in escuchas:
+            propios = [Cambio(tipo, Documento(cliente._referencia(ruta), copy.deepcopy(datos), creado, actualizado))
+                       for ruta, tipo, datos, creado, actualizado in cambios
+                       if len(ruta) == len(escucha._ruta) + 1 and ruta[:-1] == escucha._ruta]
+            escucha.notificar(propios)
+        return ahora
+
+    def _verificar(self, tipo, ruta, opciones):
+        previo = self.docs.get(ruta)
+        if tipo == 'update' and previo is None:
+            raise NotFound(f"No document to update: {'/'.join(ruta)}")
+        if tipo == 'create' and previo is not None:
+            raise AlreadyExists(f"Document already exists: {'/'.join(ruta)}")
+        opcion = opciones.get('option')
+        if opcion is not None:
+            if 'last_update_time' in opcion and (previo is None or previo[2] != opcion['last_update_time']):
+                raise FailedPrecondition(f"El documento {'/'.join(ruta)} cambió desde que se leyó")
+            if 'exists' in opcion and (previo is not None) != opcion['exists']:
+                raise FailedPrecondition(f"Precondición 'exists' no se cumple para {'/'.join(ruta)}")
+
+    def agregar_escucha(self, escucha):
+        with self.lock:
+            self.escuchas.append(escucha)
+
+    def quitar_escucha(self, escucha):
+        with self.lock:
+            if escucha in self.escuchas:
+                self.escuchas.remove(escucha)
+
+
+# ----------------------------
+# REFERENCIAS Y CONSULTAS
+# ----------------------------
+class Consulta:
+    """Equivale a Query: se arma encadenando métodos y se ejecuta con stream()/get()."""
+
+    def __init__(self, cliente, ruta, filtros=(), ordenes=(), limite=None, campos=None, cursor=None):
+        self._cliente = cliente
+        self._ruta = ruta
+        self._filtros = tuple(filtros)
+        self._ordenes = tuple(ordenes)
+        self._limite = limite
+        self._campos = campos
+        self._cursor = cursor
+
+    def _copia(self, **cambios):
+        valores = dict(filtros=self._filtros, ordenes=self._ordenes, limite=self._limite,
+                       campos=self._campos, cursor=self._cursor)
+        valores.update(cambios)
+        return Consulta(self._cliente, self._ruta, **valores)
+
+    def where(self, campo=None, op=None, valor=None, filter=None):
+        if filter is not None:
+            campo, op, valor = filter.field_path, filter.op_string, filter.value
+        return self._copia(filtros=self._filtros + ((campo, op, valor),))
+
+    def order_by(self, campo, direction='ASCENDING'):
+        return self._copia(ordenes=self._ordenes + ((campo, direction == 'DESCENDING'),))
+
+    def limit(self, n):
+        return self._copia(limite=n)
+
+    def select(self, campos):
+        return self._copia(campos=list(campos))
+
+    def start_after(self, valores):
+        if isinstance(valores, Documento):
+            valores = dict(valores.to_dict() or {}, __name__=valores.id)
+        return self._copia(cursor=dict(valores))
+
+    @staticmethod
+    def _valor(doc_id, datos, campo):
+        return doc_id if campo == '__name__' else _leer_ruta(datos, campo)
+
+    @staticmethod
+    def _clave(valor):
+        # None primero, después números, fechas y texto (como ordena Firestore)
+        if valor is None:
+            return (0, 0)
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            return (1, valor)
+        if isinstance(valor, datetime):
+            return (2, valor.timestamp())
+        return (3, str(valor))
+
+    def _cumple(self, doc_id, datos):
+        for campo, op, esperado in self._filtros:
+            v = self._valor(doc_id, datos, campo)
+            if op == '==' and v != esperado:
+                return False
+            if op == 'in' and v not in esperado:
+                return False
+            if op == 'array_contains' and (not isinstance(v, list) or esperado not in v):
+                return False
+            if op in ('<', '<=', '>', '>='):
+                if v is None:
+                    return False
+                a, b = self._clave(v), self._clave(esperado)
+                if not {'<': a < b, '<=': a <= b, '>': a > b, '>=': a >= b}[op]:
+                    return False
+        return True
+
+    def _comparar_cursor(self, doc_id, datos, ordenes):
+        """<0 si el documento va antes del cursor, 0 si coincide, >0 si va después."""
+        for campo, desc in ordenes:
+            a = self._clave(self._valor(doc_id, datos, campo))
+            b = self._clave(self._cursor.get(campo))
+            if a != b:
+                return (1 if a > b else -1) * (-1 if desc else 1)
+        return 0
+
+    def stream(self, transaction=None, retry=None, timeout=None):
+        self._cliente._esperar(timeout)
+        ordenes = list(self._ordenes)
+        if not any(campo == '__name__' for campo, _ in ordenes):
+            ordenes.append(('__name__', ordenes[-1][1] if ordenes else False))
+        # Como Firestore, order_by deja afuera los documentos sin ese campo (con null sí entran)
+        filas = [(ruta, valor) for ruta, valor in self._cliente._almacen.hijos(self._ruta)
+                 if self._cumple(ruta[-1], valor[0])
+                 and all(campo == '__name__' or _tiene_ruta(valor[0], campo) for campo, _ in self._ordenes)]
+        for campo, desc in reversed(ordenes):
+            filas.sort(key=lambda f: self._clave(self._valor(f[0][-1], f[1][0], campo)), reverse=desc)
+        if self._cursor is not None:
+            filas = [f for f in filas if self._comparar_cursor(f[0][-1], f[1][0], ordenes) > 0]
+        if self._limite is not None:
+            filas = filas[:self._limite]
+        for ruta, (datos, creado, actualizado) in filas:
+            datos = copy.deepcopy(datos)
+            if self._campos is not None:
+                datos = {c: datos[c] for c in self._campos if c in datos}
+            yield Documento(self._cliente._referencia(ruta), datos, creado, actualizado)
+
+    def get(self, transaction=None, retry=None, timeout=None):
+        return list(self.stream(timeout=timeout))
+
+
+class Coleccion(Consulta):
+    """Equivale a CollectionReference."""
+
+    @property
+    def id(self):
+        return self._ruta[-1]
+
+    def document(self, doc_id=None):
+        return Referencia(self._cliente, self._ruta + (doc_id or uuid.uuid4().hex[:20],))
+
+    def add(self, datos, document_id=None, retry=None, timeout=None):
+        ref = self.document(document_id)
+        momento = ref.create(datos, timeout=timeout)
+        return momento, ref
+
+    def list_documents(self):
+        return [self._cliente._referencia(ruta) for ruta, _ in self._cliente._almacen.hijos(self._ruta)]
+
+    def on_snapshot(self, callback):
+        escucha = _Escucha(self._cliente._almacen, self._ruta, callback)
+        iniciales = [Cambio(TipoCambio.ADDED, d) for d in Consulta(self._cliente, self._ruta).stream()]
+        self._cliente._almacen.agregar_escucha(escucha)
+        # Como el real, la primera instantánea llega desde otro hilo
+        threading.Thread(target=escucha.notificar, args=(iniciales,), daemon=True).start()
+        return escucha
+
+
+class Referencia:
+    """Equivale a DocumentReference."""
+
+    def __init__(self, cliente, ruta):
+        self._cliente = cliente
+        self._ruta = ruta
+        self.id = ruta[-1]
+        self.path = '/'.join(ruta)
+
+    def collection(self, nombre):
+        return Coleccion(self._cliente, self._ruta + (nombre,))
+
+    def get(self, field_paths=None, transaction=None, retry=None, timeout=None):
+        self._cliente._esperar(timeout)
+        return self._cliente._instantanea(self._ruta)
+
+    def _escribir(self, tipo, datos, timeout=None, **opciones):
+        self._cliente._esperar(timeout)
+        return self._cliente._almacen.escribir(self._cliente, [(tipo, self._ruta, datos, opciones)])
+
+    def set(self, datos, merge=False, retry=None, timeout=None):
+        return self._escribir('set', datos, timeout, merge=merge)
+
+    def create(self, datos, retry=None, timeout=None):
+        return self._escribir('create', datos, timeout)
+
+    def update(self, datos, option=None, retry=None, timeout=None):
+        return self._escribir('update', datos, timeout, option=option)
+
+    def delete(self, option=None, retry=None, timeout=None):
+        return self._escribir('delete', {}, timeout, option=option)
+
+
+class Lote:
+    """Equivale a WriteBatch: las operaciones se aplican juntas en commit()."""
+
+    def __init__(self, cliente):
+        self._cliente = cliente
+        self._operaciones = []
+
+    def set(self, referencia, datos, merge=False):
+        self._operaciones.append(('set', referencia._ruta, datos, {'merge': merge}))
+        return self
+
+    def create(self, referencia, datos):
+        self._operaciones.append(('create', referencia._ruta, datos, {}))
+        return self
+
+    def update(self, referencia, datos, option=None):
+        self._operaciones.append(('update', referencia._ruta, datos, {'option': option}))
+        return self
+
+    def delete(self, referencia, option=None):
+        self._operaciones.append(('delete', referencia._ruta, {}, {'option': option}))
+        return self
+
+    def __len__(self):
+        return len(self._operaciones)
+
+    def commit(self, retry=None, timeout=None):
+        self._cliente._esperar(timeout)
+        momento = self._cliente._almacen.escribir(self._cliente, self._operaciones)
+        self._operaciones = []
+        return momento
+
+
+# ----------------------------
+# CLIENTE
+# ----------------------------
+class Cliente:
+    """Equivale a google.cloud.firestore.Client."""
+
+    def __init__(self, latencia_ms=LATENCIA_MS):
+        self.latencia = latencia_ms / 1000.0
+        self._almacen = _Almacen()
+        self.caido = False
+
+    def _esperar(self, timeout=None):
+        if timeout is not None and self.latencia > timeout:
+            time.sleep(timeout)
+            raise DeadlineExceeded("Deadline Exceeded")
+        if self.latencia > 0:
+            time.sleep(self.latencia)
+        if self.caido:
+            raise ServiceUnavailable("Firestore en memoria marcado como caído")
+
+    def _referencia(self, ruta):
+        return Referencia(self, tuple(ruta))
+
+    def _instantanea(self, ruta):
+        with self._almacen.lock:
+            valor = self._almacen.docs.get(ruta)
+        if valor is None:
+            return Documento(self._referencia(ruta), None)
+        datos, creado, actualizado = valor
+        return Documento(self._referencia(ruta), copy.deepcopy(datos), creado, actualizado)
+
+    def collection(self, nombre):
+        return Coleccion(self, (nombre,))
+
+    def document(self, ruta):
+        return self._referencia(ruta.split('/'))
+
+    def get_all(self, referencias, field_paths=None, transaction=None, retry=None, timeout=None):
+        self._esperar(timeout)
+        for ref in referencias:
+            yield self._instantanea(ref._ruta)
+
+    def batch(self):
+        return Lote(self)
+
+    @staticmethod
+    def write_option(**kwargs):
+        return kwargs
+
+    def cargar(self, datos):
+        """
+        Carga {colección: [documentos con 'id']} (o una lista de productos) sin
+        latencia. La colección puede ser una ruta: 'productos/abc/comentarios'.
+        """
+        if isinstance(datos, list):
+            datos = {'productos': datos}
+        operaciones = []
+        for coleccion, documentos in datos.items():
+            for i, doc in enumerate(documentos):
+                doc = dict(doc)
+                doc_id = str(doc.get('id') or doc.get('correo') or i)
+                operaciones.append(('set', tuple(coleccion.split('/')) + (doc_id,), doc, {}))
+        self._almacen.escribir(self, operaciones)
+        return len(operaciones)
+
+
+def cliente():
+    """Cliente en memoria de este proceso (uno por worker, también tras un fork)."""
+    with _lock:
+        if _estado['pid'] != os.getpid():
+            nuevo = Cliente()
+            if SEMILLA:
+                with open(SEMILLA, 'r', encoding='utf-8') as f:
+                    total = nuevo.cargar(json.load(f))
+                print(f"🧪 Firestore en memoria con {total} documentos de {SEMILLA} (latencia {LATENCIA_MS:.0f} ms)")
+            else:
+                print(f"🧪 Firestore en memoria vacío (latencia {LATENCIA_MS:.0f} ms)")
+            _estado.update(pid=os.getpid(), cliente=nuevo)
+        return _estado['cliente']
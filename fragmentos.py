@@ -0,0 +1,61 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+# =====================================================
+# 🔹 CACHÉ DE FRAGMENTOS HTML
+# Guarda en memoria el HTML ya renderizado de partes que no dependen del
+# usuario (tarjetas del catálogo, datos del producto). La clave lleva la
+# huella del producto, así que un cambio genera una entrada nueva y la
+# vieja sale sola por LRU al pasar el límite de memoria.
+# =====================================================
+
+MAX_BYTES = int(float(os.environ.get('FRAGMENTOS_MAX_MB', 32)) * 1024 * 1024)
+
+_datos = OrderedDict()
+_lock = threading.Lock()
+_estado = {'bytes': 0, 'aciertos': 0, 'fallos': 0, 'expulsiones': 0}
+
+
+def obtener(clave, generar):
+    """Devuelve el fragmento de `clave`; si no está, lo genera con generar() y lo guarda."""
+    with _lock:
+        valor = _datos.get(clave)
+        if valor is not None:
+            _datos.move_to_end(clave)
+            _estado['aciertos'] += 1
+            return valor[0]
+        _estado['fallos'] += 1
+    html = generar()
+    guardar(clave, html)
+    return html
+
+
+def guardar(clave, html):
+    tam = sys.getsizeof(html)
+    if tam > MAX_BYTES:
+        return
+    with _lock:
+        previo = _datos.pop(clave, None)
+        if previo is not None:
+            _estado['bytes'] -= previo[1]
+        _datos[clave] = (html, tam)
+        _estado['bytes'] += tam
+        while _estado['bytes'] > MAX_BYTES:
+            _, (_, liberado) = _datos.popitem(last=False)
+            _estado['bytes'] -= liberado
+            _estado['expulsiones'] += 1
+
+
+def limpiar():
+    with _lock:
+        _datos.clear()
+        _estado['bytes'] = 0
+
+
+def estadisticas():
+    with _lock:
+        consultas = _estado['aciertos'] + _estado['fallos']
+        return dict(_estado, entradas=len(_datos), max_bytes=MAX_BYTES,
+                    tasa_aciertos=round(_estado['aciertos'] / consultas, 4) if consultas else None)
@@ -0,0 +1,577 @@
+import json
+import struct
+import hashlib
+
+# =====================================================
+# 🔹 INGESTA DE MODELOS GLB (sin dependencias externas)
+# Al subir un .glb se valida su estructura, se calcula la caja envolvente
+# (frente / fondo / altura en cm) y se genera una versión optimizada:
+# vistas de buffer duplicadas unificadas, accesores y nodos sin uso
+# eliminados y, si se pide, normales y UVs cuantizadas
+# (KHR_mesh_quantization).
+# =====================================================
+
+MAGIA = b'glTF'
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+
+# componentType -> (formato struct, bytes)
+TIPOS_COMPONENTE = {
+    5120: ('b', 1),
+    5121: ('B', 1),
+    5122: ('h', 2),
+    5123: ('H', 2),
+    5125: ('I', 4),
+    5126: ('f', 4),
+}
+COMPONENTES = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4, 'MAT2': 4, 'MAT3': 9, 'MAT4': 16}
+MAXIMOS_NORMALIZADOS = {5120: 127.0, 5121: 255.0, 5122: 32767.0, 5123: 65535.0}
+
+# Extensiones que no guardan índices de accesores ni de nodos: con ellas
+# se puede podar el archivo sin romper referencias que no conocemos.
+EXTENSIONES_PODABLES = {
+    'KHR_mesh_quantization', 'KHR_texture_transform', 'KHR_texture_basisu',
+    'KHR_lights_punctual', 'EXT_texture_webp',
+}
+
+UNIDAD_A_CM = 100.0  # glTF usa metros
+
+
+class ModeloInvalido(ValueError):
+    """El archivo no es un GLB válido."""
+
+
+# ----------------------------
+# LECTURA Y VALIDACIÓN
+# ----------------------------
+def leer_glb(datos):
+    """Separa el GLB en (json, binario). Lanza ModeloInvalido si está mal formado."""
+    if len(datos) < 20:
+        raise ModeloInvalido("archivo demasiado corto")
+    magia, version, largo = struct.unpack_from('<4sII', datos, 0)
+    if magia != MAGIA:
+        raise ModeloInvalido("no es un archivo GLB")
+    if version != 2:
+        raise ModeloInvalido(f"versión de glTF no soportada: {version}")
+    if largo != len(datos):
+        raise ModeloInvalido("el largo declarado no coincide con el archivo")
+
+    gltf, binario = None, b''
+    pos = 12
+    while pos < largo:
+        if pos + 8 > largo:
+            raise ModeloInvalido("chunk truncado")
+        largo_chunk, tipo = struct.unpack_from('<II', datos, pos)
+        inicio, fin = pos + 8, pos + 8 + largo_chunk
+        if fin > largo:
+            raise ModeloInvalido("chunk más largo que el archivo")
+        if gltf is None:
+            if tipo != CHUNK_JSON:
+                raise ModeloInvalido("el primer chunk debe ser JSON")
+            try:
+                gltf = json.loads(datos[inicio:fin].decode('utf-8'))
+            except (UnicodeDecodeError, ValueError) as e:
+                raise ModeloInvalido(f"JSON inválido: {e}")
+        elif tipo == CHUNK_BIN and not binario:
+            binario = datos[inicio:fin]
+        pos = fin + (-largo_chunk % 4)
+
+    if not isinstance(gltf, dict):
+        raise ModeloInvalido("falta el chunk JSON")
+    if not str(gltf.get('asset', {}).get('version', '')).startswith('2'):
+        raise ModeloInvalido("asset.version debe ser 2.x")
+    try:
+        _validar(gltf, binario)
+    except ERRORES_ESTRUCTURA as e:
+        raise ModeloInvalido(f"estructura glTF inválida: {e!r}")
+    return gltf, binario
+
+
+# Lo que puede lanzar un JSON con tipos inesperados al recorrerlo
+ERRORES_ESTRUCTURA = (struct.error, KeyError, IndexError, TypeError, AttributeError)
+
+
+def _indice_valido(i, lista):
+    return isinstance(i, int) and 0 <= i < len(lista)
+
+
+def _tamano_elemento(acc):
+    return COMPONENTES[acc['type']] * TIPOS_COMPONENTE[acc['componentType']][1]
+
+
+def _validar(gltf, binario):
+    buffers = gltf.get('buffers', [])
+    vistas = gltf.get('bufferViews', [])
+    accesores = gltf.get('accessors', [])
+    mallas = gltf.get('meshes', [])
+    nodos = gltf.get('nodes', [])
+
+    for i, b in enumerate(buffers):
+        if 'uri' not in b and b.get('byteLength', 0) > len(binario):
+            raise ModeloInvalido(f"buffer {i} más largo que el chunk binario")
+
+    for i, v in enumerate(vistas):
+        if not isinstance(v.get('byteLength'), int) or v['byteLength'] < 0:
+            raise ModeloInvalido(f"bufferView {i} sin byteLength válido")
+        if not _indice_valido(v.get('buffer'), buffers):
+            raise ModeloInvalido(f"bufferView {i} apunta a un buffer inexistente")
+        if v.get('byteOffset', 0) + v.get('byteLength', 0) > buffers[v['buffer']].get('byteLength', 0):
+            raise ModeloInvalido(f"bufferView {i} se sale de su buffer")
+
+    for i, a in enumerate(accesores):
+        if a.get('componentType') not in TIPOS_COMPONENTE or a.get('type') not in COMPONENTES:
+            raise ModeloInvalido(f"accessor {i} con tipo desconocido")
+        if not isinstance(a.get('count'), int) or a['count'] < 0:
+            raise ModeloInvalido(f"accessor {i} sin count válido")
+        if 'sparse' in a:
+            disperso = a['sparse']
+            if any(not _indice_valido(disperso.get(parte, {}).get('bufferView'), vistas)
+                   for parte in ('indices', 'values')):
+                raise ModeloInvalido(f"accessor {i} (sparse) apunta a un bufferView inexistente")
+        if 'bufferView' not in a or a['count'] == 0:
+            continue
+        if not _indice_valido(a['bufferView'], vistas):
+            raise ModeloInvalido(f"accessor {i} apunta a un bufferView inexistente")
+        vista = vistas[a['bufferView']]
+        elemento = _tamano_elemento(a)
+        paso = vista.get('byteStride') or elemento
+        if a.get('byteOffset', 0) + paso * (a['count'] - 1) + elemento > vista.get('byteLength', 0):
+            raise ModeloInvalido(f"accessor {i} se sale de su bufferView")
+
+    for i, m in enumerate(mallas):
+        for prim in m.get('primitives', []):
+            refs = list(prim.get('attributes', {}).values())
+            if 'indices' in prim:
+                refs.append(prim['indices'])
+            for objetivo in prim.get('targets', []):
+                refs.extend(objetivo.values())
+            if any(not _indice_valido(r, accesores) for r in refs):
+                raise ModeloInvalido(f"mesh {i} apunta a un accessor inexistente")
+
+    for i, n in enumerate(nodos):
+        if 'mesh' in n and not _indice_valido(n['mesh'], mallas):
+            raise ModeloInvalido(f"node {i} apunta a un mesh inexistente")
+        if any(not _indice_valido(h, nodos) for h in n.get('children', [])):
+            raise ModeloInvalido(f"node {i} tiene hijos inexistentes")
+
+    for i, s in enumerate(gltf.get('scenes', [])):
+        if any(not _indice_valido(n, nodos) for n in s.get('nodes', [])):
+            raise ModeloInvalido(f"scene {i} apunta a nodos inexistentes")
+
+    for i, img in enumerate(gltf.get('images', [])):
+        if 'bufferView' in img and not _indice_valido(img['bufferView'], vistas):
+            raise ModeloInvalido(f"image {i} apunta a un bufferView inexistente")
+
+    for i, skin in enumerate(gltf.get('skins', [])):
+        if 'inverseBindMatrices' in skin and not _indice_valido(skin['inverseBindMatrices'], accesores):
+            raise ModeloInvalido(f"skin {i} apunta a un accessor inexistente")
+        if any(not _indice_valido(j, nodos) for j in skin.get('joints', [])):
+            raise ModeloInvalido(f"skin {i} apunta a nodos inexistentes")
+
+    for i, anim in enumerate(gltf.get('animations', [])):
+        samplers = anim.get('samplers', [])
+        for sampler in samplers:
+            if not (_indice_valido(sampler.get('input'), accesores)
+                    and _indice_valido(sampler.get('output'), accesores)):
+                raise ModeloInvalido(f"animation {i} apunta a un accessor inexistente")
+        for canal in anim.get('channels', []):
+            if not _indice_valido(canal.get('sampler'), samplers):
+                raise ModeloInvalido(f"animation {i} tiene un canal con sampler inexistente")
+            nodo = canal.get('target', {}).get('node')
+            if nodo is not None and not _indice_valido(nodo, nodos):
+                raise ModeloInvalido(f"animation {i} anima un nodo inexistente")
+
+
+def _datos_vista(gltf, binario, i):
+    v = gltf['bufferViews'][i]
+    inicio = v.get('byteOffset', 0)
+    return binario[inicio:inicio + v.get('byteLength', 0)]
+
+
+def _leer_crudo(gltf, binario, iv, desplazamiento, tipo_componente, n, cantidad):
+    formato, tam = TIPOS_COMPONENTE[tipo_componente]
+    vista = gltf['bufferViews'][iv]
+    base = vista.get('byteOffset', 0) + desplazamiento
+    elemento = n * tam
+    paso = vista.get('byteStride') or elemento
+    fmt = '<' + formato * n
+    if paso == elemento:
+        return list(struct.iter_unpack(fmt, binario[base:base + elemento * cantidad]))
+    return [struct.unpack_from(fmt, binario, base + k * paso) for k in range(cantidad)]
+
+
+def leer_accesor(gltf, binario, i):
+    """Valores del accesor como lista de tuplas (ya normalizados si corresponde)."""
+    acc = gltf['accessors'][i]
+    n = COMPONENTES[acc['type']]
+    if 'bufferView' in acc:
+        valores = _leer_crudo(gltf, binario, acc['bufferView'], acc.get('byteOffset', 0),
+                              acc['componentType'], n, acc['count'])
+    else:
+        valores = [(0,) * n] * acc['count']
+    sparse = acc.get('sparse')
+    if sparse:
+        ind, val = sparse['indices'], sparse['values']
+        posiciones = _leer_crudo(gltf, binario, ind['bufferView'], ind.get('byteOffset', 0),
+                                 ind['componentType'], 1, sparse['count'])
+        reemplazos = _leer_crudo(gltf, binario, val['bufferView'], val.get('byteOffset', 0),
+                                 acc['componentType'], n, sparse['count'])
+        for (p,), v in zip(posiciones, reemplazos):
+            valores[p] = v
+    if acc.get('normalized') and acc['componentType'] in MAXIMOS_NORMALIZADOS:
+        maximo = MAXIMOS_NORMALIZADOS[acc['componentType']]
+        valores = [tuple(max(c / maximo, -1.0) for c in v) for v in valores]
+    return valores
+
+
+# ----------------------------
+# TRANSFORMACIONES Y CAJA ENVOLVENTE
+# ----------------------------
+_IDENTIDAD = [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0], [0.0, 0.0, 1.0, 0.0], [0.0, 0.0, 0.0, 1.0]]
+
+
+def _multiplicar(a, b):
+    return [[sum(a[i][k] * b[k][j] for k in range(4)) for j in range(4)] for i in range(4)]
+
+
+def _matriz_local(nodo):
+    if 'matrix' in nodo:
+        m = nodo['matrix']  # column-major
+        return [[m[c * 4 + f] for c in range(4)] for f in range(4)]
+    tx, ty, tz = nodo.get('translation', (0, 0, 0))
+    qx, qy, qz, qw = nodo.get('rotation', (0, 0, 0, 1))
+    sx, sy, sz = nodo.get('scale', (1, 1, 1))
+    return [
+        [(1 - 2 * (qy * qy + qz * qz)) * sx, (2 * (qx * qy - qz * qw)) * sy, (2 * (qx * qz + qy * qw)) * sz, tx],
+        [(2 * (qx * qy + qz * qw)) * sx, (1 - 2 * (qx * qx + qz * qz)) * sy, (2 * (qy * qz - qx * qw)) * sz, ty],
+        [(2 * (qx * qz - qy * qw)) * sx, (2 * (qy * qz + qx * qw)) * sy, (1 - 2 * (qx * qx + qy * qy)) * sz, tz],
+        [0.0, 0.0, 0.0, 1.0],
+    ]
+
+
+def _sin_rotacion(m):
+    return all(abs(m[i][j]) < 1e-9 for i in range(3) for j in range(3) if i != j)
+
+
+def _raices(gltf):
+    nodos = gltf.get('nodes', [])
+    escenas = gltf.get('scenes', [])
+    if escenas:
+        actual = gltf.get('scene', 0)
+        return list(escenas[actual if _indice_valido(actual, escenas) else 0].get('nodes', []))
+    hijos = {h for n in nodos for h in n.get('children', [])}
+    return [i for i in range(len(nodos)) if i not in hijos]
+
+
+def _recorrer(gltf, raices):
+    """Genera (índice de nodo, matriz global) desde las raíces. Rechaza ciclos."""
+    nodos = gltf.get('nodes', [])
+    pila = [(r, _IDENTIDAD, frozenset()) for r in raices]
+    while pila:
+        i, padre, camino = pila.pop()
+        if i in camino:
+            raise ModeloInvalido("la jerarquía de nodos tiene un ciclo")
+        global_ = _multiplicar(padre, _matriz_local(nodos[i]))
+        yield i, global_
+        for h in nodos[i].get('children', []):
+            pila.append((h, global_, camino | {i}))
+
+
+def _aplicar(m, p):
+    x, y, z = p[0], p[1], p[2]
+    return (m[0][0] * x + m[0][1] * y + m[0][2] * z + m[0][3],
+            m[1][0] * x + m[1][1] * y + m[1][2] * z + m[1][3],
+            m[2][0] * x + m[2][1] * y + m[2][2] * z + m[2][3])
+
+
+def caja_envolvente(gltf, binario):
+    """
+    (mínimo, máximo) de la escena en coordenadas del mundo, o None si no hay
+    geometría. Sin rotación basta con transformar min/max del accesor; con
+    rotación se transforman los vértices para no inflar la caja.
+    """
+    minimo, maximo = [float('inf')] * 3, [float('-inf')] * 3
+    mallas = gltf.get('meshes', [])
+    for i, m in _recorrer(gltf, _raices(gltf)):
+        nodo = gltf['nodes'][i]
+        if 'mesh' not in nodo:
+            continue
+        for prim in mallas[nodo['mesh']].get('primitives', []):
+            ia = prim.get('attributes', {}).get('POSITION')
+            if ia is None:
+                continue
+            acc = gltf['accessors'][ia]
+            if _sin_rotacion(m) and 'min' in acc and 'max' in acc and 'sparse' not in acc:
+                puntos = [_aplicar(m, acc['min']), _aplicar(m, acc['max'])]
+            else:
+                puntos = [_aplicar(m, p) for p in leer_accesor(gltf, binario, ia)]
+            for p in puntos:
+                for eje in range(3):
+                    minimo[eje] = min(minimo[eje], p[eje])
+                    maximo[eje] = max(maximo[eje], p[eje])
+    if minimo[0] == float('inf'):
+        return None
+    return minimo, maximo
+
+
+def medidas(gltf, binario):
+    """frente (X), altura (Y) y fondo (Z) en cm, o None si no hay geometría."""
+    caja = caja_envolvente(gltf, binario)
+    if caja is None:
+        return None
+    minimo, maximo = caja
+    frente, altura, fondo = (round((maximo[e] - minimo[e]) * UNIDAD_A_CM, 1) for e in range(3))
+    return {'frente': frente, 'fondo': fondo, 'altura': altura}
+
+
+def _conteo(gltf):
+    vertices, triangulos = 0, 0
+    accesores = gltf.get('accessors', [])
+    for m in gltf.get('meshes', []):
+        for prim in m.get('primitives', []):
+            ia = prim.get('attributes', {}).get('POSITION')
+            if ia is None:
+                continue
+            vertices += accesores[ia]['count']
+            n = accesores[prim['indices']]['count'] if 'indices' in prim else accesores[ia]['count']
+            modo = prim.get('mode', 4)
+            if modo == 4:
+                triangulos += n // 3
+            elif modo in (5, 6):
+                triangulos += max(n - 2, 0)
+    return vertices, triangulos
+
+
+# ----------------------------
+# OPTIMIZACIÓN
+# ----------------------------
+def _cuantizar(gltf, binario, vistas_datos):
+    """Normales a int8 y UVs en [0, 1] a uint16 normalizados. Devuelve cuántos accesores cambió."""
+    hechos = set()
+    for m in gltf.get('meshes', []):
+        for prim in m.get('primitives', []):
+            for nombre, ia in prim.get('attributes', {}).items():
+                if ia in hechos:
+                    continue
+                acc = gltf['accessors'][ia]
+                if acc['componentType'] != 5126 or 'bufferView' not in acc or 'sparse' in acc:
+                    continue
+                if nombre == 'NORMAL' and acc['type'] == 'VEC3':
+                    valores = leer_accesor(gltf, binario, ia)
+                    datos = b''.join(
+                        struct.pack('<bbbx', *(max(-127, min(127, round(c * 127))) for c in v)) for v in valores
+                    )
+                    tipo_componente = 5120
+                elif nombre.startswith('TEXCOORD_') and acc['type'] == 'VEC2':
+                    valores = leer_accesor(gltf, binario, ia)
+                    if any(c < 0.0 or c > 1.0 for v in valores for c in v):
+                        continue
+                    datos = b''.join(struct.pack('<HH', *(round(c * 65535) for c in v)) for v in valores)
+                    tipo_componente = 5123
+                else:
+                    continue
+                gltf['bufferViews'].append({'buffer': 0, 'byteLength': len(datos), 'byteStride': 4, 'target': 34962})
+                vistas_datos.append(datos)
+                gltf['accessors'][ia] = {
+                    'bufferView': len(gltf['bufferViews']) - 1,
+                    'componentType': tipo_componente,
+                    'normalized': True,
+                    'count': acc['count'],
+                    'type': acc['type'],
+                }
+                hechos.add(ia)
+    if hechos:
+        for clave in ('extensionsUsed', 'extensionsRequired'):
+            extensiones = gltf.setdefault(clave, [])
+            if 'KHR_mesh_quantization' not in extensiones:
+                extensiones.append('KHR_mesh_quantization')
+    return len(hechos)
+
+
+def _podar_nodos(gltf):
+    """Quita nodos que no cuelgan de ninguna escena y mallas que nadie usa."""
+    nodos = gltf.get('nodes', [])
+    if not gltf.get('scenes') or gltf.get('skins') or gltf.get('animations'):
+        return 0
+    alcanzables = set()
+    for s in gltf['scenes']:
+        alcanzables.update(i for i, _ in _recorrer_indices(gltf, s.get('nodes', [])))
+    nuevo = {viejo: k for k, viejo in enumerate(sorted(alcanzables))}
+    eliminados = len(nodos) - len(nuevo)
+    gltf['nodes'] = [nodos[i] for i in sorted(alcanzables)]
+    for n in gltf['nodes']:
+        if 'children' in n:
+            n['children'] = [nuevo[h] for h in n['children']]
+    for s in gltf['scenes']:
+        s['nodes'] = [nuevo[i] for i in s.get('nodes', [])]
+
+    mallas = gltf.get('meshes', [])
+    usadas = sorted({n['mesh'] for n in gltf['nodes'] if 'mesh' in n})
+    remap = {viejo: k for k, viejo in enumerate(usadas)}
+    gltf['meshes'] = [mallas[i] for i in usadas]
+    for n in gltf['nodes']:
+        if 'mesh' in n:
+            n['mesh'] = remap[n['mesh']]
+    return eliminados
+
+
+def _recorrer_indices(gltf, raices):
+    nodos = gltf.get('nodes', [])
+    vistos = set()
+    pila = list(raices)
+    while pila:
+        i = pila.pop()
+        if i in vistos:
+            continue
+        vistos.add(i)
+        yield i, nodos[i]
+        pila.extend(nodos[i].get('children', []))
+
+
+def _podar_accesores(gltf):
+    """Quita accesores que no usa ninguna primitiva, skin ni animación."""
+    accesores = gltf.get('accessors', [])
+    usados = set()
+    for m in gltf.get('meshes', []):
+        for prim in m.get('primitives', []):
+            usados.update(prim.get('attributes', {}).values())
+            if 'indices' in prim:
+                usados.add(prim['indices'])
+            for objetivo in prim.get('targets', []):
+                usados.update(objetivo.values())
+    for skin in gltf.get('skins', []):
+        if 'inverseBindMatrices' in skin:
+            usados.add(skin['inverseBindMatrices'])
+    for anim in gltf.get('animations', []):
+        for sampler in anim.get('samplers', []):
+            usados.update((sampler['input'], sampler['output']))
+
+    orden = sorted(usados)
+    remap = {viejo: k for k, viejo in enumerate(orden)}
+    gltf['accessors'] = [accesores[i] for i in orden]
+    for m in gltf.get('meshes', []):
+        for prim in m.get('primitives', []):
+            prim['attributes'] = {k: remap[v] for k, v in prim.get('attributes', {}).items()}
+            if 'indices' in prim:
+                prim['indices'] = remap[prim['indices']]
+            if 'targets' in prim:
+                prim['targets'] = [{k: remap[v] for k, v in t.items()} for t in prim['targets']]
+    for skin in gltf.get('skins', []):
+        if 'inverseBindMatrices' in skin:
+            skin['inverseBindMatrices'] = remap[skin['inverseBindMatrices']]
+    for anim in gltf.get('animations', []):
+        for sampler in anim.get('samplers', []):
+            sampler['input'], sampler['output'] = remap[sampler['input']], remap[sampler['output']]
+    return len(accesores) - len(orden)
+
+
+def _referencias_vista(nodo, fuera_de=('bufferViews',)):
+    """Recorre el JSON y devuelve los dicts que tienen una clave 'bufferView'."""
+    encontrados = []
+    pila = [nodo]
+    while pila:
+        actual = pila.pop()
+        if isinstance(actual, dict):
+            if isinstance(actual.get('bufferView'), int):
+                encontrados.append(actual)
+            pila.extend(v for k, v in actual.items() if k not in fuera_de)
+        elif isinstance(actual, list):
+            pila.extend(actual)
+    return encontrados
+
+
+def _reconstruir_binario(gltf, vistas_datos):
+    """
+    Deja solo las vistas referenciadas, une las que tienen el mismo contenido
+    y arma un binario nuevo alineado a 4 bytes. Devuelve (binario, duplicadas).
+    """
+    referencias = _referencias_vista(gltf)
+    vistas = gltf.get('bufferViews', [])
+    por_contenido = {}
+    remap = {}
+    nuevas, partes, largo = [], [], 0
+    for i in sorted({r['bufferView'] for r in referencias}):
+        v = vistas[i]
+        datos = vistas_datos[i]
+        clave = (hashlib.sha1(datos).digest(), len(datos), v.get('byteStride'), v.get('target'))
+        if clave in por_contenido:
+            remap[i] = por_contenido[clave]
+            continue
+        nueva = {k: val for k, val in v.items() if k not in ('buffer', 'byteOffset', 'byteLength')}
+        nueva.update({'buffer': 0, 'byteOffset': largo, 'byteLength': len(datos)})
+        relleno = b'\x00' * (-len(datos) % 4)
+        partes.extend((datos, relleno))
+        largo += len(datos) + len(relleno)
+        remap[i] = por_contenido[clave] = len(nuevas)
+        nuevas.append(nueva)
+    for r in referencias:
+        r['bufferView'] = remap[r['bufferView']]
+    gltf['bufferViews'] = nuevas
+    binario = b''.join(partes)
+    gltf['buffers'] = [{'byteLength': len(binario)}]
+    return binario, len(remap) - len(nuevas)
+
+
+def escribir_glb(gltf, binario):
+    crudo = json.dumps(gltf, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    crudo += b' ' * (-len(crudo) % 4)
+    binario += b'\x00' * (-len(binario) % 4)
+    largo = 12 + 8 + len(crudo) + (8 + len(binario) if binario else 0)
+    partes = [struct.pack('<4sII', MAGIA, 2, largo), struct.pack('<II', len(crudo), CHUNK_JSON), crudo]
+    if binario:
+        partes.extend((struct.pack('<II', len(binario), CHUNK_BIN), binario))
+    return b''.join(partes)
+
+
+def _optimizable(gltf):
+    usadas = gltf.get('extensionsUsed', [])
+    if any(not (e.startswith('KHR_materials_') or e in EXTENSIONES_PODABLES) for e in usadas):
+        return False
+    buffers = gltf.get('buffers', [])
+    return len(buffers) <= 1 and all('uri' not in b for b in buffers)
+
+
+def procesar_glb(datos, cuantizar=False):
+    """
+    Valida, mide y optimiza un GLB. Devuelve (bytes a guardar, info) donde
+    info = {'medidas': {...} o None, 'stats': {...}}. Si la versión optimizada
+    no resulta más chica se devuelve el archivo original.
+    Lanza ModeloInvalido si el archivo está dañado.
+    """
+    gltf, binario = leer_glb(datos)
+    try:
+        medidas_cm = medidas(gltf, binario)
+    except ERRORES_ESTRUCTURA as e:
+        raise ModeloInvalido(f"geometría ilegible: {e!r}")
+    vertices, triangulos = _conteo(gltf)
+    stats = {
+        'bytes_original': len(datos),
+        'bytes': len(datos),
+        'vertices': vertices,
+        'triangulos': triangulos,
+        'nodos_eliminados': 0,
+        'accesores_eliminados': 0,
+        'vistas_duplicadas': 0,
+        'accesores_cuantizados': 0,
+        'optimizado': False,
+    }
+    info = {'medidas': medidas_cm, 'stats': stats}
+    if not _optimizable(gltf):
+        return datos, info
+
+    # Lo que _validar no cubre no debe terminar en un 500: también es un modelo inválido
+    try:
+        vistas_datos = [_datos_vista(gltf, binario, i) for i in range(len(gltf.get('bufferViews', [])))]
+        if cuantizar:
+            stats['accesores_cuantizados'] = _cuantizar(gltf, binario, vistas_datos)
+        stats['nodos_eliminados'] = _podar_nodos(gltf)
+        stats['accesores_eliminados'] = _podar_accesores(gltf)
+        nuevo_binario, stats['vistas_duplicadas'] = _reconstruir_binario(gltf, vistas_datos)
+    except ERRORES_ESTRUCTURA as e:
+        raise ModeloInvalido(f"no se pudo optimizar: {e!r}")
+    optimizado = escribir_glb(gltf, nuevo_binario)
+    if len(optimizado) >= len(datos):
+        stats.update(nodos_eliminados=0, accesores_eliminados=0, vistas_duplicadas=0, accesores_cuantizados=0)
+        return datos, info
+    stats.update(bytes=len(optimizado), optimizado=True)
+    return optimizado, info
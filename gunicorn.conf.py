@@ -0,0 +1,71 @@
+import os
+import sys
+import multiprocessing
+
+# =====================================================
+# 🔹 CONFIGURACIÓN DE GUNICORN (producción)
+# Casi todo el tiempo de una petición es espera de red (Firestore, Storage,
+# SMTP), así que se usan workers con hilos (gthread): pocos procesos, unos
+# por CPU, y muchos hilos por proceso para tener IO_CONCURRENCIA peticiones
+# en curso en total. bcrypt corre en su propio pool acotado (BCRYPT_HILOS),
+# que se reparte entre los workers para no pasarse de las CPUs.
+#   gunicorn -c gunicorn.conf.py app:app
+# Todo se puede ajustar por entorno: WEB_CONCURRENCY, GUNICORN_HILOS,
+# IO_CONCURRENCIA, GUNICORN_TIMEOUT, ...
+# =====================================================
+
+CPUS = multiprocessing.cpu_count()
+
+# Peticiones simultáneas que se quieren atender entre todos los workers
+IO_CONCURRENCIA = int(os.environ.get('IO_CONCURRENCIA', 32))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+worker_class = 'gthread'
+# Un proceso por CPU alcanza para el trabajo de CPU (plantillas, bcrypt); más
+# procesos solo multiplican cachés y conexiones a Firestore
+workers = int(os.environ.get('WEB_CONCURRENCY', min(CPUS, 4)))
+threads = int(os.environ.get('GUNICORN_HILOS', max(4, -(-IO_CONCURRENCIA // workers))))
+
+# Tiempos: un hilo colgado de Firestore no debe tumbar el worker enseguida,
+# y al reiniciar se deja terminar lo que está en curso
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 20))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Reciclar workers de a poco acota la memoria de cachés y fragmentos
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+# Sin preload cada worker importa la app después del fork y abre sus propios
+# clientes de Firebase (ver firebase_config)
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0') == '1'
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
+
+# El pool de bcrypt de cada worker se queda con su parte de las CPUs
+os.environ.setdefault('BCRYPT_HILOS', str(max(1, CPUS // workers)))
+CALENTAR = os.environ.get('GUNICORN_CALENTAR', '1') == '1'
+
+
+def post_worker_init(worker):
+    """Carga el catálogo y arranca el listener antes de aceptar peticiones."""
+    if CALENTAR:
+        import app
+        app.calentar()
+
+
+def worker_exit(server, worker):
+    app = sys.modules.get('app')
+    if app is None:
+        return
+    try:
+        app.cerrar()
+    except Exception as e:
+        print(f"⚠️ Error cerrando el worker {worker.pid}: {e}")
+
+
+def on_starting(server):
+    print(f"🚀 gunicorn: {workers} workers x {threads} hilos ({worker_class}), "
+          f"{CPUS} CPUs, bcrypt {os.environ['BCRYPT_HILOS']} hilos por worker")
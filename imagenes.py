@@ -0,0 +1,249 @@
+import io
+import os
+import time
+import hashlib
+import threading
+import urllib.request
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow es opcional: sin él se sirven las imágenes originales
+    Image = ImageOps = None
+
+# =====================================================
+# 🔹 IMÁGENES RESPONSIVAS
+# Cada imagen de producto se genera en varios anchos, en WebP y JPEG, la
+# primera vez que se pide (o al guardar el producto). Los resultados van a
+# una caché en disco direccionada por contenido y con expulsión LRU.
+# =====================================================
+
+ANCHOS = (320, 640, 960)
+FORMATOS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 78, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 80, 'optimize': True, 'progressive': True}),
+}
+EXTENSIONES_ORIGEN = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+# Solo se descargan originales de Firebase Storage
+HOSTS_PERMITIDOS = {'firebasestorage.googleapis.com', 'storage.googleapis.com'}
+
+CARPETA_STATIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.environ.get('IMAGENES_CACHE', 'cache_imagenes'))
+CACHE_MAX_BYTES = int(float(os.environ.get('IMAGENES_CACHE_MB', 200)) * 1024 * 1024)
+ORIGEN_MAX_BYTES = 20 * 1024 * 1024
+DESCARGA_TIMEOUT = float(os.environ.get('IMAGENES_TIMEOUT', 10))
+# Tras un fallo de descarga no se reintenta esa URL durante este tiempo
+REINTENTO_DESCARGA = 300
+
+_huellas = {}
+_bloqueos = {}
+_fallidas = {}
+_lock = threading.Lock()
+_uso = {'bytes': None}
+_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='imagenes')
+
+
+class ImagenNoDisponible(Exception):
+    """No se pudo leer o convertir la imagen original."""
+
+
+def disponible():
+    return Image is not None
+
+
+# ----------------------------
+# ORIGEN
+# ----------------------------
+def _ruta_local(src):
+    """Ruta dentro de /static o ValueError si src sale de ahí."""
+    base = os.path.realpath(CARPETA_STATIC)
+    ruta = os.path.realpath(os.path.join(base, src.lstrip('/')))
+    if not ruta.startswith(base + os.sep) or os.path.splitext(ruta)[1].lower() not in EXTENSIONES_ORIGEN:
+        raise ValueError("imagen fuera de /static")
+    return ruta
+
+
+def es_remota(src):
+    return src.startswith('http://') or src.startswith('https://')
+
+
+def validar_origen(src):
+    """Lanza ValueError si src no es un archivo de /static ni una URL de Firebase Storage."""
+    if not src:
+        raise ValueError("falta la imagen")
+    if es_remota(src):
+        url = urlparse(src)
+        if url.scheme != 'https' or url.hostname not in HOSTS_PERMITIDOS:
+            raise ValueError("host de imagen no permitido")
+        return src
+    return _ruta_local(src)
+
+
+def huella(src):
+    """
+    Identifica el contenido del original. Las URLs de descarga de Firebase
+    Storage llevan un token que cambia al reemplazar el archivo, así que
+    para ellas basta la URL; los archivos locales se hashean (con memoria
+    por tamaño y fecha).
+    """
+    origen = validar_origen(src)
+    if es_remota(src):
+        return hashlib.sha256(src.encode('utf-8')).hexdigest()[:24]
+    st = os.stat(origen)
+    clave = (st.st_size, st.st_mtime_ns)
+    with _lock:
+        valor = _huellas.get(origen)
+        if valor and valor[0] == clave:
+            return valor[1]
+    h = hashlib.sha256()
+    with open(origen, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 16), b''):
+            h.update(bloque)
+    digest = h.hexdigest()[:24]
+    with _lock:
+        _huellas[origen] = (clave, digest)
+    return digest
+
+
+def _leer_origen(src):
+    origen = validar_origen(src)
+    if not es_remota(src):
+        with open(origen, 'rb') as f:
+            return f.read()
+    if time.time() - _fallidas.get(src, 0) < REINTENTO_DESCARGA:
+        raise ImagenNoDisponible("la descarga falló hace poco")
+    try:
+        with urllib.request.urlopen(src, timeout=DESCARGA_TIMEOUT) as resp:
+            datos = resp.read(ORIGEN_MAX_BYTES + 1)
+    except Exception as e:
+        _fallidas[src] = time.time()
+        raise ImagenNoDisponible(f"no se pudo descargar la imagen: {e}")
+    if len(datos) > ORIGEN_MAX_BYTES:
+        raise ImagenNoDisponible("imagen original demasiado grande")
+    return datos
+
+
+# ----------------------------
+# CACHÉ EN DISCO (LRU por fecha de último uso)
+# ----------------------------
+def _ruta_cache(digest, formato):
+    return os.path.join(CACHE_DIR, digest[:2], f"{digest}.{formato}")
+
+
+def _archivos_cache():
+    for raiz, _, nombres in os.walk(CACHE_DIR):
+        for nombre in nombres:
+            if '.tmp-' in nombre:
+                continue
+            ruta = os.path.join(raiz, nombre)
+            try:
+                st = os.stat(ruta)
+            except FileNotFoundError:
+                continue
+            yield ruta, st.st_size, st.st_mtime
+
+
+def _expulsar():
+    """Borra los archivos usados hace más tiempo hasta quedar en el 90% del límite."""
+    archivos = sorted(_archivos_cache(), key=lambda a: a[2])
+    total = sum(a[1] for a in archivos)
+    objetivo = CACHE_MAX_BYTES * 0.9
+    for ruta, tam, _ in archivos:
+        if total <= objetivo:
+            break
+        try:
+            os.remove(ruta)
+            total -= tam
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def _registrar_escritura(tam):
+    with _lock:
+        if _uso['bytes'] is None:
+            _uso['bytes'] = sum(a[1] for a in _archivos_cache())
+        else:
+            _uso['bytes'] += tam
+        excedido = _uso['bytes'] > CACHE_MAX_BYTES
+    if excedido:
+        total = _expulsar()
+        with _lock:
+            _uso['bytes'] = total
+
+
+def _generar(src, ancho, formato, destino):
+    formato_pil, _, opciones = FORMATOS[formato]
+    try:
+        img = Image.open(io.BytesIO(_leer_origen(src)))
+        img = ImageOps.exif_transpose(img)
+    except ImagenNoDisponible:
+        raise
+    except Exception as e:
+        raise ImagenNoDisponible(f"imagen ilegible: {e}")
+    img.thumbnail((ancho, ancho * 4), Image.LANCZOS)
+    if formato == 'jpeg' and img.mode != 'RGB':
+        img = img.convert('RGBA')
+        fondo = Image.new('RGB', img.size, (255, 255, 255))
+        fondo.paste(img, mask=img.getchannel('A'))
+        img = fondo
+    elif img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA')
+
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    tmp = f"{destino}.tmp-{os.getpid()}-{threading.get_ident()}"
+    img.save(tmp, formato_pil, **opciones)
+    os.replace(tmp, destino)
+    _registrar_escritura(os.path.getsize(destino))
+
+
+def variante(src, ancho, formato):
+    """
+    Ruta en la caché de la imagen src reducida a `ancho` px en `formato`,
+    generándola si hace falta. Lanza ValueError si los parámetros no son
+    válidos e ImagenNoDisponible si no se puede generar.
+    """
+    if ancho not in ANCHOS or formato not in FORMATOS:
+        raise ValueError("ancho o formato no soportado")
+    base = huella(src)  # valida src antes que nada
+    if not disponible():
+        raise ImagenNoDisponible("Pillow no está instalado")
+    digest = hashlib.sha256(f"{base}|{ancho}|{formato}".encode('utf-8')).hexdigest()[:32]
+    destino = _ruta_cache(digest, formato)
+    if os.path.exists(destino):
+        try:
+            os.utime(destino)  # marca de uso para el LRU
+            return destino
+        except FileNotFoundError:
+            pass  # expulsado justo ahora: se vuelve a generar
+
+    with _lock:
+        bloqueo = _bloqueos.setdefault(destino, threading.Lock())
+    with bloqueo:
+        if not os.path.exists(destino):
+            _generar(src, ancho, formato, destino)
+    with _lock:
+        _bloqueos.pop(destino, None)
+    return destino
+
+
+def mimetype(formato):
+    return FORMATOS[formato][1]
+
+
+def precalentar(src):
+    """Genera en segundo plano todos los anchos y formatos de una imagen."""
+    if not disponible() or not src:
+        return None
+
+    def _todas():
+        for formato in FORMATOS:
+            for ancho in ANCHOS:
+                try:
+                    variante(src, ancho, formato)
+                except (ValueError, ImagenNoDisponible) as e:
+                    print(f"⚠️ No se pudo preparar la imagen {src}: {e}")
+                    return
+
+    return _pool.submit(_todas)
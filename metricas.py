@@ -0,0 +1,305 @@
+import os
+import sys
+import hmac
+import time
+import threading
+from functools import partial
+
+# =====================================================
+# 🔹 MÉTRICAS (formato de texto de Prometheus)
+# Histogramas de latencia por ruta, tiempo de bcrypt y de SMTP, y llamadas,
+# documentos y latencia de Firestore por función que hace la llamada.
+# Se activan con METRICAS=1. Apagadas, cada punto de medición es un `if`
+# y Firestore no se envuelve. Las lee /metrics (sesión de admin o
+# "Authorization: Bearer $METRICAS_TOKEN").
+# Cada proceso lleva sus propias cuentas: con varios workers de gunicorn,
+# cada scrape ve el worker que lo atendió (ver proceso_pid).
+# =====================================================
+
+HABILITADO = os.environ.get('METRICAS', '0') == '1'
+TOKEN = os.environ.get('METRICAS_TOKEN', '')
+
+# Límites de los histogramas, en segundos
+LIMITES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+INF = 'le="+Inf"'
+
+_lock = threading.Lock()
+_metricas = {}   # nombre -> {'tipo', 'ayuda', 'etiquetas', 'series'}
+_medidores = []  # (nombre, tipo, ayuda, etiqueta, función) que se leen al exportar
+
+
+def definir(nombre, tipo, ayuda, etiquetas=()):
+    """Registra una métrica 'counter' o 'histogram' con sus nombres de etiqueta."""
+    _metricas[nombre] = {'tipo': tipo, 'ayuda': ayuda, 'etiquetas': tuple(etiquetas), 'series': {}}
+
+
+def registrar_medidor(nombre, ayuda, funcion, etiqueta=None, tipo='gauge'):
+    """
+    Valor que se calcula al exportar. funcion() devuelve un número o, con
+    `etiqueta`, un dict {valor de la etiqueta: número}.
+    """
+    _medidores.append((nombre, tipo, ayuda, etiqueta, funcion))
+
+
+def _clave(metrica, etiquetas):
+    return tuple(str(etiquetas.get(e, '')) for e in metrica['etiquetas'])
+
+
+def contar(nombre, n=1, **etiquetas):
+    if not HABILITADO:
+        return
+    metrica = _metricas[nombre]
+    clave = _clave(metrica, etiquetas)
+    with _lock:
+        metrica['series'][clave] = metrica['series'].get(clave, 0) + n
+
+
+def observar(nombre, segundos, **etiquetas):
+    if not HABILITADO:
+        return
+    metrica = _metricas[nombre]
+    clave = _clave(metrica, etiquetas)
+    with _lock:
+        serie = metrica['series'].get(clave)
+        if serie is None:
+            serie = metrica['series'][clave] = [[0] * len(LIMITES), 0.0, 0]
+        for i, limite in enumerate(LIMITES):
+            if segundos <= limite:
+                serie[0][i] += 1
+                break
+        serie[1] += segundos
+        serie[2] += 1
+
+
+class _Cronometro:
+    def __init__(self, nombre, etiquetas):
+        self.nombre = nombre
+        self.etiquetas = etiquetas
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, valor, tb):
+        observar(self.nombre, time.perf_counter() - self.inicio, **self.etiquetas)
+
+
+class _NoMide:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, tb):
+        return None
+
+
+_NO_MIDE = _NoMide()
+
+
+def cronometro(nombre, **etiquetas):
+    """with cronometro('bcrypt_segundos', operacion='verificar'): ..."""
+    return _Cronometro(nombre, etiquetas) if HABILITADO else _NO_MIDE
+
+
+# ----------------------------
+# FIRESTORE
+# ----------------------------
+LECTURAS = {'get', 'stream', 'get_all'}
+ESCRITURAS = {'set', 'update', 'delete', 'add', 'create', 'commit'}
+# Objetos de Firestore que hay que seguir envolviendo (cliente, referencias, consultas, lotes)
+_METODOS_ENCADENABLES = ('collection', 'document', 'stream', 'commit')
+# Módulos que llaman a Firestore en nombre de otro (se saltean al buscar la función)
+MODULOS_INTERMEDIOS = {__name__}
+
+
+def _funcion_llamadora():
+    """Nombre de la primera función fuera de MODULOS_INTERMEDIOS (saltando lambdas y comprensiones)."""
+    frame = sys._getframe(2)
+    while frame is not None and (frame.f_globals.get('__name__') in MODULOS_INTERMEDIOS
+                                 or frame.f_code.co_name.startswith('<')):
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else 'desconocida'
+
+
+def _registrar(operacion, funcion, segundos, leidos=0, escritos=0, error=False):
+    contar('firestore_llamadas_total', operacion=operacion, funcion=funcion)
+    observar('firestore_llamada_segundos', segundos, operacion=operacion, funcion=funcion)
+    if leidos:
+        contar('firestore_documentos_leidos_total', leidos, operacion=operacion, funcion=funcion)
+    if escritos:
+        contar('firestore_documentos_escritos_total', escritos, operacion=operacion, funcion=funcion)
+    if error:
+        contar('firestore_errores_total', operacion=operacion, funcion=funcion)
+
+
+def _real(valor):
+    if isinstance(valor, _Instrumentado):
+        return valor._real
+    if isinstance(valor, (list, tuple)):
+        return type(valor)(_real(v) for v in valor)
+    return valor
+
+
+def _envolver(valor):
+    if any(hasattr(valor, m) for m in _METODOS_ENCADENABLES) and not isinstance(valor, _Instrumentado):
+        return _Instrumentado(valor)
+    return valor
+
+
+def _encadenar(metodo, *args, **kwargs):
+    return _envolver(metodo(*_real(args), **{k: _real(v) for k, v in kwargs.items()}))
+
+
+def _iterar(documentos, operacion, funcion, inicio):
+    leidos, error = 0, False
+    try:
+        for doc in documentos:
+            leidos += 1
+            yield doc
+    except Exception:
+        error = True
+        raise
+    finally:
+        _registrar(operacion, funcion, time.perf_counter() - inicio, leidos=leidos, error=error)
+
+
+def _medir_llamada(metodo, operacion, *args, **kwargs):
+    funcion = _funcion_llamadora()
+    # Un commit escribe lo que se acumuló en el lote; hay que contarlo antes de confirmar
+    en_lote = len(metodo.__self__) if operacion == 'commit' else 0
+    inicio = time.perf_counter()
+    try:
+        resultado = metodo(*_real(args), **{k: _real(v) for k, v in kwargs.items()})
+    except Exception:
+        _registrar(operacion, funcion, time.perf_counter() - inicio, error=True)
+        raise
+    if operacion in ('stream', 'get_all'):
+        return _iterar(resultado, operacion, funcion, inicio)
+    segundos = time.perf_counter() - inicio
+    if operacion == 'get':
+        # DocumentReference.get() lee uno; Query.get() devuelve una lista
+        _registrar(operacion, funcion, segundos, leidos=len(resultado) if isinstance(resultado, list) else 1)
+    else:
+        _registrar(operacion, funcion, segundos, escritos=en_lote if operacion == 'commit' else 1)
+    return resultado
+
+
+def _escuchar(metodo, callback):
+    funcion = _funcion_llamadora()
+
+    def _contado(docs, cambios, momento):
+        # Cada documento que llega por el listener se cobra como una lectura
+        _registrar('on_snapshot', funcion, 0.0, leidos=len(cambios))
+        return callback(docs, cambios, momento)
+
+    return metodo(_contado)
+
+
+class _Instrumentado:
+    """Envuelve el cliente de Firestore y todo lo que se encadena desde él."""
+
+    __slots__ = ('_real',)
+
+    def __init__(self, real):
+        object.__setattr__(self, '_real', real)
+
+    def __bool__(self):
+        return bool(self._real)
+
+    def __getattr__(self, nombre):
+        valor = getattr(self._real, nombre)
+        if not callable(valor):
+            return valor
+        if nombre in ESCRITURAS and nombre != 'commit' and hasattr(self._real, 'commit'):
+            # set/update/delete de un WriteBatch solo acumulan, sin RPC: se cuentan en commit()
+            return partial(_encadenar, valor)
+        if nombre in LECTURAS or nombre in ESCRITURAS:
+            return partial(_medir_llamada, valor, nombre)
+        if nombre == 'on_snapshot':
+            return partial(_escuchar, valor)
+        return partial(_encadenar, valor)
+
+
+def instrumentar_firestore(cliente):
+    """El mismo cliente, contando llamadas y documentos si las métricas están activas."""
+    if not HABILITADO or cliente is None:
+        return cliente
+    return _Instrumentado(cliente)
+
+
+# ----------------------------
+# EXPORTACIÓN
+# ----------------------------
+def autorizado(cabecera):
+    """True si la cabecera Authorization trae el token de METRICAS_TOKEN."""
+    if not TOKEN or not cabecera or not cabecera.startswith('Bearer '):
+        return False
+    return hmac.compare_digest(cabecera[len('Bearer '):].strip(), TOKEN)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(nombres, valores, extra=()):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)] + list(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def exportar():
+    """Todas las métricas del proceso en el formato de texto de Prometheus."""
+    lineas = []
+    with _lock:
+        copia = {nombre: dict(m, series={k: (v if m['tipo'] == 'counter' else [list(v[0]), v[1], v[2]])
+                                         for k, v in m['series'].items()})
+                 for nombre, m in _metricas.items()}
+    for nombre, m in sorted(copia.items()):
+        lineas.append(f"# HELP {nombre} {m['ayuda']}")
+        lineas.append(f"# TYPE {nombre} {m['tipo']}")
+        for clave, valor in sorted(m['series'].items()):
+            if m['tipo'] == 'counter':
+                lineas.append(f"{nombre}{_etiquetas(m['etiquetas'], clave)} {_numero(valor)}")
+                continue
+            cubetas, suma, cantidad = valor
+            acumulado = 0
+            for limite, n in zip(LIMITES, cubetas):
+                acumulado += n
+                le = 'le="%s"' % limite
+                lineas.append(f"{nombre}_bucket{_etiquetas(m['etiquetas'], clave, [le])} {acumulado}")
+            lineas.append(f"{nombre}_bucket{_etiquetas(m['etiquetas'], clave, [INF])} {cantidad}")
+            lineas.append(f"{nombre}_sum{_etiquetas(m['etiquetas'], clave)} {_numero(suma)}")
+            lineas.append(f"{nombre}_count{_etiquetas(m['etiquetas'], clave)} {cantidad}")
+    for nombre, tipo, ayuda, etiqueta, funcion in _medidores:
+        try:
+            valor = funcion()
+        except Exception as e:
+            print(f"⚠️ No se pudo leer la métrica {nombre}: {e}")
+            continue
+        if valor is None:
+            continue
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        if etiqueta is None:
+            lineas.append(f"{nombre} {_numero(valor)}")
+        else:
+            for clave, v in sorted(valor.items()):
+                lineas.append(f"{nombre}{_etiquetas((etiqueta,), (clave,))} {_numero(v)}")
+    return '\n'.join(lineas) + '\n'
+
+
+# ----------------------------
+# MÉTRICAS DE LA APP
+# ----------------------------
+definir('http_peticion_segundos', 'histogram', 'Duración de las peticiones por ruta', ('ruta', 'metodo', 'estado'))
+definir('bcrypt_segundos', 'histogram', 'Tiempo de cada hash o verificación de bcrypt', ('operacion',))
+definir('smtp_envio_segundos', 'histogram', 'Tiempo de cada envío SMTP', ('resultado',))
+definir('firestore_llamadas_total', 'counter', 'Llamadas a Firestore', ('funcion', 'operacion'))
+definir('firestore_llamada_segundos', 'histogram', 'Latencia de las llamadas a Firestore', ('funcion', 'operacion'))
+definir('firestore_documentos_leidos_total', 'counter', 'Documentos leídos de Firestore (facturables)',
+        ('funcion', 'operacion'))
+definir('firestore_documentos_escritos_total', 'counter', 'Escrituras en Firestore', ('funcion', 'operacion'))
+definir('firestore_errores_total', 'counter', 'Llamadas a Firestore que fallaron', ('funcion', 'operacion'))
+registrar_medidor('proceso_pid', 'PID del worker que respondió', os.getpid)
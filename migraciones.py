@@ -0,0 +1,194 @@
+import sys
+import hashlib
+from firebase_admin import firestore
+from firebase_config import db
+import almacen_local
+import cambios_productos
+
+# =====================================================
+# 🔹 MIGRACIONES DE DATOS (se ejecutan una sola vez)
+#   python migraciones.py calificaciones
+#   python migraciones.py comentarios
+#   python migraciones.py marcas
+# =====================================================
+
+LOTE = 400
+
+
+def _confirmar_lote(batch, pendientes):
+    """
+    Confirma un lote de la migración y devuelve cuántos productos migró.
+    Si un producto cambió mientras tanto (falla la precondición), el lote
+    entero no se aplica: se avisa y se sigue, y la próxima corrida lo retoma.
+    """
+    try:
+        batch.commit()
+        return pendientes
+    except Exception as e:
+        print(f"⚠️ Un lote de {pendientes} productos no se migró, vuelve a ejecutar la migración: {e}")
+        return 0
+
+
+def _contadores_desde_arreglo(calificaciones):
+    valores = [int(v) for v in calificaciones if isinstance(v, (int, float)) and 1 <= v <= 5]
+    estrellas = {}
+    for v in valores:
+        estrellas[str(v)] = estrellas.get(str(v), 0) + 1
+    return len(valores), sum(valores), estrellas
+
+
+def migrar_calificaciones():
+    """
+    Pasa el arreglo 'calificaciones' de cada producto a los contadores
+    calif_cantidad / calif_suma / calif_estrellas. Se usa Increment y se borra
+    el arreglo en la misma escritura, así que repetir la migración no duplica
+    y no se pierden calificaciones que lleguen mientras corre.
+    """
+    if not db:
+        print("⚠️ Firebase no disponible, no se puede migrar.")
+        return 0
+
+    migrados = 0
+    batch = db.batch()
+    pendientes = 0
+    for d in db.collection("productos").stream():
+        data = d.to_dict() or {}
+        calificaciones = data.get("calificaciones")
+        if not isinstance(calificaciones, list):
+            continue
+        cantidad, suma, estrellas = _contadores_desde_arreglo(calificaciones)
+        cambios = {
+            "calificaciones": firestore.DELETE_FIELD,
+            "promedio": firestore.DELETE_FIELD,
+            "calif_cantidad": firestore.Increment(cantidad),
+            "calif_suma": firestore.Increment(suma),
+        }
+        for estrella, n in estrellas.items():
+            cambios[f"calif_estrellas.{estrella}"] = firestore.Increment(n)
+        # Si el arreglo cambió desde que lo leímos, la escritura falla y se reintenta después
+        batch.update(d.reference, cambios, option=db.write_option(last_update_time=d.update_time))
+        pendientes += 1
+        if pendientes >= LOTE:
+            migrados += _confirmar_lote(batch, pendientes)
+            batch, pendientes = db.batch(), 0
+    if pendientes:
+        migrados += _confirmar_lote(batch, pendientes)
+    print(f"⭐ Calificaciones migradas en Firebase: {migrados} productos")
+    return migrados
+
+
+def migrar_calificaciones_local():
+    """Lo mismo para el almacén local (modo offline)."""
+    migrados = 0
+    with almacen_local.transaccion() as conn:
+        for p in almacen_local.listar_productos():
+            calificaciones = p.pop("calificaciones", None)
+            if not isinstance(calificaciones, list):
+                continue
+            cantidad, suma, estrellas = _contadores_desde_arreglo(calificaciones)
+            p.pop("promedio", None)
+            p["calif_cantidad"] = int(p.get("calif_cantidad") or 0) + cantidad
+            p["calif_suma"] = float(p.get("calif_suma") or 0) + suma
+            previas = dict(p.get("calif_estrellas") or {})
+            for estrella, n in estrellas.items():
+                previas[estrella] = previas.get(estrella, 0) + n
+            p["calif_estrellas"] = previas
+            almacen_local.guardar_producto(p, conn)
+            migrados += 1
+    print(f"⭐ Calificaciones migradas en el almacén local: {migrados} productos")
+    return migrados
+
+
+def _id_comentario(c, posicion):
+    # Id determinista: si la migración se corta y se repite, se sobrescribe en vez de duplicar
+    base = f"{posicion}|{c.get('usuario', '')}|{c.get('fecha', '')}|{c.get('texto', '')}"
+    return hashlib.sha1(base.encode("utf-8")).hexdigest()[:20]
+
+
+def migrar_comentarios():
+    """
+    Mueve el arreglo 'comentarios' de cada producto a la subcolección
+    productos/{id}/comentarios y borra el arreglo del documento.
+    El borrado va en el último lote del producto, con precondición de
+    update_time, para no perder comentarios que lleguen durante la migración.
+    """
+    if not db:
+        print("⚠️ Firebase no disponible, no se puede migrar.")
+        return 0
+
+    migrados = 0
+    for d in db.collection("productos").stream():
+        data = d.to_dict() or {}
+        comentarios = data.get("comentarios")
+        if not isinstance(comentarios, list):
+            continue
+        sub = d.reference.collection("comentarios")
+        batch, pendientes = db.batch(), 0
+        for posicion, c in enumerate(comentarios):
+            if not isinstance(c, dict):
+                continue
+            batch.set(sub.document(_id_comentario(c, posicion)), {
+                "usuario": c.get("usuario", ""),
+                "texto": c.get("texto", ""),
+                "fecha": c.get("fecha", ""),
+            })
+            pendientes += 1
+            if pendientes >= LOTE:
+                batch.commit()
+                batch, pendientes = db.batch(), 0
+        batch.update(d.reference, {"comentarios": firestore.DELETE_FIELD},
+                     option=db.write_option(last_update_time=d.update_time))
+        try:
+            batch.commit()
+            migrados += 1
+        except Exception as e:
+            # Cambió el producto mientras migrábamos: volver a correr la migración
+            print(f"⚠️ Producto {d.id} no migrado, vuelve a ejecutar la migración: {e}")
+    print(f"💬 Comentarios migrados a subcolecciones: {migrados} productos")
+    return migrados
+
+
+def migrar_marcas():
+    """
+    Pone updated_at a los productos que aún no lo tienen, para que entren en
+    /api/productos?since= (ver cambios_productos). Cada escritura lleva
+    precondición de update_time: si el producto cambió mientras tanto, ya
+    tiene su marca y el lote se vuelve a intentar en la próxima corrida.
+    """
+    if not db:
+        print("⚠️ Firebase no disponible, no se puede migrar.")
+        return 0
+
+    migrados = 0
+    batch, pendientes = db.batch(), 0
+    for d in db.collection("productos").stream():
+        if cambios_productos.CAMPO in (d.to_dict() or {}):
+            continue
+        batch.update(d.reference, {cambios_productos.CAMPO: firestore.SERVER_TIMESTAMP},
+                     option=db.write_option(last_update_time=d.update_time))
+        pendientes += 1
+        if pendientes >= LOTE:
+            migrados += _confirmar_lote(batch, pendientes)
+            batch, pendientes = db.batch(), 0
+    if pendientes:
+        migrados += _confirmar_lote(batch, pendientes)
+    print(f"🕒 Productos marcados con {cambios_productos.CAMPO}: {migrados}")
+    return migrados
+
+
+MIGRACIONES = {
+    "calificaciones": (migrar_calificaciones, migrar_calificaciones_local),
+    "comentarios": (migrar_comentarios,),
+    "marcas": (migrar_marcas,),
+}
+
+if __name__ == "__main__":
+    nombres = sys.argv[1:] or list(MIGRACIONES)
+    for nombre in nombres:
+        if nombre not in MIGRACIONES:
+            print(f"❌ Migración desconocida: {nombre}. Opciones: {', '.join(MIGRACIONES)}")
+            sys.exit(1)
+        print(f"🔄 Migrando {nombre}...")
+        for paso in MIGRACIONES[nombre]:
+            paso()
+    print("🎉 Migraciones terminadas.")
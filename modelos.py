@@ -0,0 +1,98 @@
+import os
+import gzip
+import hashlib
+import threading
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se sirve gzip
+    brotli = None
+
+# =====================================================
+# 🔹 ENTREGA DE MODELOS 3D (GLB/GLTF)
+# ETag por contenido, variantes .gz/.br generadas una sola vez y
+# elección de la variante según Accept-Encoding.
+# =====================================================
+
+MIMETYPES = {
+    'glb': 'model/gltf-binary',
+    'gltf': 'model/gltf+json',
+    'obj': 'text/plain',
+    'fbx': 'application/octet-stream',
+}
+
+# (codificación, extensión) en orden de preferencia
+VARIANTES = [('br', '.br'), ('gzip', '.gz')]
+
+_etags = {}
+_lock = threading.Lock()
+
+
+def mimetype(nombre_archivo):
+    ext = nombre_archivo.rsplit('.', 1)[-1].lower() if '.' in nombre_archivo else ''
+    return MIMETYPES.get(ext, 'application/octet-stream')
+
+
+def etag(ruta):
+    """Hash del contenido, recalculado solo si cambian tamaño o fecha del archivo."""
+    st = os.stat(ruta)
+    clave = (ruta, st.st_size, st.st_mtime_ns)
+    with _lock:
+        valor = _etags.get(ruta)
+        if valor and valor[0] == clave:
+            return valor[1]
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 16), b''):
+            h.update(bloque)
+    digest = h.hexdigest()[:32]
+    with _lock:
+        _etags[ruta] = (clave, digest)
+    return digest
+
+
+def _vigente(ruta, variante):
+    return os.path.exists(variante) and os.stat(variante).st_mtime_ns >= os.stat(ruta).st_mtime_ns
+
+
+def _escribir_atomico(destino, datos):
+    tmp = f"{destino}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, 'wb') as f:
+        f.write(datos)
+    os.replace(tmp, destino)
+
+
+def generar_variantes(ruta):
+    """Crea (o renueva) ruta.gz y ruta.br. Se llama al subir el modelo."""
+    with open(ruta, 'rb') as f:
+        crudo = f.read()
+    if not _vigente(ruta, ruta + '.gz'):
+        _escribir_atomico(ruta + '.gz', gzip.compress(crudo, compresslevel=9, mtime=0))
+    if brotli is not None and not _vigente(ruta, ruta + '.br'):
+        _escribir_atomico(ruta + '.br', brotli.compress(crudo, quality=11))
+
+
+def eliminar_variantes(ruta):
+    for _, ext in VARIANTES:
+        try:
+            os.remove(ruta + ext)
+        except FileNotFoundError:
+            pass
+
+
+def variantes_vigentes(ruta):
+    return _vigente(ruta, ruta + '.gz') and (brotli is None or _vigente(ruta, ruta + '.br'))
+
+
+def elegir_variante(ruta, accept_encoding):
+    """
+    Devuelve (ruta_a_servir, content_encoding o None).
+    Solo usa una variante si el cliente la acepta, está al día y es más chica.
+    """
+    aceptadas = {p.split(';')[0].strip().lower() for p in (accept_encoding or '').split(',')}
+    original = os.path.getsize(ruta)
+    for codificacion, ext in VARIANTES:
+        variante = ruta + ext
+        if codificacion in aceptadas and _vigente(ruta, variante) and os.path.getsize(variante) < original:
+            return variante, codificacion
+    return ruta, None
@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+
+# =====================================================
+# 🔹 PRUEBA DE CARGA LOCAL
+# Levanta gunicorn contra el Firestore en memoria (firestore_memoria) con
+# una latencia simulada por llamada y mide peticiones por segundo con
+# varios clientes concurrentes, comparando la configuración de
+# gunicorn.conf.py con workers sync.
+#   python probar_carga.py
+#   python probar_carga.py --duracion 30 --clientes 64 --latencia 20
+#   python probar_carga.py --modos gthread --productos 1000
+# =====================================================
+
+CARPETA = os.path.dirname(os.path.abspath(__file__))
+
+# nombre -> (argumentos extra para gunicorn, descripción)
+MODOS = {
+    'sync-defecto': (['--worker-class', 'sync', '--workers', '1', '--threads', '1'],
+                     'gunicorn app:app (1 worker sync)'),
+    'sync': (['--worker-class', 'sync', '--threads', '1'], 'workers sync de gunicorn.conf.py'),
+    'gthread': ([], 'gunicorn.conf.py tal cual'),
+}
+
+
+def generar_semilla(ruta, cantidad, comentarios):
+    """Catálogo sintético a partir de productos.json, con algunos comentarios por producto."""
+    with open(os.path.join(CARPETA, 'productos.json'), 'r', encoding='utf-8') as f:
+        base = json.load(f)
+    productos, subcolecciones = [], {}
+    for i in range(cantidad):
+        p = dict(base[i % len(base)], id=f"carga{i:05d}")
+        p['nombre'] = f"{p.get('nombre', 'Producto')} {i}"
+        productos.append(p)
+        subcolecciones[f"productos/{p['id']}/comentarios"] = [
+            {'id': f"c{j}", 'usuario': 'carga@example.com', 'texto': f"Comentario {j}",
+             'fecha': f"2025-01-{j + 1:02d} 10:00:00"}
+            for j in range(comentarios)
+        ]
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(dict(subcolecciones, productos=productos), f)
+    return [p['id'] for p in productos]
+
+
+def rutas_de_prueba(ids):
+    """Mezcla de páginas: portada, detalle (consulta de comentarios) y API paginada."""
+    return [
+        (4, lambda: '/'),
+        (4, lambda: f"/producto/{random.choice(ids)}"),
+        (2, lambda: f"/api/productos?limit=20&start_after={random.choice(ids)}"),
+    ]
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _esperar_listo(puerto, proceso, limite=90):
+    fin = time.time() + limite
+    while time.time() < fin:
+        if proceso.poll() is not None:
+            raise RuntimeError("gunicorn terminó antes de arrancar")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', puerto, timeout=5)
+            conn.request('GET', '/api/productos?limit=1')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.3)
+    raise RuntimeError("gunicorn no respondió a tiempo")
+
+
+def _cliente(puerto, fin, rutas, latencias, errores):
+    pesos = [p for p, _ in rutas]
+    conn = http.client.HTTPConnection('127.0.0.1', puerto, timeout=30)
+    while time.time() < fin:
+        _, ruta = random.choices(rutas, weights=pesos)[0]
+        inicio = time.perf_counter()
+        try:
+            conn.request('GET', ruta())
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status != 200:
+                errores.append(resp.status)
+                continue
+        except (OSError, http.client.HTTPException) as e:
+            errores.append(type(e).__name__)
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', puerto, timeout=30)
+            continue
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    conn.close()
+
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def correr(modo, args, semilla, ids):
+    extra, _ = MODOS[modo]
+    puerto = _puerto_libre()
+    entorno = dict(os.environ,
+                   PORT=str(puerto),
+                   FIRESTORE_EN_MEMORIA='1',
+                   FIRESTORE_MEMORIA_SEMILLA=semilla,
+                   FIRESTORE_MEMORIA_LATENCIA_MS=str(args.latencia),
+                   LOCAL_DB=os.path.join(os.path.dirname(semilla), 'local.db'),
+                   BCRYPT_ROUNDS=os.environ.get('BCRYPT_ROUNDS', '10'),
+                   GUNICORN_MAX_REQUESTS='0')
+    comando = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', *extra, 'app:app']
+    salida = open(os.path.join(os.path.dirname(semilla), f"gunicorn-{modo}.log"), 'w')
+    proceso = subprocess.Popen(comando, cwd=CARPETA, env=entorno, stdout=salida, stderr=subprocess.STDOUT)
+    try:
+        _esperar_listo(puerto, proceso)
+        rutas = rutas_de_prueba(ids)
+        # Calentamiento: plantillas compiladas y cachés de fragmentos llenas
+        _cliente(puerto, time.time() + 2, rutas, [], [])
+        latencias, errores = [], []
+        fin = time.time() + args.duracion
+        hilos = [threading.Thread(target=_cliente, args=(puerto, fin, rutas, latencias, errores))
+                 for _ in range(args.clientes)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+    finally:
+        proceso.terminate()
+        try:
+            proceso.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+        salida.close()
+    return {
+        'modo': modo,
+        'peticiones': len(latencias),
+        'req_s': round(len(latencias) / args.duracion, 1),
+        'p50_ms': round(_percentil(latencias, 0.50) or 0, 1),
+        'p95_ms': round(_percentil(latencias, 0.95) or 0, 1),
+        'p99_ms': round(_percentil(latencias, 0.99) or 0, 1),
+        'errores': len(errores),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga con Firestore en memoria")
+    parser.add_argument('--modos', default='sync-defecto,sync,gthread',
+                        help=f"modos separados por coma: {', '.join(MODOS)}")
+    parser.add_argument('--duracion', type=float, default=20, help="segundos de medición por modo")
+    parser.add_argument('--clientes', type=int, default=64, help="clientes concurrentes")
+    parser.add_argument('--latencia', type=float, default=20, help="ms por llamada a Firestore")
+    parser.add_argument('--productos', type=int, default=200)
+    parser.add_argument('--comentarios', type=int, default=3, help="comentarios por producto")
+    parser.add_argument('--json', help="guarda los resultados en este archivo")
+    args = parser.parse_args()
+
+    modos = [m.strip() for m in args.modos.split(',') if m.strip()]
+    for m in modos:
+        if m not in MODOS:
+            parser.error(f"modo desconocido: {m}")
+
+    with tempfile.TemporaryDirectory(prefix='carga-') as carpeta:
+        semilla = os.path.join(carpeta, 'semilla.json')
+        ids = generar_semilla(semilla, args.productos, args.comentarios)
+        print(f"🧪 {args.productos} productos, {args.clientes} clientes, "
+              f"{args.latencia:.0f} ms por llamada a Firestore, {os.cpu_count()} CPUs")
+        resultados = []
+        for modo in modos:
+            print(f"▶️  {modo}: {MODOS[modo][1]} ...")
+            r = correr(modo, args, semilla, ids)
+            resultados.append(r)
+            print(f"   {r['req_s']} req/s  p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  "
+                  f"p99 {r['p99_ms']} ms  errores {r['errores']}")
+
+    print("\n| modo | req/s | p50 ms | p95 ms | p99 ms | errores |")
+    print("|---|---|---|---|---|---|")
+    for r in resultados:
+        print(f"| {r['modo']} | {r['req_s']} | {r['p50_ms']} | {r['p95_ms']} | {r['p99_ms']} | {r['errores']} |")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'parametros': vars(args), 'resultados': resultados}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
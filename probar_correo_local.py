@@ -0,0 +1,53 @@
+import os
+import time
+import tempfile
+
+# Prueba la bandeja de salida contra un SMTP local (aiosmtpd), sin Gmail.
+#   pip install aiosmtpd
+#   python probar_correo_local.py
+from aiosmtpd.controller import Controller
+from aiosmtpd.handlers import Sink
+
+import correo
+
+
+class Contador(Sink):
+    def __init__(self):
+        self.mensajes = 0
+        self.sesiones = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sesiones += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.mensajes += 1
+        return '250 OK'
+
+
+handler = Contador()
+controller = Controller(handler, hostname='127.0.0.1', port=8025)
+controller.start()
+
+correo.CONFIG.update({
+    'host': '127.0.0.1',
+    'puerto': 8025,
+    'ssl': False,
+    'usuario': 'pruebas@disfaluvid.local',
+    'clave': None,
+    'cola_db': os.path.join(tempfile.mkdtemp(), 'cola.db'),
+})
+
+try:
+    ids = [correo.encolar('cliente@ejemplo.com', f'Prueba {i}', f'<p>Mensaje {i}</p>') for i in range(5)]
+    limite = time.time() + 10
+    while time.time() < limite and any(correo.estado(i)['estado'] != 'enviado' for i in ids):
+        time.sleep(0.1)
+
+    for i in ids:
+        e = correo.estado(i)
+        print(f"#{i}: {e['estado']} (intentos: {e['intentos']})")
+    print(f"📬 Mensajes recibidos: {handler.mensajes}, conexiones SMTP abiertas: {handler.sesiones}")
+finally:
+    controller.stop()
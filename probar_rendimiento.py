@@ -0,0 +1,261 @@
+import gc
+import os
+import sys
+import json
+import time
+import atexit
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import datetime
+
+# =====================================================
+# 🔹 MICROBENCHMARKS DE LOS CAMINOS CALIENTES
+# Mide normalización de productos y usuarios, la combinación del catálogo,
+# la lectura del almacén local, el render de index.html y verify_password
+# con catálogos sintéticos de 10, 1.000 y 50.000 productos. Firestore es el
+# de firestore_memoria sin latencia, así que solo se mide el código propio.
+#   python probar_rendimiento.py                                  # mide y muestra
+#   python probar_rendimiento.py --guardar rendimiento/base.json  # nueva línea base
+#   python probar_rendimiento.py --comparar rendimiento/base.json --umbral 0.25
+# Con --comparar sale con código 1 si algún caso es más lento que la línea
+# base en más del umbral. Se compara el mínimo de las muestras, que es lo
+# menos afectado por el ruido de la máquina; las líneas base solo sirven en
+# la misma máquina.
+# =====================================================
+
+CARPETA = os.path.dirname(os.path.abspath(__file__))
+TAMANOS = (10, 1000, 50000)
+LINEA_BASE = os.path.join(CARPETA, 'rendimiento', 'base.json')
+UMBRAL = 0.25
+REPETICIONES = 5
+# Cada muestra repite la función hasta durar al menos esto
+MUESTRA_MIN_S = 0.05
+
+# El almacén local va a un archivo temporal y bcrypt usa un costo fijo,
+# así los resultados no dependen de la calibración de cada máquina
+_TEMPORAL = tempfile.mkdtemp(prefix='rendimiento-')
+atexit.register(shutil.rmtree, _TEMPORAL, True)
+os.environ['LOCAL_DB'] = os.path.join(_TEMPORAL, 'local.db')
+os.environ.setdefault('BCRYPT_ROUNDS', '10')
+os.chdir(CARPETA)
+sys.path.insert(0, CARPETA)
+
+import app as A  # noqa: E402
+import fragmentos  # noqa: E402
+import almacen_local  # noqa: E402
+import firestore_memoria  # noqa: E402
+
+
+# ----------------------------
+# DATOS SINTÉTICOS
+# ----------------------------
+def productos_sinteticos(cantidad, semilla=1):
+    """Productos con la mezcla de formatos que aparece en datos reales (textos, vacíos, contadores viejos)."""
+    rnd = random.Random(semilla)
+    productos = []
+    for i in range(cantidad):
+        p = {
+            'id': f"p{i:06d}",
+            'nombre': f"Mueble {i}",
+            'descripcion': 'Mueble de prueba ' * rnd.randint(1, 6),
+            'precio': rnd.choice([rnd.randint(10, 900), f"{rnd.uniform(10, 900):.2f}", '']),
+            'imagen': f"img/mueble{i % 6}.jpg",
+            'archivo_ra': f"mueble{i % 6}.glb" if i % 3 == 0 else '',
+            'frente': rnd.choice([rnd.randint(30, 220), str(rnd.randint(30, 220)), None, '']),
+            'fondo': rnd.choice([rnd.randint(30, 90), None]),
+            'altura': rnd.choice([rnd.randint(40, 210), '']),
+        }
+        if i % 4 == 0:
+            p['calificaciones'] = [rnd.randint(1, 5) for _ in range(rnd.randint(0, 8))]
+        else:
+            p['calif_cantidad'] = rnd.randint(0, 50)
+            p['calif_suma'] = p['calif_cantidad'] * rnd.uniform(1, 5)
+        productos.append(p)
+    return productos
+
+
+def usuarios_sinteticos(cantidad, semilla=2):
+    rnd = random.Random(semilla)
+    usuarios = []
+    for i in range(cantidad):
+        u = {'nombre': f"Usuario {i}", 'correo': f"usuario{i}@example.com"}
+        u['password' if rnd.random() < 0.3 else 'clave'] = f"clave{i}"
+        if i % 10 == 0:
+            u['rol'] = 'admin'
+        usuarios.append(u)
+    return usuarios
+
+
+def preparar(tamano):
+    """Deja Firestore en memoria, el almacén local y el catálogo con `tamano` productos."""
+    productos = productos_sinteticos(tamano)
+    cliente = firestore_memoria.Cliente(latencia_ms=0)
+    cliente.cargar({'productos': productos, 'usuarios': usuarios_sinteticos(min(tamano, 1000))})
+    A.db = cliente
+    almacen_local.reemplazar_productos(productos)
+    A.cerrar()
+    with A._catalogo_lock:
+        A._catalogo['productos'] = None
+    A.cargar_productos()
+    fragmentos.limpiar()
+    return productos
+
+
+# ----------------------------
+# CASOS
+# ----------------------------
+def casos(tamano, productos):
+    """{nombre: función sin argumentos} para este tamaño de catálogo."""
+    usuarios = usuarios_sinteticos(tamano)
+    cloud = [A._normalize_product(p, i) for i, p in enumerate(productos)]
+    # Un 10% de los locales no está en la nube
+    local = cloud[::10] + [dict(p, id=f"local{i}") for i, p in enumerate(cloud[::10])]
+    contexto = A.app.test_request_context('/')
+
+    def render_index():
+        with contexto:
+            productos_vista, facetas = A.buscar_productos({}, con_facetas=True)
+            tarjetas = [A.tarjeta_html(p) for p in productos_vista]
+            return A.render_template('index.html', tarjetas=tarjetas, carrito_cant=0, rol='user',
+                                     facetas=facetas, filtros={})
+
+    def render_index_frio():
+        fragmentos.limpiar()
+        return render_index()
+
+    return {
+        'normalize_product': lambda: [A._normalize_product(p, i) for i, p in enumerate(productos)],
+        'normalize_user': lambda: [A._normalize_user(u) for u in usuarios],
+        'combinar_catalogo': lambda: A._combinar_productos(cloud, local),
+        'recargar_catalogo': A._recargar_catalogo,
+        'leer_local_productos': A._leer_local_productos,
+        'render_index': render_index,
+        'render_index_frio': render_index_frio,
+    }
+
+
+def casos_fijos():
+    """Casos que no dependen del tamaño del catálogo."""
+    hash_guardado = A.hash_password('clave-de-prueba')
+    return {
+        'verify_password': lambda: A.verify_password('clave-de-prueba', hash_guardado),
+        'verify_password_incorrecta': lambda: A.verify_password('otra-clave', hash_guardado),
+    }
+
+
+def medir(funcion, repeticiones=REPETICIONES):
+    """Milisegundos por llamada: mediana y mínimo de `repeticiones` muestras."""
+    funcion()  # calentamiento
+    vueltas, inicio = 1, time.perf_counter()
+    funcion()
+    duracion = time.perf_counter() - inicio
+    if duracion < MUESTRA_MIN_S:
+        vueltas = max(1, int(MUESTRA_MIN_S / max(duracion, 1e-7)))
+    muestras = []
+    # Como timeit: sin recolector de basura durante las muestras
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            for _ in range(vueltas):
+                funcion()
+            muestras.append((time.perf_counter() - inicio) * 1000 / vueltas)
+    finally:
+        gc.enable()
+    return {'mediana_ms': round(statistics.median(muestras), 4),
+            'min_ms': round(min(muestras), 4), 'vueltas': vueltas, 'repeticiones': repeticiones}
+
+
+def correr(tamanos, filtro='', repeticiones=REPETICIONES):
+    resultados = {}
+
+    def _medir(nombre, funcion):
+        if filtro and filtro not in nombre:
+            return
+        r = medir(funcion, repeticiones)
+        resultados[nombre] = r
+        print(f"  {nombre:<38} {r['mediana_ms']:>12.4f} ms  (mín {r['min_ms']:.4f}, x{r['vueltas']})")
+
+    for tamano in tamanos:
+        print(f"📦 Catálogo de {tamano} productos")
+        productos = preparar(tamano)
+        for nombre, funcion in casos(tamano, productos).items():
+            _medir(f"{nombre}/{tamano}", funcion)
+    print("🔐 Contraseñas")
+    for nombre, funcion in casos_fijos().items():
+        _medir(nombre, funcion)
+    return resultados
+
+
+def metadatos(tamanos):
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'bcrypt_rounds': A.BCRYPT_ROUNDS,
+        'tamanos': list(tamanos),
+    }
+
+
+def comparar(actual, base, umbral):
+    """Lista de (caso, base ms, actual ms, cambio) y si hubo regresiones."""
+    filas, regresion = [], False
+    for nombre, r in sorted(actual.items()):
+        previo = base.get(nombre)
+        if previo is None:
+            filas.append((nombre, None, r['min_ms'], None, '🆕'))
+            continue
+        cambio = r['min_ms'] / previo['min_ms'] - 1 if previo['min_ms'] else 0.0
+        if cambio > umbral:
+            marca, regresion = '⚠️ ', True
+        else:
+            marca = '🚀' if cambio < -umbral else '✅'
+        filas.append((nombre, previo['min_ms'], r['min_ms'], cambio, marca))
+    return filas, regresion
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks del catálogo, la normalización y el login")
+    parser.add_argument('--tamanos', default=','.join(str(t) for t in TAMANOS),
+                        help="tamaños de catálogo separados por coma")
+    parser.add_argument('--filtro', default='', help="solo los casos cuyo nombre contenga este texto")
+    parser.add_argument('--repeticiones', type=int, default=REPETICIONES)
+    parser.add_argument('--guardar', nargs='?', const=LINEA_BASE, help="guarda los resultados como línea base")
+    parser.add_argument('--comparar', nargs='?', const=LINEA_BASE, help="compara con una línea base")
+    parser.add_argument('--umbral', type=float, default=UMBRAL,
+                        help="aumento relativo del mínimo que cuenta como regresión (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    tamanos = [int(t) for t in args.tamanos.split(',') if t.strip()]
+    resultados = correr(tamanos, args.filtro, args.repeticiones)
+
+    if args.guardar:
+        os.makedirs(os.path.dirname(os.path.abspath(args.guardar)), exist_ok=True)
+        with open(args.guardar, 'w', encoding='utf-8') as f:
+            json.dump({'meta': metadatos(tamanos), 'resultados': resultados}, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f"💾 Línea base guardada en {args.guardar}")
+
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        filas, regresion = comparar(resultados, base['resultados'], args.umbral)
+        print(f"\n📊 Contra {args.comparar} ({base['meta'].get('fecha')}), umbral {args.umbral:.0%}")
+        for nombre, previo, actual, cambio, marca in filas:
+            previo_txt = f"{previo:.4f}" if previo is not None else '-'
+            cambio_txt = f"{cambio:+.1%}" if cambio is not None else ''
+            print(f"  {marca} {nombre:<38} {previo_txt:>12} -> {actual:.4f} ms {cambio_txt}")
+        if regresion:
+            print("❌ Hay regresiones por encima del umbral")
+            sys.exit(1)
+        print("✅ Sin regresiones")
+
+
+if __name__ == '__main__':
+    main()
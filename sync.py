@@ -1,64 +1,207 @@
-import os, json
+import json
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from firebase_config import db  # usa la conexión que ya tienes
-from app import _normalize_product, _normalize_user, PRODUCTOS_JSON, USUARIOS_JSON
+from app import _normalize_product, _normalize_user
+import almacen_local
+import cambios_productos
+import diario_offline
 
-def sync_productos():
-    if not db:
-        print("⚠️ Firebase no disponible, no se puede sincronizar productos.")
-        return
+# =====================================================
+# 🔹 SINCRONIZACIÓN LOCAL <-> FIREBASE
+# Lee el estado remoto de una vez, compara hashes de contenido por registro
+# y solo escribe lo que cambió, en WriteBatch de hasta 500 operaciones que
+# se confirman en paralelo.
+#   python sync.py                 # sube cambios locales (push)
+#   python sync.py --dry-run       # solo muestra qué haría
+#   python sync.py --modo pull     # baja Firebase al almacén local
+#   python sync.py --borrar        # también elimina lo que sobra en el destino
+# =====================================================
 
-    if not os.path.exists(PRODUCTOS_JSON):
-        print("⚠️ No hay archivo local de productos.")
-        return
+LOTE_MAX = 500
+HILOS_COMMIT = 4
+
+# Derivados, contadores de calificación y comentarios: los mantiene Firestore
+# (Increment, subcolecciones) y un push no los sube ni los compara; son los
+# mismos que el diario offline no reenvía
+CAMPOS_DERIVADOS = diario_offline.CAMPOS_IGNORADOS
 
-    with open(PRODUCTOS_JSON, "r", encoding="utf-8") as f:
-        productos_local = json.load(f)
 
-    for i, p in enumerate(productos_local):
+def _hash(data, campos=None):
+    """Hash estable del contenido; con campos, solo se consideran esas claves."""
+    if campos is not None:
+        data = {k: data.get(k) for k in campos}
+    crudo = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(crudo.encode("utf-8")).hexdigest()
+
+
+def _productos_locales():
+    locales = {}
+    for i, p in enumerate(almacen_local.listar_productos()):
         p = _normalize_product(p, i)
-        pid = str(p["id"])
-        doc_ref = db.collection("productos").document(pid)
-        doc = doc_ref.get()
+        for campo in CAMPOS_DERIVADOS:
+            p.pop(campo, None)
+        locales[str(p["id"])] = p
+    return locales
+
+
+def _usuarios_locales():
+    locales = {}
+    for u in almacen_local.listar_usuarios():
+        u = _normalize_user(u)
+        correo = (u.get("correo") or "").lower()
+        if correo:
+            locales[correo] = u
+    return locales
 
-        if not doc.exists:
-            doc_ref.set(p)
-            print(f"⬆️ Producto subido a Firebase: {p['nombre']}")
+
+def _leer_remoto(coleccion):
+    """Toda la colección en un solo stream: id -> datos."""
+    return {d.id: (d.to_dict() or {}) for d in db.collection(coleccion).stream()}
+
+
+def _plan(origen, destino, borrar):
+    """
+    Compara origen contra destino. Un registro está "sin cambios" si los campos
+    que tiene en el origen valen lo mismo en el destino.
+    """
+    plan = {"creados": [], "actualizados": [], "sin_cambios": [], "eliminados": []}
+    for rid, data in origen.items():
+        if rid not in destino:
+            plan["creados"].append(rid)
+        elif _hash(data) != _hash(destino[rid], data.keys()):
+            plan["actualizados"].append(rid)
         else:
-            # 🔹 Si ya existe, actualizamos con los cambios locales
-            doc_ref.update(p)
-            print(f"🔄 Producto actualizado en Firebase: {p['nombre']}")
+            plan["sin_cambios"].append(rid)
+    if borrar:
+        plan["eliminados"] = [rid for rid in destino if rid not in origen]
+    return plan
 
-def sync_usuarios():
-    if not db:
-        print("⚠️ Firebase no disponible, no se puede sincronizar usuarios.")
-        return
 
-    if not os.path.exists(USUARIOS_JSON):
-        print("⚠️ No hay archivo local de usuarios.")
+def _commit_en_lotes(operaciones):
+    """
+    operaciones: lista de (accion, ref, datos). Confirma lotes de hasta LOTE_MAX
+    escrituras en paralelo. "delete_producto" deja además la lápida del producto
+    en el mismo lote (ver cambios_productos).
+    """
+    lotes, batch, escrituras = [], None, 0
+    for accion, ref, datos in operaciones:
+        n = 2 if accion == "delete_producto" else 1
+        if batch is None or escrituras + n > LOTE_MAX:
+            batch, escrituras = db.batch(), 0
+            lotes.append(batch)
+        if accion == "set":
+            batch.set(ref, datos)
+        elif accion == "merge":
+            batch.set(ref, datos, merge=True)
+        else:
+            batch.delete(ref)
+            if accion == "delete_producto":
+                cambios_productos.anotar_borrado(db, batch, ref.id)
+        escrituras += n
+    if not lotes:
         return
+    with ThreadPoolExecutor(max_workers=min(HILOS_COMMIT, len(lotes))) as pool:
+        list(pool.map(lambda b: b.commit(), lotes))
 
-    with open(USUARIOS_JSON, "r", encoding="utf-8") as f:
-        usuarios_local = json.load(f)
 
-    for u in usuarios_local:
-        u = _normalize_user(u)
-        correo = u["correo"].lower()
-        if not correo:
-            continue
-        doc_ref = db.collection("usuarios").document(correo)
-        doc = doc_ref.get()
-        if not doc.exists:
-            doc_ref.set(u)
-            print(f"⬆️ Usuario subido a Firebase: {u['correo']}")
-        else:
-            doc_ref.update(u)  # 🔹 Actualizar también usuarios
-            print(f"🔄 Usuario actualizado en Firebase: {u['correo']}")
+def _push(coleccion, locales, borrar, dry_run):
+    remoto = _leer_remoto(coleccion)
+    plan = _plan(locales, remoto, borrar)
+    if not dry_run:
+        col = db.collection(coleccion)
+        # Los productos llevan updated_at para la sincronización incremental de la app
+        es_producto = coleccion == "productos"
+        marcar = cambios_productos.con_marca if es_producto else dict
+        operaciones = (
+            [("set", col.document(rid), marcar(locales[rid])) for rid in plan["creados"]]
+            + [("merge", col.document(rid), marcar(locales[rid])) for rid in plan["actualizados"]]
+            + [("delete_producto" if es_producto else "delete", col.document(rid), None)
+               for rid in plan["eliminados"]]
+        )
+        _commit_en_lotes(operaciones)
+    return plan
+
+
+def _pull_productos(borrar, dry_run):
+    remoto = {}
+    for rid, data in _leer_remoto("productos").items():
+        data = dict(data)
+        data.pop(cambios_productos.CAMPO, None)
+        data["id"] = str(data.get("id", rid))
+        remoto[data["id"]] = data
+    locales = {p["id"]: p for p in (dict(x) for x in almacen_local.listar_productos())}
+    plan = _plan(remoto, locales, borrar)
+    if not dry_run:
+        with almacen_local.transaccion() as conn:
+            for rid in plan["creados"] + plan["actualizados"]:
+                almacen_local.guardar_producto(dict(locales.get(rid, {}), **remoto[rid]), conn)
+            for rid in plan["eliminados"]:
+                conn.execute("DELETE FROM productos WHERE id = ?", (rid,))
+    return plan
+
+
+def _pull_usuarios(borrar, dry_run):
+    remoto = {}
+    for rid, data in _leer_remoto("usuarios").items():
+        correo = (data.get("correo") or rid).lower()
+        remoto[correo] = data
+    locales = {(u.get("correo") or "").lower(): u for u in almacen_local.listar_usuarios()}
+    plan = _plan(remoto, locales, borrar)
+    if not dry_run:
+        for rid in plan["creados"] + plan["actualizados"]:
+            almacen_local.guardar_usuario(dict(locales.get(rid, {}), **remoto[rid]))
+        if plan["eliminados"]:
+            with almacen_local.transaccion() as conn:
+                for rid in plan["eliminados"]:
+                    conn.execute("DELETE FROM usuarios WHERE correo = ?", (rid,))
+    return plan
+
+
+def _resumen(nombre, plan, dry_run):
+    prefijo = "🧪 (dry-run) " if dry_run else ""
+    print(f"{prefijo}{nombre}: {len(plan['creados'])} creados, {len(plan['actualizados'])} actualizados, "
+          f"{len(plan['sin_cambios'])} sin cambios, {len(plan['eliminados'])} eliminados")
+
+
+def sync_productos(modo="push", borrar=False, dry_run=False):
+    if not db:
+        print("⚠️ Firebase no disponible, no se puede sincronizar productos.")
+        return None
+    if modo == "pull":
+        plan = _pull_productos(borrar, dry_run)
+    else:
+        plan = _push("productos", _productos_locales(), borrar, dry_run)
+    _resumen("Productos", plan, dry_run)
+    return plan
 
-if __name__ == "__main__":
-    print("🔄 Sincronizando productos...")
-    sync_productos()
-    print("🔄 Sincronizando usuarios...")
-    sync_usuarios()
-    print("🎉 Sincronización terminada.")
 
+def sync_usuarios(modo="push", borrar=False, dry_run=False):
+    if not db:
+        print("⚠️ Firebase no disponible, no se puede sincronizar usuarios.")
+        return None
+    if modo == "pull":
+        plan = _pull_usuarios(borrar, dry_run)
+    else:
+        plan = _push("usuarios", _usuarios_locales(), borrar, dry_run)
+    _resumen("Usuarios", plan, dry_run)
+    return plan
 
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sincroniza el almacén local con Firebase.")
+    parser.add_argument("--modo", choices=("push", "pull"), default="push",
+                        help="push: local -> Firebase (por defecto); pull: Firebase -> local")
+    parser.add_argument("--dry-run", action="store_true", help="no escribe nada, solo muestra el resumen")
+    parser.add_argument("--borrar", action="store_true", help="elimina en el destino lo que no existe en el origen")
+    parser.add_argument("--solo", choices=("productos", "usuarios"), help="sincronizar una sola colección")
+    args = parser.parse_args()
+
+    if args.solo in (None, "productos"):
+        print("🔄 Sincronizando productos...")
+        sync_productos(args.modo, args.borrar, args.dry_run)
+    if args.solo in (None, "usuarios"):
+        print("🔄 Sincronizando usuarios...")
+        sync_usuarios(args.modo, args.borrar, args.dry_run)
+    print("🎉 Sincronización terminada.")
@@ -0,0 +1,110 @@
+import time
+
+import pytest
+
+import acceso_firestore
+import firestore_memoria
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    """Firestore en memoria con circuitos nuevos que abren tras 2 fallas y prueban a los 50 ms."""
+    monkeypatch.setattr(acceso_firestore, '_circuitos', {})
+    monkeypatch.setattr(acceso_firestore, 'CIRCUITO_FALLOS', 2)
+    monkeypatch.setattr(acceso_firestore, 'CIRCUITO_ESPERA', 0.05)
+    cliente = firestore_memoria.Cliente(latencia_ms=0)
+    cliente.cargar({'productos': [{'id': 'p1', 'nombre': 'Silla'}]})
+    return cliente
+
+
+def _leer(cliente):
+    return acceso_firestore.llamar('productos', cliente.document('productos/p1').get)
+
+
+def _fallar(cliente, veces):
+    cliente.caido = True
+    for _ in range(veces):
+        with pytest.raises(firestore_memoria.ServiceUnavailable):
+            _leer(cliente)
+
+
+def test_abre_tras_fallas_seguidas_y_no_llama(cliente):
+    _fallar(cliente, 1)
+    assert acceso_firestore.circuito('productos').estado == acceso_firestore.CERRADO
+    _fallar(cliente, 1)
+    assert acceso_firestore.circuito('productos').estado == acceso_firestore.ABIERTO
+    assert not acceso_firestore.disponible('productos')
+
+    llamadas = []
+    with pytest.raises(acceso_firestore.CircuitoAbierto):
+        acceso_firestore.llamar('productos', lambda **_: llamadas.append(1))
+    assert llamadas == []
+    # Cada colección tiene su propio circuito
+    assert acceso_firestore.disponible('usuarios')
+
+
+def test_semiabierto_cierra_si_la_prueba_sale_bien(cliente):
+    _fallar(cliente, 2)
+    cliente.caido = False
+    time.sleep(0.06)
+
+    assert acceso_firestore.disponible('productos')
+    assert _leer(cliente).to_dict()['nombre'] == 'Silla'
+    c = acceso_firestore.circuito('productos')
+    assert (c.estado, c.fallos) == (acceso_firestore.CERRADO, 0)
+
+
+def test_semiabierto_vuelve_a_abrir_si_la_prueba_falla(cliente):
+    _fallar(cliente, 2)
+    time.sleep(0.06)
+
+    _fallar(cliente, 1)
+
+    assert acceso_firestore.circuito('productos').estado == acceso_firestore.ABIERTO
+    assert not acceso_firestore.disponible('productos')
+
+
+def test_semiabierto_deja_pasar_una_sola_prueba(cliente):
+    _fallar(cliente, 2)
+    time.sleep(0.06)
+    c = acceso_firestore.circuito('productos')
+
+    assert c.permitir()
+    assert c.estado == acceso_firestore.SEMIABIERTO
+    assert not c.permitir()
+    assert not acceso_firestore.disponible('productos')
+
+
+def test_plazo_vencido_cuenta_como_falla(cliente, monkeypatch):
+    monkeypatch.setattr(acceso_firestore, 'PLAZO', 0.01)
+    cliente.latencia = 0.05
+
+    with pytest.raises(firestore_memoria.DeadlineExceeded):
+        _leer(cliente)
+
+    assert acceso_firestore.circuito('productos').fallos == 1
+
+
+def test_respuesta_lenta_cuenta_como_falla(cliente, monkeypatch):
+    monkeypatch.setattr(acceso_firestore, 'PLAZO', 0.01)
+
+    def lenta(**_):
+        time.sleep(0.03)
+        return 'ok'
+
+    assert acceso_firestore.llamar('productos', lenta) == 'ok'
+    assert acceso_firestore.circuito('productos').fallos == 1
+
+
+def test_errores_de_la_peticion_no_abren(cliente):
+    for _ in range(3):
+        with pytest.raises(firestore_memoria.NotFound):
+            acceso_firestore.llamar('productos', cliente.document('productos/nada').update, {'precio': 1})
+
+    c = acceso_firestore.circuito('productos')
+    assert (c.estado, c.fallos) == (acceso_firestore.CERRADO, 0)
+
+
+def test_stream_se_lee_dentro_de_la_llamada(cliente):
+    docs = acceso_firestore.llamar('productos', cliente.collection('productos').stream)
+    assert [d.id for d in docs] == ['p1']
@@ -0,0 +1,124 @@
+import pytest
+
+import acceso_firestore
+import almacen_local
+import app
+import cambios_productos
+import diario_offline
+import firestore_memoria
+
+
+@pytest.fixture
+def entorno(tmp_path, monkeypatch):
+    """Firestore en memoria como db de la app, sin catálogo en memoria ni circuitos previos."""
+    monkeypatch.setattr(almacen_local, 'LOCAL_DB', str(tmp_path / 'local.db'))
+    monkeypatch.setattr(almacen_local._local, 'conn', None, raising=False)
+    monkeypatch.setattr(acceso_firestore, '_circuitos', {})
+    monkeypatch.setitem(app._catalogo, 'productos', None)
+    monkeypatch.setattr(diario_offline, '_avisar', lambda: None)
+    cliente = firestore_memoria.Cliente(latencia_ms=0)
+    monkeypatch.setattr(app, 'db', cliente)
+    return cliente
+
+
+def test_pagina_desde_firestore_calcula_promedio_con_proyeccion(entorno):
+    entorno.cargar({'productos': [
+        {'id': 'p1', 'nombre': 'Silla', 'calif_cantidad': 2, 'calif_suma': 9},
+        {'id': 'p2', 'nombre': 'Mesa', 'calificaciones': [4, 2]},
+    ]})
+
+    productos, siguiente = app._pagina_productos(10, '', ['id', 'nombre', 'promedio'])
+
+    assert productos == [{'id': 'p1', 'nombre': 'Silla', 'promedio': 4.5},
+                         {'id': 'p2', 'nombre': 'Mesa', 'promedio': 3.0}]
+    assert siguiente is None
+
+
+def _escribir(db, pid, **datos):
+    db.collection('productos').document(pid).set(cambios_productos.con_marca(dict(datos, id=pid)))
+
+
+def _cambios(token, limite):
+    respuesta = app.app.test_client().get('/api/productos', query_string={'since': token, 'limit': limite})
+    return respuesta.status_code, respuesta.get_json()
+
+
+def test_cambios_paginan_productos_y_bajas(entorno):
+    for pid in ('p1', 'p2', 'p3'):
+        _escribir(entorno, pid, nombre=pid.upper())
+    cambios_productos.eliminar(entorno, 'p2')
+
+    estado, primera = _cambios('', 2)
+    assert estado == 200
+    assert [p['id'] for p in primera['productos']] == ['p1', 'p3']
+    assert (primera['eliminados'], primera['mas']) == ([], True)
+
+    estado, segunda = _cambios(primera['token'], 2)
+    assert (segunda['productos'], segunda['eliminados'], segunda['mas']) == ([], ['p2'], False)
+
+    estado, sin_cambios = _cambios(segunda['token'], 2)
+    assert estado == 200
+    assert (sin_cambios['productos'], sin_cambios['eliminados']) == ([], [])
+    assert sin_cambios['token'] == segunda['token']
+
+
+def test_cambios_ignoran_documentos_sin_marca(entorno):
+    entorno.cargar({'productos': [{'id': 'viejo', 'nombre': 'Sin migrar'},
+                                  {'id': 'nulo', 'nombre': 'Marca nula', cambios_productos.CAMPO: None}]})
+    _escribir(entorno, 'nuevo', nombre='Con marca')
+
+    estado, cuerpo = _cambios('', 10)
+
+    assert estado == 200
+    assert [p['id'] for p in cuerpo['productos']] == ['nuevo']
+
+
+def test_token_invalido_es_400(entorno):
+    estado, cuerpo = _cambios('no-es-un-token', 10)
+    assert estado == 400
+    assert 'error' in cuerpo
+
+
+def _admin():
+    cliente = app.app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['usuario'], sesion['rol'] = 'admin@example.com', 'admin'
+    return cliente
+
+
+def _editar(version, **formulario):
+    datos = dict({'nombre': 'Silla editada', 'precio': '20'}, **formulario, version=version)
+    return _admin().post('/admin/editar/p1', data=datos)
+
+
+def test_edicion_con_update_time_viejo_es_409_sin_escribir(entorno):
+    entorno.cargar({'productos': [{'id': 'p1', 'nombre': 'Silla', 'precio': 10.0}]})
+    _, leida = app._leer_producto_admin('p1')
+    entorno.document('productos/p1').update({'precio': 15.0})
+
+    assert _editar(leida).status_code == 409
+    assert _admin().post('/admin/eliminar/p1', data={'version': leida}).status_code == 409
+
+    remoto = entorno.document('productos/p1').get().to_dict()
+    assert (remoto['nombre'], remoto['precio']) == ('Silla', 15.0)
+    assert not entorno.document(f'{cambios_productos.BORRADOS}/p1').get().exists
+    assert diario_offline.pendientes() == 0
+
+    _, actual = app._leer_producto_admin('p1')
+    assert _editar(actual).status_code == 302
+    assert entorno.document('productos/p1').get().to_dict()['nombre'] == 'Silla editada'
+
+
+def test_edicion_local_con_version_vieja_es_409_sin_escribir(entorno, monkeypatch):
+    monkeypatch.setattr(app, 'db', None)
+    almacen_local.guardar_producto({'id': 'p1', 'nombre': 'Silla', 'precio': 10.0})
+    _, leida = app._leer_producto_admin('p1')
+    almacen_local.guardar_producto({'id': 'p1', 'nombre': 'Silla', 'precio': 15.0})
+
+    assert leida.startswith('local:')
+    assert _editar(leida).status_code == 409
+    assert _admin().post('/admin/eliminar/p1', data={'version': leida}).status_code == 409
+
+    local = almacen_local.obtener_producto('p1')
+    assert (local['nombre'], local['precio']) == ('Silla', 15.0)
+    assert diario_offline.pendientes() == 0
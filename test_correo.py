@@ -0,0 +1,71 @@
+import smtplib
+import socket
+
+import pytest
+
+import correo
+
+
+class _Servidor:
+    """Servidor SMTP falso: cada sendmail toma el siguiente resultado de la lista."""
+
+    def __init__(self, resultados):
+        self.resultados = list(resultados)
+        self.envios = 0
+
+    def sendmail(self, *args):
+        self.envios += 1
+        resultado = self.resultados.pop(0)
+        if isinstance(resultado, Exception):
+            raise resultado
+
+
+class _Conexion:
+    def __init__(self, servidor):
+        self.servidor = servidor
+        self.ultimo_uso = 0.0
+
+    def obtener(self):
+        return self.servidor
+
+    def cerrar(self):
+        pass
+
+
+@pytest.fixture
+def cola(tmp_path, monkeypatch):
+    monkeypatch.setitem(correo.CONFIG, 'cola_db', str(tmp_path / 'cola.db'))
+    monkeypatch.setattr(correo, 'iniciar_despachador', lambda: None)
+    return correo.encolar('ana@example.com', 'Hola', '<p>hola</p>')
+
+
+def _procesar(resultados):
+    servidor = _Servidor(resultados)
+    correo.procesar_pendientes(_Conexion(servidor))
+    return servidor
+
+
+def test_desconexion_se_reintenta_en_el_momento(cola):
+    servidor = _procesar([smtplib.SMTPServerDisconnected('cerrada'), None])
+    assert servidor.envios == 2
+    assert correo.estado(cola)['estado'] == 'enviado'
+
+
+def test_timeout_va_al_backoff_sin_reenviar(cola):
+    servidor = _procesar([socket.timeout('timed out')])
+    fila = correo.estado(cola)
+    assert servidor.envios == 1
+    assert (fila['estado'], fila['intentos']) == ('pendiente', 1)
+
+
+def test_rechazo_5xx_es_definitivo(cola):
+    rechazo = smtplib.SMTPRecipientsRefused({'ana@example.com': (550, b'No such user')})
+    servidor = _procesar([rechazo])
+    assert servidor.envios == 1
+    assert correo.estado(cola)['estado'] == 'fallido'
+
+
+def test_rechazo_4xx_se_reintenta_mas_tarde(cola):
+    servidor = _procesar([smtplib.SMTPDataError(451, b'Try again later')])
+    assert servidor.envios == 1
+    assert correo.estado(cola)['estado'] == 'pendiente'
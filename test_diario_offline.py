@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+import acceso_firestore
+import almacen_local
+import cambios_productos
+import diario_offline
+import firestore_memoria
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    """Almacén local vacío en tmp_path, Firestore en memoria y sin hilo de reenvío."""
+    monkeypatch.setattr(almacen_local, 'LOCAL_DB', str(tmp_path / 'local.db'))
+    monkeypatch.setattr(almacen_local._local, 'conn', None, raising=False)
+    monkeypatch.setattr(acceso_firestore, '_circuitos', {})
+    monkeypatch.setattr(diario_offline, '_avisar', lambda: None)
+    return firestore_memoria.Cliente(latencia_ms=0)
+
+
+def _entradas():
+    return [dict(f) for f in almacen_local._conexion().execute(
+        "SELECT estado, intentos, ultimo_error FROM diario ORDER BY id")]
+
+
+def test_alta_y_edicion_offline_se_suben_al_volver(cliente):
+    silla = {'id': 'p1', 'nombre': 'Silla', 'precio': 10.0}
+    diario_offline.guardar_producto(silla)
+    diario_offline.guardar_producto(dict(silla, precio=12.0), base=silla)
+
+    totales = diario_offline.reenviar(cliente)
+
+    assert totales == {'aplicado': 2, 'conflicto': 0, 'descartado': 0}
+    remoto = cliente.document('productos/p1').get().to_dict()
+    assert (remoto['nombre'], remoto['precio']) == ('Silla', 12.0)
+    assert remoto[cambios_productos.CAMPO] is not None
+    assert diario_offline.pendientes() == 0
+    # Un segundo reenvío no tiene nada que hacer
+    assert diario_offline.reenviar(cliente) == {'aplicado': 0, 'conflicto': 0, 'descartado': 0}
+
+
+def test_edicion_pisada_en_firestore_queda_en_conflicto(cliente):
+    cliente.cargar({'productos': [{'id': 'p1', 'nombre': 'Silla', 'precio': 10.0}]})
+    silla = {'id': 'p1', 'nombre': 'Silla', 'precio': 10.0}
+    diario_offline.guardar_producto(dict(silla, precio=12.0), base=silla)
+    time.sleep(0.01)
+    cliente.document('productos/p1').update({'precio': 15.0})
+
+    totales = diario_offline.reenviar(cliente)
+
+    assert totales['conflicto'] == 1
+    assert cliente.document('productos/p1').get().to_dict()['precio'] == 15.0
+    [entrada] = _entradas()
+    assert entrada['estado'] == 'conflicto'
+    assert 'precio' in entrada['ultimo_error']
+
+
+def test_edicion_de_otro_campo_en_firestore_no_es_conflicto(cliente):
+    cliente.cargar({'productos': [{'id': 'p1', 'nombre': 'Silla', 'precio': 10.0}]})
+    silla = {'id': 'p1', 'nombre': 'Silla', 'precio': 10.0}
+    diario_offline.guardar_producto(dict(silla, precio=12.0), base=silla)
+    time.sleep(0.01)
+    cliente.document('productos/p1').update({'nombre': 'Silla alta'})
+
+    assert diario_offline.reenviar(cliente)['aplicado'] == 1
+    remoto = cliente.document('productos/p1').get().to_dict()
+    assert (remoto['nombre'], remoto['precio']) == ('Silla alta', 12.0)
+
+
+def test_alta_y_baja_offline_se_descartan(cliente):
+    diario_offline.guardar_producto({'id': 'p1', 'nombre': 'Silla'})
+    diario_offline.eliminar_producto('p1')
+
+    assert diario_offline.reenviar(cliente) == {'aplicado': 0, 'conflicto': 0, 'descartado': 2}
+    assert not cliente.document('productos/p1').get().exists
+    assert not cliente.document(f'{cambios_productos.BORRADOS}/p1').get().exists
+
+
+def test_reenvio_fallido_suma_un_intento_y_sigue_pendiente(cliente):
+    diario_offline.guardar_producto({'id': 'p1', 'nombre': 'Silla'})
+    cliente.caido = True
+
+    with pytest.raises(firestore_memoria.ServiceUnavailable):
+        diario_offline.reenviar(cliente)
+
+    [entrada] = _entradas()
+    assert (entrada['estado'], entrada['intentos']) == ('pendiente', 1)
+    assert 'ServiceUnavailable' in entrada['ultimo_error']
+
+    cliente.caido = False
+    assert diario_offline.reenviar(cliente)['aplicado'] == 1
+    assert _entradas()[0]['estado'] == 'aplicado'
@@ -0,0 +1,47 @@
+import copy
+import struct
+
+import pytest
+
+import glb
+
+
+def _triangulo(**extra):
+    """GLB mínimo: un triángulo en una escena, más los campos de `extra` en el JSON."""
+    posiciones = struct.pack('<9f', 0, 0, 0, 1, 0, 0, 0, 1, 0)
+    gltf = {
+        'asset': {'version': '2.0'},
+        'buffers': [{'byteLength': len(posiciones)}],
+        'bufferViews': [{'buffer': 0, 'byteOffset': 0, 'byteLength': len(posiciones)}],
+        'accessors': [{'bufferView': 0, 'componentType': 5126, 'count': 3, 'type': 'VEC3',
+                       'min': [0, 0, 0], 'max': [1, 1, 0]}],
+        'meshes': [{'primitives': [{'attributes': {'POSITION': 0}}]}],
+        'nodes': [{'mesh': 0}],
+        'scenes': [{'nodes': [0]}],
+        'scene': 0,
+    }
+    gltf.update(copy.deepcopy(extra))
+    return glb.escribir_glb(gltf, posiciones)
+
+
+def test_triangulo_valido():
+    _, info = glb.procesar_glb(_triangulo())
+    assert info['medidas'] == {'frente': 100.0, 'fondo': 0.0, 'altura': 100.0}
+
+
+@pytest.mark.parametrize('extra', [
+    {'images': [{'bufferView': 7, 'mimeType': 'image/png'}]},
+    {'images': [5]},
+    {'accessors': [{'bufferView': 0, 'componentType': 5126, 'count': 3, 'type': 'VEC3',
+                    'sparse': {'count': 1, 'indices': {'bufferView': 9, 'componentType': 5125},
+                               'values': {'bufferView': 0}}}]},
+    {'animations': [{'samplers': [{'input': 4, 'output': 0}],
+                     'channels': [{'sampler': 0, 'target': {'node': 0, 'path': 'translation'}}]}]},
+    {'animations': [{'samplers': [{'input': 0, 'output': 0}],
+                     'channels': [{'sampler': 3, 'target': {'node': 0, 'path': 'translation'}}]}]},
+    {'skins': [{'joints': [8]}]},
+    {'bufferViews': {'0': 'no es una lista'}},
+])
+def test_indices_fuera_de_rango_son_modelo_invalido(extra):
+    with pytest.raises(glb.ModeloInvalido):
+        glb.procesar_glb(_triangulo(**extra), cuantizar=True)
@@ -0,0 +1,51 @@
+import pytest
+
+import almacen_local
+import firestore_memoria
+import sync
+
+
+@pytest.fixture
+def entorno(tmp_path, monkeypatch):
+    """Almacén local vacío en tmp_path y Firestore en memoria como destino del push."""
+    monkeypatch.setattr(almacen_local, 'LOCAL_DB', str(tmp_path / 'local.db'))
+    monkeypatch.setattr(almacen_local._local, 'conn', None, raising=False)
+    almacen_local.reemplazar_productos([])
+    cliente = firestore_memoria.Cliente(latencia_ms=0)
+    monkeypatch.setattr(sync, 'db', cliente)
+    return cliente
+
+
+def test_push_despues_de_migrar_calificaciones_no_duplica(entorno):
+    # Local todavía tiene el arreglo viejo; Firestore ya tiene los contadores migrados
+    almacen_local.reemplazar_productos([
+        {'id': 'p1', 'nombre': 'Silla', 'precio': 10.0, 'calificaciones': [5, 3]},
+    ])
+    entorno.cargar({'productos': [
+        {'id': 'p1', 'nombre': 'Silla', 'precio': 10.0,
+         'calif_cantidad': 2, 'calif_suma': 8, 'calif_estrellas': {'5': 1, '3': 1}},
+    ]})
+
+    sync.sync_productos('push')
+    segundo = sync.sync_productos('push')
+
+    remoto = entorno.document('productos/p1').get().to_dict()
+    assert 'calificaciones' not in remoto
+    assert (remoto['calif_cantidad'], remoto['calif_suma']) == (2, 8)
+    assert segundo['sin_cambios'] == ['p1']
+
+
+def test_push_no_pisa_contadores_remotos(entorno):
+    almacen_local.reemplazar_productos([
+        {'id': 'p1', 'nombre': 'Mesa', 'precio': 20.0, 'calif_cantidad': 1, 'calif_suma': 4},
+    ])
+    entorno.cargar({'productos': [
+        {'id': 'p1', 'nombre': 'Mesa vieja', 'precio': 20.0, 'calif_cantidad': 3, 'calif_suma': 12},
+    ]})
+
+    plan = sync.sync_productos('push')
+
+    remoto = entorno.document('productos/p1').get().to_dict()
+    assert plan['actualizados'] == ['p1']
+    assert remoto['nombre'] == 'Mesa'
+    assert (remoto['calif_cantidad'], remoto['calif_suma']) == (3, 12)